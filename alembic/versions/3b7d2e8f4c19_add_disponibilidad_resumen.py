@@ -0,0 +1,52 @@
+"""add disponibilidad_resumen (minutos libres por empleado/día/bucket)
+
+Revision ID: 3b7d2e8f4c19
+Revises: 9e4f1c2a7b65
+Create Date: 2025-08-04 09:15:32.671204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b7d2e8f4c19'
+down_revision: Union[str, Sequence[str], None] = '9e4f1c2a7b65'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'disponibilidad_resumen',
+        sa.Column('empleado_id', sa.Integer(), nullable=False),
+        sa.Column('fecha', sa.Date(), nullable=False),
+        sa.Column('duracion_bucket', sa.Integer(), nullable=False),
+        sa.Column('minutos_libres', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(
+            ['empleado_id'], ['personal_oliva.id'],
+            name=op.f('fk_disponibilidad_resumen_empleado_id_personal_oliva'),
+        ),
+        sa.PrimaryKeyConstraint(
+            'empleado_id', 'fecha', 'duracion_bucket', name=op.f('pk_disponibilidad_resumen')
+        ),
+    )
+    op.create_index(
+        'ix_disponibilidad_resumen_bucket_fecha',
+        'disponibilidad_resumen',
+        ['duracion_bucket', 'fecha', 'minutos_libres'],
+        unique=False,
+    )
+    # Se llena sola al primer render del teclado (o con
+    # ``python -m core.disponibilidad_resumen``).
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_disponibilidad_resumen_bucket_fecha', table_name='disponibilidad_resumen')
+    op.drop_table('disponibilidad_resumen')
@@ -0,0 +1,84 @@
+"""add duracion_min / hora_fin to Cita + composite index
+
+Revision ID: 5c2e7b9d1a43
+Revises: f8a687d74d40
+Create Date: 2025-08-02 18:40:11.204518
+
+"""
+from datetime import date, datetime, time, timedelta
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c2e7b9d1a43'
+down_revision: Union[str, Sequence[str], None] = 'f8a687d74d40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+DURACION_DEFAULT_MIN = 60
+BATCH = 1000
+
+
+def _fin(hora: time, duracion: int) -> time:
+    fin = datetime.combine(date.min, hora) + timedelta(minutes=duracion)
+    return fin.time() if fin.date() == date.min else time.max
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('citas', sa.Column('duracion_min', sa.Integer(), nullable=True))
+    op.add_column('citas', sa.Column('hora_fin', sa.Time(), nullable=True))
+
+    # Backfill: cada cita histórica toma la duración de SU servicio
+    conn = op.get_bind()
+    citas = sa.table(
+        'citas',
+        sa.column('id', sa.Integer), sa.column('hora', sa.Time),
+        sa.column('servicio_id', sa.Integer),
+        sa.column('duracion_min', sa.Integer), sa.column('hora_fin', sa.Time),
+    )
+    servicios = sa.table(
+        'servicios_oliva',
+        sa.column('id', sa.Integer),
+        sa.column('duracion_min', sa.Integer), sa.column('duracion_max', sa.Integer),
+    )
+    stmt = (
+        citas.update()
+        .where(citas.c.id == sa.bindparam('b_id'))
+        .values(duracion_min=sa.bindparam('b_dur'), hora_fin=sa.bindparam('b_fin'))
+    )
+    ultimo = 0
+    while True:     # paginado por id: no carga años de historial de golpe
+        rows = conn.execute(
+            sa.select(citas.c.id, citas.c.hora, servicios.c.duracion_max, servicios.c.duracion_min)
+            .select_from(citas.outerjoin(servicios, citas.c.servicio_id == servicios.c.id))
+            .where(citas.c.id > ultimo)
+            .order_by(citas.c.id)
+            .limit(BATCH)
+        ).all()
+        if not rows:
+            break
+        lote = []
+        for cita_id, hora, dmax, dmin in rows:
+            dur = dmax or dmin or DURACION_DEFAULT_MIN
+            lote.append({'b_id': cita_id, 'b_dur': dur, 'b_fin': _fin(hora, dur)})
+        conn.execute(stmt, lote)
+        ultimo = rows[-1][0]
+
+    with op.batch_alter_table('citas') as batch_op:
+        batch_op.alter_column('duracion_min', existing_type=sa.Integer(), nullable=False)
+        batch_op.alter_column('hora_fin', existing_type=sa.Time(), nullable=False)
+        batch_op.create_index(
+            'ix_citas_empleado_fecha_hora', ['empleado_id', 'fecha', 'hora'], unique=False
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('citas') as batch_op:
+        batch_op.drop_index('ix_citas_empleado_fecha_hora')
+        batch_op.drop_column('hora_fin')
+        batch_op.drop_column('duracion_min')
@@ -0,0 +1,40 @@
+"""add agenda_bloqueos (fila-candado por empleado/día)
+
+Revision ID: 9e4f1c2a7b65
+Revises: 5c2e7b9d1a43
+Create Date: 2025-08-03 11:02:47.518830
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9e4f1c2a7b65'
+down_revision: Union[str, Sequence[str], None] = '5c2e7b9d1a43'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'agenda_bloqueos',
+        sa.Column('empleado_id', sa.Integer(), nullable=False),
+        sa.Column('fecha', sa.Date(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(
+            ['empleado_id'], ['personal_oliva.id'],
+            name=op.f('fk_agenda_bloqueos_empleado_id_personal_oliva'),
+        ),
+        sa.PrimaryKeyConstraint('empleado_id', 'fecha', name=op.f('pk_agenda_bloqueos')),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('agenda_bloqueos')
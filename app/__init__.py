@@ -1,9 +1,15 @@
 from flask import Flask
 from app.telegram_webhook import bp as telegram_bp
 from app.twilio_webhook import bp as twilio_bp
+from core.model_registry import registro
+from core.embeddings import indice_catalogo
 
 def create_app():
     app = Flask(__name__)
     app.register_blueprint(telegram_bp)
     app.register_blueprint(twilio_bp)
+    # Modelos pkl validados al arrancar (con preload, los workers comparten el mmap)
+    registro.cargar_todo()
+    # Índice semántico del catálogo (mmap; lo construyen scripts/import_*.py)
+    indice_catalogo.cargar()
     return app
@@ -23,10 +23,10 @@ def confirmacion_cita_inline(cita_id: int):
     ]
     return InlineKeyboardMarkup(keyboard)
 
-def categorias_servicio_keyboard(servicios):
+def categorias_servicio_keyboard(servicios, prefijo="cat_"):
     """Botones únicos por categoría de servicio"""
     categorias = sorted(set(s['Categoria'] for s in servicios if s['Categoria']))
-    keyboard = [[InlineKeyboardButton(cat, callback_data=f"cat_{cat}")] for cat in categorias]
+    keyboard = [[InlineKeyboardButton(cat, callback_data=f"{prefijo}{cat}")] for cat in categorias]
     return InlineKeyboardMarkup(keyboard)
 
 def servicios_por_categoria_keyboard(servicios, categoria):
@@ -38,6 +38,29 @@ def servicios_por_categoria_keyboard(servicios, categoria):
     ]
     return InlineKeyboardMarkup(keyboard)
 
+def servicios_agendar_keyboard(servicios, categoria):
+    """Botones por servicio de una categoría para iniciar una reserva"""
+    filtrados = [s for s in servicios if s['Categoria'] == categoria]
+    keyboard = [
+        [InlineKeyboardButton(s['Nombre'], callback_data=f"agserv_{s['Id']}")]
+        for s in filtrados
+    ]
+    return InlineKeyboardMarkup(keyboard)
+
+DIAS_SEMANA = ["Lun", "Mar", "Mié", "Jue", "Vie", "Sáb", "Dom"]
+
+def fechas_disponibles_keyboard(fechas, servicio_id, por_fila=4):
+    """Selector de fechas: sólo días con hueco (ver core.disponibilidad_resumen)"""
+    botones = [
+        InlineKeyboardButton(
+            f"{DIAS_SEMANA[f.weekday()]} {f.day:02d}/{f.month:02d}",
+            callback_data=f"agfecha_{servicio_id}_{f.isoformat()}",
+        )
+        for f in fechas
+    ]
+    keyboard = [botones[i:i + por_fila] for i in range(0, len(botones), por_fila)]
+    return InlineKeyboardMarkup(keyboard)
+
 # ───────────────────────────────
 # REPLY KEYBOARDS
 # ───────────────────────────────
@@ -6,9 +6,18 @@ from .keyboards import (
     telefono_reply,
     categorias_servicio_keyboard,
     servicios_por_categoria_keyboard,
+    servicios_agendar_keyboard,
+    fechas_disponibles_keyboard,
 )
 from core.customers import crear_cliente_si_no_existe
 from core.functions import cargar_servicios  # Debes tener esta función en core/
+from core.agenda_index import duracion_servicio
+from core.disponibilidad_resumen import dias_con_capacidad
+from core.message_predictor import predict_message
+from core.scheduler import next_free_slots_any
+from db.models import Servicio
+from db.session import get_session
+from datetime import date
 import os
 
 bp = Blueprint('webhook', __name__)
@@ -40,12 +49,46 @@ def start(update, context):
         reply_markup=main_menu_inline()
     )
 
+def _ofrecer_fechas(context, chat_id, servicio_id):
+    """Envía el selector de fechas con hueco para el servicio."""
+    # Días con hueco: una lectura del resumen materializado. Lo que se use del
+    # servicio se lee dentro del bloque: al cerrar la sesión queda expirado.
+    with get_session() as db:
+        servicio = db.get(Servicio, servicio_id)
+        if servicio is None:
+            nombre, fechas = None, []
+        else:
+            nombre = servicio.nombre
+            duracion = duracion_servicio(servicio.duracion_max, servicio.duracion_min)
+            fechas = dias_con_capacidad(db, duracion, date.today(), dias=30)
+    if nombre is None:
+        context.bot.send_message(chat_id=chat_id, text="Servicio no encontrado.")
+    elif fechas:
+        context.bot.send_message(
+            chat_id=chat_id,
+            text=f"Elige una fecha para *{nombre}*:",
+            reply_markup=fechas_disponibles_keyboard(fechas, servicio_id),
+            parse_mode="Markdown"
+        )
+    else:
+        context.bot.send_message(chat_id=chat_id, text="No hay fechas disponibles en los próximos 30 días.")
+
 def handle_text(update, context):
     """Manejador de mensajes de texto"""
     text = update.message.text
     chat_id = update.effective_chat.id
+    # Intención + servicio probable en una sola pasada
+    pred = predict_message(text, SERVICIOS)
 
-    if "servicio" in text.lower():
+    if pred.intent == "agendar_cita" and pred.servicio_id is not None:
+        _ofrecer_fechas(context, chat_id, pred.servicio_id)
+    elif pred.intent == "agendar_cita":
+        context.bot.send_message(
+            chat_id=chat_id,
+            text="¿Cuál servicio deseas agendar?",
+            reply_markup=categorias_servicio_keyboard(SERVICIOS, prefijo="agcat_")
+        )
+    elif pred.intent == "listar_servicios" or "servicio" in text.lower():
         context.bot.send_message(
             chat_id=chat_id,
             text="Aquí están nuestras categorías:",
@@ -100,8 +143,32 @@ def handle_callback(update, context):
             context.bot.send_message(chat_id=chat_id, text="Servicio no encontrado.")
 
     elif data == "agendar_cita":
-        context.bot.send_message(chat_id=chat_id, text="¿Cuál servicio deseas agendar?")
-        # Aquí más adelante se integrará flujo para agendar
+        context.bot.send_message(
+            chat_id=chat_id,
+            text="¿Cuál servicio deseas agendar?",
+            reply_markup=categorias_servicio_keyboard(SERVICIOS, prefijo="agcat_")
+        )
+
+    elif data.startswith("agcat_"):
+        categoria = data[6:]
+        context.bot.send_message(
+            chat_id=chat_id,
+            text=f"Servicios de *{categoria}*:",
+            reply_markup=servicios_agendar_keyboard(SERVICIOS, categoria),
+            parse_mode="Markdown"
+        )
+
+    elif data.startswith("agserv_"):
+        _ofrecer_fechas(context, chat_id, int(data[7:]))
+
+    elif data.startswith("agfecha_"):
+        _, servicio_id, fecha = data.split("_", 2)
+        with get_session() as db:
+            slots = next_free_slots_any(
+                db, date.fromisoformat(fecha), None, int(servicio_id), n=6, dias=1
+            )
+        horas = ", ".join(s["inicio"][11:16] for s in slots) or "sin horarios"
+        context.bot.send_message(chat_id=chat_id, text=f"Horarios disponibles el {fecha}: {horas}")
 
     else:
         context.bot.send_message(chat_id=chat_id, text=f"Elegiste: {data}")
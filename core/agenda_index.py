@@ -0,0 +1,425 @@
+# core/agenda_index.py
+"""Índice en memoria de intervalos ocupados por (empleado_id, fecha).
+
+👀 Responsabilidades:
+    - Cargar **una sola vez** las citas de un empleado/día y guardarlas como
+      intervalos ordenados (minutos desde medianoche).
+    - Resolver solapamientos con ``bisect`` en O(log n) sin ir a la BD.
+    - Mantenerse al día con las escrituras del propio proceso (eventos ORM
+      sobre ``Cita``: insert / update / delete) aplicadas **al hacer commit**.
+    - Detectar escrituras de *otros* procesos con una firma barata
+      ``(COUNT(id), MAX(updated_at))`` consultada como máximo cada
+      ``AGENDA_PROBE_SECONDS``; si no coincide con la esperada se invalida.
+
+Nota:
+    - El índice sólo contiene datos confirmados. Los cambios aún sin commit de
+      una sesión se superponen (*overlay*) únicamente para esa sesión.
+    - Se indexa por *bind* (engine / connection) con referencias débiles, así
+      cada base de datos (producción, SQLite de pruebas) tiene su propio índice.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time as _time
+import weakref
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import Session, object_session
+
+from db.models import DURACION_DEFAULT_MIN, Cita
+
+# ───────────────────────── Configuración ──────────────────────────
+PROBE_SECONDS    = float(os.getenv("AGENDA_PROBE_SECONDS", "2"))
+DURACION_DEFAULT = DURACION_DEFAULT_MIN   # min, si el servicio no trae duración
+
+_PENDIENTES = "agenda_pendientes"   # clave en ``Session.info``
+_DUDOSAS    = "agenda_dudosas"      # claves tocadas por un savepoint revertido
+_DELTAS     = "agenda_deltas"       # (±filas, updated_at) para la firma esperada
+
+Clave = Tuple[int, date]            # (empleado_id, fecha)
+Op    = Tuple[str, Clave, int, int, int]   # (tipo, clave, cita_id, ini, fin)
+
+__all__ = ["AgendaIndex", "DiaAgenda", "agenda_index", "minutos"]
+
+
+def minutos(h: time) -> int:
+    """``time`` → minutos desde medianoche."""
+    return h.hour * 60 + h.minute
+
+
+def duracion_servicio(dur_max: Optional[int], dur_min: Optional[int]) -> int:
+    """Duración efectiva de un servicio (máxima, luego mínima, luego default)."""
+    return dur_max or dur_min or DURACION_DEFAULT
+
+
+def _intervalo_cita(hora: time, hora_fin: time) -> Tuple[int, int]:
+    """Intervalo en minutos de una cita con su propio ``hora_fin`` persistido."""
+    ini = minutos(hora)
+    fin = 24 * 60 if hora_fin == time.max else minutos(hora_fin)
+    return ini, max(fin, ini)
+
+# ───────────────────────── Estructura por día ─────────────────────
+
+@dataclass
+class DiaAgenda:
+    """Intervalos ``[ini, fin)`` de un empleado en un día, ordenados por inicio.
+
+    ``max_fin[i]`` es el máximo de ``fines[:i+1]``; con él basta un ``bisect``
+    para saber si algún intervalo que empieza antes de *fin* termina después
+    de *ini*, aun si hubiera citas heredadas que se solapan entre sí.
+    """
+    inicios: List[int] = field(default_factory=list)
+    fines:   List[int] = field(default_factory=list)
+    ids:     List[int] = field(default_factory=list)
+    max_fin: List[int] = field(default_factory=list)
+
+    def _recalcular(self, desde: int) -> None:
+        previo = self.max_fin[desde - 1] if desde > 0 else -1
+        for i in range(desde, len(self.fines)):
+            previo = max(previo, self.fines[i])
+            self.max_fin[i] = previo
+
+    def agregar(self, cita_id: int, ini: int, fin: int) -> None:
+        """Inserta (o reemplaza) el intervalo de *cita_id*."""
+        self.quitar(cita_id)
+        i = bisect_left(self.inicios, ini)
+        self.inicios.insert(i, ini)
+        self.fines.insert(i, fin)
+        self.ids.insert(i, cita_id)
+        self.max_fin.insert(i, fin)
+        self._recalcular(i)
+
+    def quitar(self, cita_id: int) -> None:
+        try:
+            i = self.ids.index(cita_id)
+        except ValueError:
+            return
+        for lista in (self.inicios, self.fines, self.ids, self.max_fin):
+            del lista[i]
+        self._recalcular(i)
+
+    def solapa(self, ini: int, fin: int) -> bool:
+        """True si ``[ini, fin)`` choca con algún intervalo guardado."""
+        k = bisect_left(self.inicios, fin)       # intervalos con inicio < fin
+        return k > 0 and self.max_fin[k - 1] > ini
+
+    def intervalos(self) -> List[Tuple[int, int]]:
+        return list(zip(self.inicios, self.fines))
+
+    def copia(self) -> "DiaAgenda":
+        return DiaAgenda(
+            list(self.inicios), list(self.fines), list(self.ids), list(self.max_fin)
+        )
+
+
+@dataclass
+class _EstadoBind:
+    dias: Dict[Clave, DiaAgenda] = field(default_factory=dict)
+    firma: Optional[Tuple[int, Any]] = None      # esperada tras nuestros commits
+    ultimo_probe: float = float("-inf")
+    generacion: int = 0                          # sube con cada cambio aplicado
+
+# ───────────────────────── Índice global ──────────────────────────
+
+class AgendaIndex:
+    """Caché de agenda compartida por todas las sesiones del proceso.
+
+    Las consultas a la BD se hacen **fuera** del candado; ``generacion`` evita
+    guardar una lectura que quedó vieja mientras otro hilo aplicaba cambios.
+    """
+
+    def __init__(self, probe_seconds: float = PROBE_SECONDS) -> None:
+        self.probe_seconds = probe_seconds
+        self._lock = threading.RLock()
+        self._por_bind: "weakref.WeakKeyDictionary[Any, _EstadoBind]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    # ---------- helpers ----------
+    @staticmethod
+    def _bind(db: Session) -> Any:
+        return db.get_bind(Cita)
+
+    def _estado(self, bind: Any) -> _EstadoBind:
+        estado = self._por_bind.get(bind)
+        if estado is None:
+            estado = self._por_bind[bind] = _EstadoBind()
+        return estado
+
+    @staticmethod
+    def _firma(db: Session) -> Tuple[int, Any]:
+        row = db.execute(select(func.count(Cita.id), func.max(Cita.updated_at))).one()
+        return int(row[0]), row[1]
+
+    @staticmethod
+    def _consultar_dia(db: Session, empleado_id: int, fecha: date) -> DiaAgenda:
+        rows = db.execute(
+            select(Cita.id, Cita.hora, Cita.hora_fin)
+            .where(Cita.empleado_id == empleado_id, Cita.fecha == fecha)
+        ).all()
+        dia = DiaAgenda()
+        for cita_id, hora, hora_fin in rows:
+            dia.agregar(cita_id, *_intervalo_cita(hora, hora_fin))
+        return dia
+
+    @staticmethod
+    def _consultar_rango(
+        db: Session, empleado_ids: Sequence[int], desde: date, hasta: date
+    ) -> Dict[Clave, DiaAgenda]:
+        rows = db.execute(
+            select(Cita.id, Cita.empleado_id, Cita.fecha, Cita.hora, Cita.hora_fin)
+            .where(
+                Cita.empleado_id.in_(empleado_ids),
+                Cita.fecha.between(desde, hasta),
+            )
+        ).all()
+        dias: Dict[Clave, DiaAgenda] = {}
+        for cita_id, emp, fecha, hora, hora_fin in rows:
+            dias.setdefault((emp, fecha), DiaAgenda()).agregar(
+                cita_id, *_intervalo_cita(hora, hora_fin)
+            )
+        return dias
+
+    def _verificar(self, db: Session, bind: Any) -> None:
+        """Invalida el índice si otro proceso escribió en ``citas``."""
+        ahora = _time.monotonic()
+        with self._lock:
+            estado = self._estado(bind)
+            if ahora - estado.ultimo_probe < self.probe_seconds:
+                return
+            estado.ultimo_probe = ahora
+        firma = self._firma(db)
+        with self._lock:
+            if estado.firma is not None and firma != estado.firma:
+                estado.dias.clear()
+                estado.generacion += 1
+            estado.firma = firma
+
+    def _base(self, db: Session, clave: Clave, sucia: bool) -> Tuple[DiaAgenda, bool]:
+        """Devuelve ``(día, compartido)``; compartido ⇒ leer bajo el candado."""
+        bind = self._bind(db)
+        if not sucia:
+            self._verificar(db, bind)
+        with self._lock:
+            estado = self._estado(bind)
+            base = estado.dias.get(clave)
+            generacion = estado.generacion
+        if base is not None:
+            return base, True
+        base = self._consultar_dia(db, *clave)
+        if sucia:
+            return base, False            # ya incluye lo propio (flush)
+        with self._lock:
+            if estado.generacion == generacion:
+                base = estado.dias.setdefault(clave, base)
+                return base, True
+        return base, False
+
+    # ---------- API ----------
+    def dia(self, db: Session, empleado_id: int, fecha: date) -> DiaAgenda:
+        """Copia de los intervalos ocupados de *empleado_id* en *fecha* vistos por *db*.
+
+        Si la sesión tiene escrituras de ``Cita`` sin confirmar, no se consulta
+        la firma ni se cachean lecturas (verían datos sin commit); se usa el
+        índice confirmado + el *overlay* de la sesión.
+        """
+        clave: Clave = (empleado_id, fecha)
+        pendientes: List[Op] = db.info.get(_PENDIENTES, [])
+        base, compartido = self._base(db, clave, sucia=bool(pendientes))
+        if not compartido:
+            return base
+        with self._lock:
+            dia = base.copia()
+        for tipo, op_clave, cita_id, ini, fin in pendientes:
+            if op_clave != clave:
+                continue
+            if tipo == "add":
+                dia.agregar(cita_id, ini, fin)
+            else:
+                dia.quitar(cita_id)
+        return dia
+
+    def hay_solape(
+        self, db: Session, empleado_id: int, fecha: date, ini: int, fin: int
+    ) -> bool:
+        """True si ``[ini, fin)`` (minutos) choca con una cita existente."""
+        clave: Clave = (empleado_id, fecha)
+        pendientes: List[Op] = db.info.get(_PENDIENTES, [])
+        if any(op[1] == clave for op in pendientes):
+            return self.dia(db, empleado_id, fecha).solapa(ini, fin)
+        base, compartido = self._base(db, clave, sucia=bool(pendientes))
+        if not compartido:
+            return base.solapa(ini, fin)
+        with self._lock:
+            return base.solapa(ini, fin)
+
+    def dias_rango(
+        self, db: Session, empleado_ids: Sequence[int], desde: date, hasta: date
+    ) -> Dict[Clave, DiaAgenda]:
+        """Copias de todos los días ``desde..hasta`` de *empleado_ids*.
+
+        Los días que falten en el índice se cargan con **una** consulta
+        (``empleado_id IN … AND fecha BETWEEN …``) y se cachean, incluidos los
+        días vacíos.
+        """
+        pendientes: List[Op] = db.info.get(_PENDIENTES, [])
+        sucia = bool(pendientes)
+        bind = self._bind(db)
+        if not sucia:
+            self._verificar(db, bind)
+        claves = [
+            (emp, desde + timedelta(days=i))
+            for emp in empleado_ids
+            for i in range((hasta - desde).days + 1)
+        ]
+        with self._lock:
+            estado = self._estado(bind)
+            generacion = estado.generacion
+            out = {c: estado.dias[c].copia() for c in claves if c in estado.dias}
+        faltan = [c for c in claves if c not in out]
+        if faltan:
+            cargados = self._consultar_rango(
+                db, sorted({c[0] for c in faltan}),
+                min(c[1] for c in faltan), max(c[1] for c in faltan),
+            )
+            nuevos = {c: cargados.get(c, DiaAgenda()) for c in faltan}
+            if not sucia:
+                with self._lock:
+                    if estado.generacion == generacion:
+                        for c, dia in nuevos.items():
+                            estado.dias.setdefault(c, dia.copia())
+            out.update(nuevos)
+        for tipo, clave, cita_id, ini, fin in pendientes:
+            dia = out.get(clave)
+            if dia is None or (sucia and clave in faltan):
+                continue              # ausente o leído ya con lo propio
+            if tipo == "add":
+                dia.agregar(cita_id, ini, fin)
+            else:
+                dia.quitar(cita_id)
+        return out
+
+    def invalidar(self, bind: Any = None) -> None:
+        """Vacía el índice de *bind* (o de todos si es ``None``)."""
+        with self._lock:
+            estados = list(self._por_bind.values()) if bind is None else [
+                self._estado(bind)
+            ]
+            for estado in estados:
+                estado.dias.clear()
+                estado.firma = None
+                estado.generacion += 1
+
+    def desalojar(self, db: Session, claves: Iterable[Clave]) -> None:
+        """Olvida días concretos (p. ej. tras perder una carrera al reservar)."""
+        with self._lock:
+            estado = self._estado(self._bind(db))
+            estado.generacion += 1
+            for clave in claves:
+                estado.dias.pop(clave, None)
+
+    def aplicar(self, bind: Any, ops: Iterable[Op], dudosas: Iterable[Clave] = ()) -> None:
+        """Aplica en sitio las operaciones ya confirmadas de una sesión."""
+        with self._lock:
+            estado = self._estado(bind)
+            estado.generacion += 1
+            for tipo, clave, cita_id, ini, fin in ops:
+                dia = estado.dias.get(clave)
+                if dia is None:
+                    continue            # no cargado → se leerá de la BD
+                if tipo == "add":
+                    dia.agregar(cita_id, ini, fin)
+                else:
+                    dia.quitar(cita_id)
+            for clave in dudosas:
+                estado.dias.pop(clave, None)
+
+    def ajustar_firma(self, bind: Any, delta: int, updated_at: Optional[datetime]) -> None:
+        """Actualiza la firma esperada tras un commit propio."""
+        with self._lock:
+            estado = self._estado(bind)
+            if estado.firma is None:
+                return
+            total, maximo = estado.firma
+            if updated_at is not None and maximo is not None:
+                if maximo.tzinfo is not None and updated_at.tzinfo is None:
+                    updated_at = updated_at.replace(tzinfo=timezone.utc)
+            if updated_at is not None and (maximo is None or updated_at > maximo):
+                maximo = updated_at
+            estado.firma = (total + delta, maximo)
+
+
+agenda_index = AgendaIndex()
+
+# ───────────────────────── Eventos ORM ────────────────────────────
+
+def _registrar(target: Cita, *ops: Op) -> None:
+    sess = object_session(target)
+    if sess is None:
+        return
+    sess.info.setdefault(_PENDIENTES, []).extend(ops)
+    sess.info.setdefault(_DELTAS, []).append(
+        (sum(1 if o[0] == "add" else -1 for o in ops), target.updated_at)
+    )
+
+
+@event.listens_for(Cita, "after_insert")
+def _cita_insertada(_mapper, _connection, target: Cita) -> None:
+    ini, fin = _intervalo_cita(target.hora, target.hora_fin)
+    _registrar(target, ("add", (target.empleado_id, target.fecha), target.id, ini, fin))
+
+
+@event.listens_for(Cita, "after_update")
+def _cita_actualizada(_mapper, _connection, target: Cita) -> None:
+    attrs = inspect(target).attrs
+
+    def _anterior(nombre: str) -> Any:
+        hist = attrs[nombre].history
+        return hist.deleted[0] if hist.deleted else getattr(target, nombre)
+
+    vieja: Clave = (_anterior("empleado_id"), _anterior("fecha"))
+    ini, fin = _intervalo_cita(target.hora, target.hora_fin)
+    _registrar(
+        target,
+        ("del", vieja, target.id, 0, 0),
+        ("add", (target.empleado_id, target.fecha), target.id, ini, fin),
+    )
+
+
+@event.listens_for(Cita, "after_delete")
+def _cita_borrada(_mapper, _connection, target: Cita) -> None:
+    _registrar(target, ("del", (target.empleado_id, target.fecha), target.id, 0, 0))
+
+
+@event.listens_for(Session, "after_commit")
+def _al_commit(session: Session) -> None:
+    ops: List[Op] = session.info.pop(_PENDIENTES, [])
+    dudosas = session.info.pop(_DUDOSAS, set())
+    deltas = session.info.pop(_DELTAS, [])
+    if not ops and not dudosas:
+        return
+    bind = session.get_bind(Cita)
+    agenda_index.aplicar(bind, ops, dudosas)
+    for delta, updated_at in deltas:
+        agenda_index.ajustar_firma(bind, delta, updated_at)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _al_rollback(session: Session, previous_transaction: Any) -> None:
+    if previous_transaction.nested:
+        # Savepoint revertido: no sabemos qué ops sobrevivieron → se desalojan
+        ops: List[Op] = session.info.get(_PENDIENTES, [])
+        session.info.setdefault(_DUDOSAS, set()).update(op[1] for op in ops)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _al_terminar(session: Session, transaction: Any) -> None:
+    # Rollback / close de la transacción raíz: lo pendiente nunca se confirmó
+    if transaction.parent is None and not transaction.nested:
+        for clave in (_PENDIENTES, _DUDOSAS, _DELTAS):
+            session.info.pop(clave, None)
@@ -0,0 +1,102 @@
+# core/agenda_locks.py
+"""Sección crítica por (empleado_id, fecha) para reservar sin doble booking.
+
+``book_slot`` es *check‑then‑insert*: dos webhooks concurrentes pueden ver el
+mismo hueco libre e insertar citas que se solapan (10:00 y 10:15 no chocan con
+``uq_empleado_slot``). Aquí se serializa cada agenda en dos niveles:
+
+1. **Proceso** – candados *striped* (``threading.Lock``) indexados por
+   ``hash((empleado_id, fecha))``; evitan que hilos del mismo worker compitan
+   en la BD.
+2. **BD** – ``UPDATE agenda_bloqueos SET version = version + 1`` sobre la
+   fila‑candado del día; el motor retiene el *row lock* hasta el commit, así
+   que otros procesos esperan su turno.
+
+Uso:
+    with agenda_exclusiva(db, [(empleado_id, fecha)]):
+        cita = book_slot(db, ...)
+        db.commit()
+
+Las filas de días ya pasados no vuelven a bloquearse: al crear la fila de un
+día nuevo se borran las pasadas de ese empleado (``purgar_bloqueos``), así la
+tabla queda acotada a los días futuros con reservas.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from contextlib import contextmanager
+from datetime import date
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import delete, insert, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from db.models import AgendaBloqueo
+
+N_STRIPES = int(os.getenv("AGENDA_LOCK_STRIPES", "64"))
+_STRIPES: List[threading.Lock] = [threading.Lock() for _ in range(N_STRIPES)]
+
+Clave = Tuple[int, date]
+
+__all__ = ["agenda_exclusiva", "bloquear_en_bd", "purgar_bloqueos"]
+
+
+def _stripe(clave: Clave) -> int:
+    return hash(clave) % N_STRIPES
+
+
+def bloquear_en_bd(db: Session, empleado_id: int, fecha: date) -> None:
+    """Toma la fila‑candado de la agenda (la crea si no existe).
+
+    Debe llamarse dentro de la transacción que insertará la cita; el candado
+    se libera con su ``commit`` / ``rollback``.
+    """
+    filtro = (AgendaBloqueo.empleado_id == empleado_id, AgendaBloqueo.fecha == fecha)
+    stmt = update(AgendaBloqueo).where(*filtro).values(version=AgendaBloqueo.version + 1)
+    if db.execute(stmt).rowcount:
+        return
+    try:
+        with db.begin_nested():
+            db.execute(insert(AgendaBloqueo).values(empleado_id=empleado_id, fecha=fecha, version=1))
+    except IntegrityError:
+        # Otro proceso la creó entre el UPDATE y el INSERT → ahora sí existe
+        db.execute(stmt)
+        return
+    # Primera reserva de ese día: buen momento para soltar los días pasados
+    purgar_bloqueos(db, empleado_id)
+
+
+def purgar_bloqueos(
+    db: Session, empleado_id: Optional[int] = None, antes: Optional[date] = None
+) -> int:
+    """Borra las filas‑candado anteriores a *antes* (hoy por omisión).
+
+    Sin *empleado_id* purga toda la tabla (p. ej. desde un job nocturno).
+    Devuelve cuántas filas borró; el ``commit`` queda a cargo de quien llama.
+    """
+    stmt = delete(AgendaBloqueo).where(AgendaBloqueo.fecha < (antes or date.today()))
+    if empleado_id is not None:
+        stmt = stmt.where(AgendaBloqueo.empleado_id == empleado_id)
+    return db.execute(stmt).rowcount
+
+
+@contextmanager
+def agenda_exclusiva(db: Session, claves: Iterable[Clave]) -> Iterator[None]:
+    """Serializa las agendas *claves* (proceso + BD) mientras dure el bloque.
+
+    Las claves se ordenan antes de bloquear para que reservas de varias
+    agendas (combos) no se bloqueen mutuamente.
+    """
+    ordenadas = sorted(set(claves))
+    stripes = sorted({_stripe(c) for c in ordenadas})
+    for i in stripes:
+        _STRIPES[i].acquire()
+    try:
+        for empleado_id, fecha in ordenadas:
+            bloquear_en_bd(db, empleado_id, fecha)
+        yield
+    finally:
+        for i in reversed(stripes):
+            _STRIPES[i].release()
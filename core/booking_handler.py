@@ -5,20 +5,51 @@ Puntos de entrada *sync*:
 
 * check_availability(data)   → solo consulta el hueco
 * process_booking_request(data) → valida y crea la cita
+* process_booking_requests(items) → combo de servicios *back‑to‑back* en una
+  sola transacción (p. ej. "Depilación + Facial", cada parte puede ser con
+  otra persona)
+
+Si ``empleado_id`` no viene, se busca entre **toda** la plantilla
+("me da igual quién") con una sola pasada del scheduler.
+
+La reserva corre dentro de ``agenda_exclusiva`` (candado por empleado/día en
+proceso + fila‑candado en BD). Si aun así se pierde la carrera
+(``SlotOccupiedError`` / ``IntegrityError``) se reintenta con datos frescos y,
+si ya no hay hueco, se devuelven sugerencias en lugar de un 500.
+``BOOKING_MODE=optimista`` desactiva el candado (sólo para comparar en
+``scripts/bench_booking.py``).
 """
 
 from __future__ import annotations
 
 import datetime as dt
+import os
+from contextlib import nullcontext
 from datetime import date, time
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional
 
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
 from db.session import SessionLocal
 from db.models import Servicio, Cita
-from core.scheduler import is_slot_available, book_slot, next_free_slots
-from utils.datetime_parser import datetime_parser  # regex + IA
+from core.scheduler import (
+    is_slot_available,
+    book_slot,
+    book_slots,
+    next_free_slots,
+    next_free_slots_any,
+    first_free_employee,
+    SlotOccupiedError,
+)
+from core import slot_engine
+from core.agenda_index import agenda_index, duracion_servicio
+from core.agenda_locks import agenda_exclusiva
+from utils.datetime_parser import cache_parseo  # gramática local + IA, memoizado
+
+BOOKING_MODE = os.getenv("BOOKING_MODE", "exclusiva")   # exclusiva | optimista
+MAX_INTENTOS = 3
 
 # ───────────────────────── helpers internos ──────────────────────────
 
@@ -34,31 +65,161 @@ def _ensure_int(data: Dict[str, Any], key: str) -> int:
         raise _ValidationError(f"Parámetro faltante o inválido: {key}") from None
 
 
+def _optional_int(data: Dict[str, Any], key: str) -> Optional[int]:
+    if data.get(key) in (None, ""):
+        return None
+    return _ensure_int(data, key)
+
+
 def _parse_date(data: Dict[str, Any]) -> date:
     """ISO date o se extrae de fecha_texto."""
     if d := data.get("fecha"):
         return date.fromisoformat(str(d))
     if txt := data.get("fecha_texto"):
-        iso = datetime_parser(txt)
+        iso = cache_parseo.parsear(txt)
         if iso:
             return dt.datetime.fromisoformat(iso[0]).date()
     raise _ValidationError("Falta fecha")
 
 
 def _parse_time(data: Dict[str, Any]) -> time:
-    """ISO time o se extrae de fecha_texto."""
+    """ISO time o se extrae de fecha_texto; siempre en la rejilla de la agenda."""
+    hora: Optional[time] = None
     if t := data.get("hora"):
-        return time.fromisoformat(str(t))
-    if txt := data.get("fecha_texto"):
-        iso = datetime_parser(txt)
-        if iso:
-            return dt.datetime.fromisoformat(iso[0]).time()
-    raise _ValidationError("Falta hora")
+        try:
+            hora = time.fromisoformat(str(t))
+        except ValueError:
+            raise _ValidationError(f"Hora inválida: {t}") from None
+    elif txt := data.get("fecha_texto"):
+        iso = cache_parseo.parsear(txt)
+        if iso and "T" in iso[0]:       # "el jueves" trae fecha, no hora
+            hora = dt.datetime.fromisoformat(iso[0]).time()
+    if hora is None:
+        raise _ValidationError("Falta hora")
+    if not slot_engine.en_rejilla(hora):   # 10:02 nunca coincide con un inicio
+        raise _ValidationError(
+            f"La hora debe ser múltiplo de {slot_engine.RESOLUCION_MIN} min: {hora:%H:%M}"
+        )
+    return hora
+
 
+def _resolve_slot(
+    db: Session,
+    fecha: date,
+    hora: time,
+    empleado_id: Optional[int],
+    servicio_id: int,
+) -> tuple[Optional[int], Dict[str, Any]]:
+    """``(empleado_id, {})`` si el hueco está libre; si no ``(None, respuesta)``.
+
+    Sin ``empleado_id`` se toma el primer empleado libre a esa hora.
+    """
+    if empleado_id is None:
+        libre = first_free_employee(db, fecha, hora, servicio_id)
+        if libre is not None:
+            return libre, {}
+        sugerencias = next_free_slots_any(db, fecha, hora, servicio_id, n=3, step_min=30)
+    else:
+        if is_slot_available(db, fecha, hora, empleado_id, servicio_id):
+            return empleado_id, {}
+        sugerencias = next_free_slots(
+            db, fecha, hora, empleado_id, servicio_id, n=3, step_min=30
+        )
+    return None, {
+        "ok": False,
+        "reason": "slot_occupied",
+        "suggestions": sugerencias,
+    }
 
-def _compute_end(start: time, minutes: int) -> time:
-    dt_start = dt.datetime.combine(date.today(), start)
-    return (dt_start + dt.timedelta(minutes=minutes)).time()
+
+def _exclusive(db: Session, claves: List[tuple[int, date]]):
+    """Sección crítica de reserva según ``BOOKING_MODE``."""
+    if BOOKING_MODE == "optimista":
+        return nullcontext()
+    return agenda_exclusiva(db, claves)
+
+
+def _book_with_retry(
+    db: Session,
+    cliente_id: int,
+    servicio_id: int,
+    empleado_id: Optional[int],
+    fecha: date,
+    hora: time,
+) -> tuple[Optional[Cita], Dict[str, Any]]:
+    """Reserva con candado por agenda; ``(cita, {})`` o ``(None, respuesta)``.
+
+    Al perder una carrera se desaloja ese día del índice (estaba viejo) y se
+    vuelve a resolver: con empleado fijo salen sugerencias frescas; con
+    "cualquiera" se prueba con el siguiente empleado libre.
+    """
+    respuesta: Dict[str, Any] = {"ok": False, "reason": "slot_occupied", "suggestions": []}
+    for _ in range(MAX_INTENTOS):
+        elegido, ocupado = _resolve_slot(db, fecha, hora, empleado_id, servicio_id)
+        if ocupado:
+            return None, ocupado
+        try:
+            with _exclusive(db, [(elegido, fecha)]):
+                cita = book_slot(
+                    db,
+                    cliente_id=cliente_id,
+                    servicio_id=servicio_id,
+                    empleado_id=elegido,
+                    fecha=fecha,
+                    hora=hora,
+                )
+                db.commit()
+            return cita, {}
+        except (SlotOccupiedError, IntegrityError):
+            db.rollback()
+            agenda_index.desalojar(db, [(elegido, fecha)])
+    return None, respuesta
+
+
+def _combo_items(
+    db: Session, items: List[Dict[str, Any]]
+) -> tuple[int, List[tuple[int, Optional[int], int]]]:
+    """Valida **todas** las partes juntas → ``(cliente_id, [(servicio, empleado, dur)])``."""
+    if not items:
+        raise _ValidationError("Lista de servicios vacía")
+    cliente_id = _ensure_int(items[0], "cliente_id")
+    errores: List[str] = []
+    partes: List[tuple[int, Optional[int]]] = []
+    for i, item in enumerate(items):
+        try:
+            servicio_id = _ensure_int(item, "servicio_id")
+            empleado_id = _optional_int(item, "empleado_id")
+            otro = _optional_int(item, "cliente_id")
+            if otro is not None and otro != cliente_id:
+                raise _ValidationError("cliente_id distinto en el mismo combo")
+            partes.append((servicio_id, empleado_id))
+        except _ValidationError as ve:
+            errores.append(f"[{i}] {ve}")
+    if errores:
+        raise _ValidationError("; ".join(errores))
+
+    ids = {servicio_id for servicio_id, _ in partes}
+    duraciones = {
+        s.id: duracion_servicio(s.duracion_max, s.duracion_min)
+        for s in db.scalars(select(Servicio).where(Servicio.id.in_(ids)))
+    }
+    if missing := ids - duraciones.keys():
+        raise _ValidationError(f"Servicio inexistente: {sorted(missing)}")
+    return cliente_id, [(sid, emp, duraciones[sid]) for sid, emp in partes]
+
+
+def _combo_dicts(
+    secuencia: List[slot_engine.Hueco], partes: List[tuple[int, Optional[int], int]]
+) -> List[Dict[str, Any]]:
+    return [
+        {
+            "servicio_id": servicio_id,
+            "empleado_id": emp,
+            "inicio": ini.isoformat(),
+            "fin": fin.isoformat(),
+        }
+        for (ini, fin, emp), (servicio_id, _, _) in zip(secuencia, partes)
+    ]
 
 
 # ───────────────────────────── API pública ───────────────────────────
@@ -69,21 +230,16 @@ def check_availability(data: Dict[str, Any]) -> Dict[str, Any]:
     db: Session = SessionLocal()
     try:
         servicio_id = _ensure_int(data, "servicio_id")
-        empleado_id = _ensure_int(data, "empleado_id")
+        empleado_id = _optional_int(data, "empleado_id")
         fecha = _parse_date(data)
         hora = _parse_time(data)
 
-        if is_slot_available(db, fecha, hora, empleado_id, servicio_id):
-            return {"ok": True}
-
-        sugerencias = next_free_slots(
-            db, fecha, hora, empleado_id, servicio_id, n=3, step_min=30
-        )
-        return {
-            "ok": False,
-            "reason": "slot_occupied",
-            "suggestions": sugerencias,
-        }
+        empleado_id, ocupado = _resolve_slot(db, fecha, hora, empleado_id, servicio_id)
+        if ocupado:
+            return ocupado
+        return {"ok": True, "empleado_id": empleado_id}
+    except _ValidationError as ve:
+        return {"ok": False, "reason": "validation_error", "detail": str(ve)}
     finally:
         db.close()
 
@@ -94,43 +250,92 @@ def process_booking_request(data: Dict[str, Any]) -> Dict[str, Any]:
     try:
         cliente_id = _ensure_int(data, "cliente_id")
         servicio_id = _ensure_int(data, "servicio_id")
-        empleado_id = _ensure_int(data, "empleado_id")
+        empleado_id = _optional_int(data, "empleado_id")
         fecha = _parse_date(data)
         hora = _parse_time(data)
 
-        # 1. disponibilidad
-        if not is_slot_available(db, fecha, hora, empleado_id, servicio_id):
-            sugerencias = next_free_slots(
-                db, fecha, hora, empleado_id, servicio_id, n=3, step_min=30
-            )
-            return {
-                "ok": False,
-                "reason": "slot_occupied",
-                "suggestions": sugerencias,
-            }
-
-        # 2. crear cita
-        cita: Cita = book_slot(
-            db,
-            cliente_id=cliente_id,
-            servicio_id=servicio_id,
-            empleado_id=empleado_id,
-            fecha=fecha,
-            hora=hora,
+        # 1. disponibilidad (o primer empleado libre) + 2. crear cita
+        cita, ocupado = _book_with_retry(
+            db, cliente_id, servicio_id, empleado_id, fecha, hora
         )
-        db.commit()
-
-        servicio: Servicio = db.get(Servicio, servicio_id)
-        duracion = servicio.duracion_max or servicio.duracion_min or 60
-        hora_fin = _compute_end(hora, duracion)
+        if cita is None:
+            return ocupado
 
         return {
             "ok": True,
             "cita_id": cita.id,
+            "empleado_id": cita.empleado_id,
             "inicio": f"{fecha}T{hora}",
-            "fin": f"{fecha}T{hora_fin}",
+            "fin": f"{fecha}T{cita.hora_fin}",
         }
     except _ValidationError as ve:
         return {"ok": False, "reason": "validation_error", "detail": str(ve)}
     finally:
         db.close()
+
+
+def process_booking_requests(items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Reserva un combo *back‑to‑back* en **una** transacción.
+
+    Cada elemento es como el ``data`` de ``process_booking_request``; sólo el
+    primero aporta ``fecha`` / ``hora`` / ``fecha_texto`` (el resto va pegado
+    al anterior). ``empleado_id`` es opcional por parte.
+
+    Se validan todas las partes juntas, se busca una secuencia factible con
+    una pasada del motor de bitmaps y se insertan todas las ``Cita`` con un
+    solo ``flush`` + ``commit``. Si la hora pedida no es factible se devuelven
+    combos alternativos.
+    """
+    db: Session = SessionLocal()
+    try:
+        cliente_id, partes = _combo_items(db, items)
+        fecha = _parse_date(items[0])
+        hora = _parse_time(items[0])
+        busqueda = [(emp, dur) for _, emp, dur in partes]
+
+        for _ in range(MAX_INTENTOS):
+            exacto = slot_engine.buscar_combo(
+                db, busqueda, fecha, hora_min=hora, n=1,
+                step_min=slot_engine.RESOLUCION_MIN, dias=1,
+            )
+            if not exacto or exacto[0][0][0] != dt.datetime.combine(fecha, hora):
+                alternativas = slot_engine.buscar_combo(
+                    db, busqueda, fecha, hora_min=hora, n=3, step_min=30
+                )
+                return {
+                    "ok": False,
+                    "reason": "slot_occupied",
+                    "suggestions": [_combo_dicts(c, partes) for c in alternativas],
+                }
+
+            secuencia = exacto[0]
+            claves = [(emp, ini.date()) for ini, _, emp in secuencia]
+            try:
+                with _exclusive(db, claves):
+                    citas = book_slots(
+                        db,
+                        cliente_id,
+                        [
+                            (servicio_id, emp, ini.date(), ini.time())
+                            for (ini, _, emp), (servicio_id, _, _) in zip(secuencia, partes)
+                        ],
+                    )
+                    cita_ids = [c.id for c in citas]   # antes de expirar en commit
+                    db.commit()
+            except (SlotOccupiedError, IntegrityError):
+                db.rollback()
+                agenda_index.desalojar(db, claves)
+                continue
+
+            return {
+                "ok": True,
+                "citas": [
+                    {"cita_id": cita_id, **d}
+                    for cita_id, d in zip(cita_ids, _combo_dicts(secuencia, partes))
+                ],
+            }
+        return {"ok": False, "reason": "slot_occupied", "suggestions": []}
+    except _ValidationError as ve:
+        return {"ok": False, "reason": "validation_error", "detail": str(ve)}
+    finally:
+        db.close()
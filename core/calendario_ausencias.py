@@ -0,0 +1,323 @@
+# core/calendario_ausencias.py
+"""Calendario en memoria de ausencias del personal (``DisponibilidadPersonal``).
+
+👀 Responsabilidades:
+    - Cargar **todas** las ausencias de un *bind* con una sola consulta y
+      guardarlas por empleado.
+    - Precalcular por empleado un *bitset* de ``HORIZONTE_DIAS`` días desde
+      hoy: "¿está ausente el día X?" es un acceso a un array, O(1).
+    - Fuera del horizonte (pasado lejano, más de un año) responder con los
+      rangos fusionados y ordenados + ``bisect``.
+    - Mantenerse al día con las escrituras del propio proceso (eventos ORM
+      aplicados al hacer commit; sólo se recalcula el empleado afectado) y
+      detectar las de otros procesos con la firma ``(COUNT(id), MAX(updated_at))``
+      como ``core.agenda_index``.
+
+Nota:
+    - Una sesión con ausencias sin confirmar ve el calendario confirmado más
+      su propio *overlay*; nunca se comparten datos sin commit.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time as _time
+import weakref
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from datetime import date, datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import Session, object_session
+
+from db.models import DisponibilidadPersonal
+
+# ───────────────────────── Configuración ──────────────────────────
+HORIZONTE_DIAS = int(os.getenv("AUSENCIAS_HORIZONTE_DIAS", "365"))
+PROBE_SECONDS  = float(os.getenv("AGENDA_PROBE_SECONDS", "2"))
+
+_PENDIENTES = "ausencias_pendientes"   # clave en ``Session.info``
+_DUDOSA     = "ausencias_dudosa"       # savepoint revertido → recargar todo
+_DELTAS     = "ausencias_deltas"       # (±filas, updated_at) para la firma esperada
+
+Op = Tuple[str, int, int, int, int]    # (tipo, empleado_id, fila_id, ini, fin) en ordinales
+
+__all__ = ["AusenciasEmpleado", "CalendarioAusencias", "calendario_ausencias"]
+
+# ───────────────────────── Estructura por empleado ────────────────
+
+@dataclass
+class AusenciasEmpleado:
+    """Ausencias de un empleado: filas crudas + vistas precalculadas.
+
+    ``bits[i]`` es True si el día ``base + i`` (ordinal) está cubierto;
+    ``inicios`` / ``fines`` son los rangos fusionados, ordenados y disjuntos.
+    """
+    base: int
+    filas:   Dict[int, Tuple[int, int]] = field(default_factory=dict)
+    bits:    np.ndarray = field(default_factory=lambda: np.zeros(HORIZONTE_DIAS, dtype=bool))
+    inicios: List[int] = field(default_factory=list)
+    fines:   List[int] = field(default_factory=list)
+
+    def reconstruir(self) -> None:
+        """Recalcula bitset y rangos fusionados a partir de ``filas``."""
+        self.bits = np.zeros(HORIZONTE_DIAS, dtype=bool)
+        self.inicios, self.fines = [], []
+        for ini, fin in sorted(self.filas.values()):
+            if self.fines and ini <= self.fines[-1] + 1:
+                self.fines[-1] = max(self.fines[-1], fin)
+            else:
+                self.inicios.append(ini)
+                self.fines.append(fin)
+            a, b = max(ini - self.base, 0), min(fin - self.base + 1, HORIZONTE_DIAS)
+            if a < b:
+                self.bits[a:b] = True
+
+    def ausente(self, ordinal: int) -> bool:
+        i = ordinal - self.base
+        if 0 <= i < HORIZONTE_DIAS:
+            return bool(self.bits[i])
+        k = bisect_right(self.inicios, ordinal)
+        return k > 0 and self.fines[k - 1] >= ordinal
+
+    def mascara(self, desde: int, dias: int) -> np.ndarray:
+        """Vector bool de *dias* días consecutivos desde el ordinal *desde*."""
+        i = desde - self.base
+        if 0 <= i and i + dias <= HORIZONTE_DIAS:
+            return self.bits[i:i + dias].copy()
+        return np.array([self.ausente(desde + d) for d in range(dias)], dtype=bool)
+
+    def copia(self) -> "AusenciasEmpleado":
+        return AusenciasEmpleado(
+            self.base, dict(self.filas), self.bits.copy(), list(self.inicios), list(self.fines)
+        )
+
+
+@dataclass
+class _EstadoBind:
+    empleados: Optional[Dict[int, AusenciasEmpleado]] = None   # None ⇒ sin cargar
+    base: int = 0
+    firma: Optional[Tuple[int, Any]] = None
+    ultimo_probe: float = float("-inf")
+    generacion: int = 0
+
+# ───────────────────────── Calendario global ──────────────────────
+
+class CalendarioAusencias:
+    """Caché de ausencias compartida por todas las sesiones del proceso."""
+
+    def __init__(self, probe_seconds: float = PROBE_SECONDS) -> None:
+        self.probe_seconds = probe_seconds
+        self._lock = threading.RLock()
+        self._por_bind: "weakref.WeakKeyDictionary[Any, _EstadoBind]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    # ---------- helpers ----------
+    @staticmethod
+    def _bind(db: Session) -> Any:
+        return db.get_bind(DisponibilidadPersonal)
+
+    def _estado(self, bind: Any) -> _EstadoBind:
+        estado = self._por_bind.get(bind)
+        if estado is None:
+            estado = self._por_bind[bind] = _EstadoBind()
+        return estado
+
+    @staticmethod
+    def _cargar(
+        db: Session, base: int
+    ) -> Tuple[Dict[int, AusenciasEmpleado], Tuple[int, Any]]:
+        """Todas las ausencias en **una** consulta; la firma sale de las mismas filas."""
+        dp = DisponibilidadPersonal
+        rows = db.execute(
+            select(dp.id, dp.empleado_id, dp.fecha_ini, dp.fecha_fin, dp.updated_at)
+        ).all()
+        empleados: Dict[int, AusenciasEmpleado] = {}
+        maximo = None
+        for fila_id, emp, ini, fin, updated_at in rows:
+            cal = empleados.setdefault(emp, AusenciasEmpleado(base))
+            cal.filas[fila_id] = (ini.toordinal(), fin.toordinal())
+            if updated_at is not None and (maximo is None or updated_at > maximo):
+                maximo = updated_at
+        for cal in empleados.values():
+            cal.reconstruir()
+        return empleados, (len(rows), maximo)
+
+    @staticmethod
+    def _firma(db: Session) -> Tuple[int, Any]:
+        dp = DisponibilidadPersonal
+        row = db.execute(select(func.count(dp.id), func.max(dp.updated_at))).one()
+        return int(row[0]), row[1]
+
+    def _confirmado(self, db: Session, bind: Any, sucia: bool) -> Dict[int, AusenciasEmpleado]:
+        """Calendario confirmado del *bind*, cargándolo o refrescándolo si hace falta."""
+        hoy = date.today().toordinal()
+        ahora = _time.monotonic()
+        with self._lock:
+            estado = self._estado(bind)
+            empleados = estado.empleados
+            if empleados is not None and estado.base != hoy:
+                empleados = None                  # cambió el día → nuevo horizonte
+            probar = (
+                empleados is not None and not sucia
+                and ahora - estado.ultimo_probe >= self.probe_seconds
+            )
+            if probar:
+                estado.ultimo_probe = ahora
+            generacion = estado.generacion
+        if empleados is not None and probar and self._firma(db) != estado.firma:
+            empleados = None
+        if empleados is not None:
+            return empleados
+        empleados, firma = self._cargar(db, hoy)
+        if not sucia:
+            with self._lock:
+                if estado.generacion == generacion:
+                    estado.empleados, estado.base, estado.firma = empleados, hoy, firma
+                    estado.ultimo_probe = ahora
+                    estado.generacion += 1
+        return empleados
+
+    def _empleado(self, db: Session, empleado_id: int) -> Optional[AusenciasEmpleado]:
+        pendientes: List[Op] = db.info.get(_PENDIENTES, [])
+        empleados = self._confirmado(db, self._bind(db), sucia=bool(pendientes))
+        cal = empleados.get(empleado_id)
+        propias = [op for op in pendientes if op[1] == empleado_id]
+        if not propias:
+            return cal
+        cal = cal.copia() if cal is not None else AusenciasEmpleado(date.today().toordinal())
+        _aplicar_ops(cal, propias)
+        cal.reconstruir()
+        return cal
+
+    # ---------- API ----------
+    def ausente(self, db: Session, empleado_id: int, fecha: date) -> bool:
+        """True si *empleado_id* está ausente en *fecha* (O(1) dentro del horizonte)."""
+        cal = self._empleado(db, empleado_id)
+        return cal is not None and cal.ausente(fecha.toordinal())
+
+    def mascara(
+        self, db: Session, empleado_ids: Sequence[int], desde: date, dias: int
+    ) -> np.ndarray:
+        """Matriz bool ``(E, dias)``: ausencia de cada empleado en ``desde + d``."""
+        out = np.zeros((len(empleado_ids), dias), dtype=bool)
+        for e, emp in enumerate(empleado_ids):
+            cal = self._empleado(db, emp)
+            if cal is not None:
+                out[e] = cal.mascara(desde.toordinal(), dias)
+        return out
+
+    def invalidar(self, bind: Any = None) -> None:
+        """Olvida el calendario de *bind* (o de todos si es ``None``)."""
+        with self._lock:
+            estados = list(self._por_bind.values()) if bind is None else [
+                self._estado(bind)
+            ]
+            for estado in estados:
+                estado.empleados = None
+                estado.firma = None
+                estado.generacion += 1
+
+    def aplicar(
+        self, bind: Any, ops: Iterable[Op], deltas: Iterable[Tuple[int, Optional[datetime]]]
+    ) -> None:
+        """Aplica en sitio las operaciones confirmadas; sólo recalcula los empleados tocados."""
+        with self._lock:
+            estado = self._estado(bind)
+            estado.generacion += 1
+            if estado.empleados is None:
+                return
+            por_empleado: Dict[int, List[Op]] = {}
+            for op in ops:
+                por_empleado.setdefault(op[1], []).append(op)
+            for emp, propias in por_empleado.items():
+                # copia + reemplazo: los lectores sin candado nunca ven un estado a medias
+                previo = estado.empleados.get(emp)
+                cal = previo.copia() if previo is not None else AusenciasEmpleado(estado.base)
+                _aplicar_ops(cal, propias)
+                cal.reconstruir()
+                estado.empleados[emp] = cal
+            if estado.firma is not None:
+                total, maximo = estado.firma
+                for delta, updated_at in deltas:
+                    if updated_at is not None and maximo is not None:
+                        if maximo.tzinfo is not None and updated_at.tzinfo is None:
+                            updated_at = updated_at.replace(tzinfo=timezone.utc)
+                    if updated_at is not None and (maximo is None or updated_at > maximo):
+                        maximo = updated_at
+                    total += delta
+                estado.firma = (total, maximo)
+
+
+def _aplicar_ops(cal: AusenciasEmpleado, ops: Iterable[Op]) -> None:
+    for tipo, _emp, fila_id, ini, fin in ops:
+        if tipo == "add":
+            cal.filas[fila_id] = (ini, fin)
+        else:
+            cal.filas.pop(fila_id, None)
+
+
+calendario_ausencias = CalendarioAusencias()
+
+# ───────────────────────── Eventos ORM ────────────────────────────
+
+def _registrar(target: DisponibilidadPersonal, delta: int, *ops: Op) -> None:
+    sess = object_session(target)
+    if sess is None:
+        return
+    sess.info.setdefault(_PENDIENTES, []).extend(ops)
+    sess.info.setdefault(_DELTAS, []).append((delta, target.updated_at))
+
+
+def _op_alta(target: DisponibilidadPersonal) -> Op:
+    return (
+        "add", target.empleado_id, target.id,
+        target.fecha_ini.toordinal(), target.fecha_fin.toordinal(),
+    )
+
+
+@event.listens_for(DisponibilidadPersonal, "after_insert")
+def _ausencia_insertada(_mapper, _connection, target: DisponibilidadPersonal) -> None:
+    _registrar(target, 1, _op_alta(target))
+
+
+@event.listens_for(DisponibilidadPersonal, "after_update")
+def _ausencia_actualizada(_mapper, _connection, target: DisponibilidadPersonal) -> None:
+    hist = inspect(target).attrs["empleado_id"].history
+    anterior = hist.deleted[0] if hist.deleted else target.empleado_id
+    _registrar(target, 0, ("del", anterior, target.id, 0, 0), _op_alta(target))
+
+
+@event.listens_for(DisponibilidadPersonal, "after_delete")
+def _ausencia_borrada(_mapper, _connection, target: DisponibilidadPersonal) -> None:
+    _registrar(target, -1, ("del", target.empleado_id, target.id, 0, 0))
+
+
+@event.listens_for(Session, "after_commit")
+def _al_commit(session: Session) -> None:
+    ops: List[Op] = session.info.pop(_PENDIENTES, [])
+    dudosa = session.info.pop(_DUDOSA, False)
+    deltas = session.info.pop(_DELTAS, [])
+    if not ops and not dudosa:
+        return
+    bind = session.get_bind(DisponibilidadPersonal)
+    if dudosa:
+        calendario_ausencias.invalidar(bind)
+    else:
+        calendario_ausencias.aplicar(bind, ops, deltas)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _al_rollback(session: Session, previous_transaction: Any) -> None:
+    if previous_transaction.nested and session.info.get(_PENDIENTES):
+        session.info[_DUDOSA] = True
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _al_terminar(session: Session, transaction: Any) -> None:
+    if transaction.parent is None and not transaction.nested:
+        for clave in (_PENDIENTES, _DUDOSA, _DELTAS):
+            session.info.pop(clave, None)
@@ -0,0 +1,247 @@
+# core/disponibilidad_resumen.py
+"""Resumen materializado de disponibilidad para el selector de fechas.
+
+👀 Responsabilidades:
+    - Calcular, para cada (empleado, día, bucket de duración), los minutos
+      libres en tramos donde cabe un servicio de ese bucket, con el mismo
+      bitmap de ``core.slot_engine`` (citas, días cerrados y ausencias).
+    - Guardarlos en ``disponibilidad_resumen`` (``materializar``).
+    - Mantenerlos al día al reservar / cancelar (``actualizar``), dentro de la
+      misma transacción que la cita.
+    - Responder "¿qué días de los próximos 30 aún tienen hueco para este
+      servicio?" con **una** lectura por índice (``dias_con_capacidad``).
+
+Nota:
+    - La duración de un servicio se redondea hacia arriba al bucket: el
+      resumen puede ocultar un día en el que sólo cabe justo ese servicio,
+      pero nunca muestra un día sin hueco. Los servicios más largos que el
+      mayor bucket y el día de hoy (el resumen cuenta horas ya pasadas) se
+      resuelven con ``slot_engine.dias_con_hueco``.
+    - ``actualizar`` sólo reescribe días ya materializados; los que falten se
+      materializan al leerlos.
+    - Ausencias (alta, cambio o baja) y altas / bajas de personal invalidan
+      sus filas con eventos ORM, en la misma transacción; se recalculan al
+      leerlas. Cambiar la duración de un ``Servicio`` no las toca: cada cita
+      guarda su propio ``hora_fin`` y el bucket se elige al leer.
+    - Dos lectores que materializan el mismo tramo a la vez no chocan: el que
+      pierde (``IntegrityError`` en la PK) descarta lo suyo y usa el bitmap.
+"""
+from __future__ import annotations
+
+from bisect import bisect_left
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import bindparam, delete, event, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from db.models import DisponibilidadPersonal, Empleado, ResumenDisponibilidad
+from core import slot_engine
+
+# ───────────────────────── Configuración ──────────────────────────
+BUCKETS_MIN = (30, 60, 90, 120, 180, 240, 480)
+DIAS_RESUMEN = 31
+
+Clave = Tuple[int, date]            # (empleado_id, fecha)
+
+__all__ = [
+    "BUCKETS_MIN", "bucket_de", "materializar", "actualizar", "dias_con_capacidad",
+]
+
+
+def bucket_de(duracion_min: int) -> Optional[int]:
+    """Menor bucket que cubre *duracion_min* (``None`` si no cabe en ninguno)."""
+    i = bisect_left(BUCKETS_MIN, duracion_min)
+    return BUCKETS_MIN[i] if i < len(BUCKETS_MIN) else None
+
+
+def _calcular(
+    db: Session, desde: date, dias: int, empleado_ids: Optional[Sequence[int]]
+) -> List[Dict[str, object]]:
+    fechas = [desde + timedelta(days=i) for i in range(dias)]
+    emps, ocupado = slot_engine.ocupacion(db, empleado_ids, fechas)
+    libres = slot_engine.minutos_libres(ocupado, BUCKETS_MIN)     # (E, D, B)
+    return [
+        {
+            "empleado_id": emp,
+            "fecha": fecha,
+            "duracion_bucket": bucket,
+            "minutos_libres": int(libres[e, d, b]),
+        }
+        for e, emp in enumerate(emps)
+        for d, fecha in enumerate(fechas)
+        for b, bucket in enumerate(BUCKETS_MIN)
+    ]
+
+# ───────────────────────── Escritura ──────────────────────────────
+
+def materializar(
+    db: Session,
+    desde: date,
+    dias: int = DIAS_RESUMEN,
+    empleado_ids: Optional[Sequence[int]] = None,
+) -> int:
+    """(Re)calcula el resumen de ``desde`` a ``desde + dias - 1``.
+
+    Borra y reinserta el rango en bloque dentro de un *savepoint*. Si otra
+    transacción materializó el mismo tramo a la vez (``IntegrityError`` en la
+    PK) se deshace sólo el *savepoint* y se devuelve 0. No hace commit.
+    Devuelve el número de filas escritas.
+    """
+    filas = _calcular(db, desde, dias, empleado_ids)
+    R = ResumenDisponibilidad
+    stmt = delete(R).where(R.fecha.between(desde, desde + timedelta(days=dias - 1)))
+    if empleado_ids is not None:
+        stmt = stmt.where(R.empleado_id.in_(empleado_ids))
+    try:
+        with db.begin_nested():
+            db.execute(stmt)
+            if filas:
+                db.execute(insert(R), filas)
+    except IntegrityError:
+        return 0
+    return len(filas)
+
+
+def actualizar(db: Session, claves: Iterable[Clave]) -> None:
+    """Recalcula los días *claves* tras reservar o cancelar (sin commit).
+
+    Un único ``UPDATE`` por lotes; los días aún no materializados no se
+    tocan (``dias_con_capacidad`` los calculará al pedirlos).
+    """
+    claves = sorted(set(claves))
+    if not claves:
+        return
+    fechas = [f for _, f in claves]
+    desde = min(fechas)
+    dias = (max(fechas) - desde).days + 1
+    pedidas = set(claves)
+    filas = [
+        {
+            "b_emp": fila["empleado_id"], "b_fecha": fila["fecha"],
+            "b_bucket": fila["duracion_bucket"], "b_libres": fila["minutos_libres"],
+        }
+        for fila in _calcular(db, desde, dias, sorted({e for e, _ in claves}))
+        if (fila["empleado_id"], fila["fecha"]) in pedidas
+    ]
+    if not filas:
+        return
+    R = ResumenDisponibilidad
+    stmt = (
+        update(R.__table__)
+        .where(
+            R.__table__.c.empleado_id == bindparam("b_emp"),
+            R.__table__.c.fecha == bindparam("b_fecha"),
+            R.__table__.c.duracion_bucket == bindparam("b_bucket"),
+        )
+        .values(minutos_libres=bindparam("b_libres"))
+    )
+    db.execute(stmt, filas)
+
+# ───────────────────────── Lectura ────────────────────────────────
+
+def dias_con_capacidad(
+    db: Session,
+    duracion_min: int,
+    desde: date,
+    dias: int = 30,
+    empleado_id: Optional[int] = None,
+    ahora: Optional[datetime] = None,
+) -> List[date]:
+    """Días de ``desde`` a ``desde + dias - 1`` con hueco para *duracion_min*.
+
+    Con *empleado_id* sólo cuenta su agenda; si no, basta cualquier empleado.
+    Una lectura sobre ``ix_disponibilidad_resumen_bucket_fecha``; si falta algún
+    día se materializa ese tramo (la capa superior decide el commit). Hoy se
+    confirma desde *ahora* y las duraciones sin bucket van directo al bitmap.
+    """
+    R = ResumenDisponibilidad
+    ahora = ahora or datetime.now()
+    fechas = [desde + timedelta(days=i) for i in range(dias)]
+    empleado_ids = [empleado_id] if empleado_id is not None else None
+    bucket = bucket_de(duracion_min)
+    if bucket is None:
+        return slot_engine.dias_con_hueco(db, empleado_ids, fechas, duracion_min, ahora=ahora)
+    stmt = (
+        select(R.fecha, func.max(R.minutos_libres))
+        .where(
+            R.duracion_bucket == bucket,
+            R.fecha.between(fechas[0], fechas[-1]),
+        )
+        .group_by(R.fecha)
+    )
+    if empleado_id is not None:
+        stmt = stmt.where(R.empleado_id == empleado_id)
+    libres: Dict[date, int] = dict(db.execute(stmt).all())
+
+    faltan = [f for f in fechas if f not in libres]
+    if faltan:
+        materializar(db, faltan[0], (faltan[-1] - faltan[0]).days + 1)
+        libres = dict(db.execute(stmt).all())
+    if faltan := [f for f in fechas if f not in libres]:
+        # Carrera perdida en ``materializar`` y lo del otro aún no es visible
+        tramo = [faltan[0] + timedelta(days=i) for i in range((faltan[-1] - faltan[0]).days + 1)]
+        exactos = set(slot_engine.dias_con_hueco(db, empleado_ids, tramo, duracion_min, ahora=ahora))
+        libres.update({f: int(f in exactos) for f in faltan})
+    con_hueco = [f for f in fechas if libres.get(f, 0) > 0]
+    if con_hueco and con_hueco[0] == ahora.date():
+        # El resumen cuenta el día completo; de hoy sólo vale lo que queda
+        if not slot_engine.dias_con_hueco(db, empleado_ids, con_hueco[:1], duracion_min, ahora=ahora):
+            con_hueco = con_hueco[1:]
+    return con_hueco
+
+# ───────────────────────── Eventos ORM ────────────────────────────
+
+def _invalidar(connection, empleado_id: Optional[int], desde: Optional[date] = None,
+               hasta: Optional[date] = None) -> None:
+    """Borra las filas afectadas; ``dias_con_capacidad`` las recalcula al leerlas."""
+    R = ResumenDisponibilidad.__table__
+    stmt = delete(R)
+    if empleado_id is not None:
+        stmt = stmt.where(R.c.empleado_id == empleado_id)
+    if desde is not None:
+        stmt = stmt.where(R.c.fecha >= desde)
+    if hasta is not None:
+        stmt = stmt.where(R.c.fecha <= hasta)
+    connection.execute(stmt)
+
+
+@event.listens_for(DisponibilidadPersonal, "after_insert")
+@event.listens_for(DisponibilidadPersonal, "after_delete")
+def _ausencia_alta_o_baja(_mapper, connection, target: DisponibilidadPersonal) -> None:
+    _invalidar(connection, target.empleado_id, target.fecha_ini, target.fecha_fin)
+
+
+@event.listens_for(DisponibilidadPersonal, "before_update")
+def _ausencia_cambiada(_mapper, connection, target: DisponibilidadPersonal) -> None:
+    # El rango anterior se lee de la BD: tras un commit los atributos expiran y
+    # el historial del ORM ya no guarda el valor previo
+    D = DisponibilidadPersonal
+    previa = connection.execute(
+        select(D.empleado_id, D.fecha_ini, D.fecha_fin).where(D.id == target.id)
+    ).first()
+    if previa is not None:
+        _invalidar(connection, *previa)
+    _invalidar(connection, target.empleado_id, target.fecha_ini, target.fecha_fin)
+
+
+@event.listens_for(Empleado, "after_insert")
+def _empleado_alta(_mapper, connection, _target: Empleado) -> None:
+    # Sus días no tienen filas pero los demás sí: hay que rematerializar todo
+    _invalidar(connection, None, date.today())
+
+
+@event.listens_for(Empleado, "before_delete")
+def _empleado_baja(_mapper, connection, target: Empleado) -> None:
+    _invalidar(connection, target.id)
+
+# ────────────────────────────────────────────────────────────────────────────────
+# Ejemplo CLI: rematerializar el próximo mes (tarea nocturna)
+# ────────────────────────────────────────────────────────────────────────────────
+if __name__ == "__main__":
+    from db.session import get_session
+
+    with get_session() as session:
+        n = materializar(session, date.today())
+        print(f"Resumen de disponibilidad: {n} filas")
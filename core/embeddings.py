@@ -0,0 +1,562 @@
+# core/embeddings.py
+"""Índice semántico del catálogo (``Servicio`` + ``Producto``) con FAISS.
+
+👀 Responsabilidades:
+    - Convertir cada fila del catálogo (nombre, categoría, detalles) en un
+      vector con un proveedor intercambiable (``EMBEDDINGS_PROVIDER``):
+      ``openai`` (API de embeddings) o ``hashing`` (local, determinista;
+      pruebas y trabajo sin red).
+    - Guardar el índice (``catalogo.faiss``) y su mapa de ids
+      (``catalogo.json``: id FAISS → tipo, id en la BD, nombre, huella del
+      texto) en ``EMBEDDINGS_DIR``.
+    - Abrir el índice con ``mmap`` al arrancar (los *workers* comparten las
+      páginas) y recargarlo en caliente cuando el archivo cambia, como
+      ``core.model_registry``.
+    - Actualizar de forma incremental: ``sincronizar`` compara la huella de
+      cada fila con el mapa y sólo calcula vectores de lo nuevo o cambiado;
+      lo que ya no existe se quita del índice. Lo llaman
+      ``scripts/import_servicios.py`` e ``import_productos.py``.
+    - No pagar dos veces el mismo texto: ``CacheEmbeddings`` guarda
+      ``(modelo, sha256 del texto normalizado) → vector`` en disco (índice
+      SQLite + matriz ``float32`` con ``mmap`` por modelo) y
+      ``EmbedderEnCache`` la consulta por lote antes de llamar a la API; los
+      textos que faltan van juntos en una sola llamada. Reconstruir el
+      índice o repetir una pregunta no vuelve a llamar al proveedor.
+
+Ids FAISS: ``tipo << 32 | id`` (servicio = 1, producto = 2), así se filtra
+por tipo con un rango y no hace falta otro índice.
+
+Uso:
+    from core.embeddings import indice_catalogo
+    indice_catalogo.buscar("algo para el cabello reseco", k=3, tipo="servicio")
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time as _time
+import unicodedata
+from abc import ABC, abstractmethod
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer
+
+from core.texto import plegar_acentos
+
+logger = logging.getLogger(__name__)
+
+# ───────────────────────── Configuración ──────────────────────────
+EMBEDDINGS_DIR      = Path(os.getenv("EMBEDDINGS_DIR", "models/embeddings"))
+EMBEDDINGS_PROVIDER = os.getenv("EMBEDDINGS_PROVIDER", "openai").lower()   # openai | hashing
+EMBEDDINGS_MODEL    = os.getenv("EMBEDDINGS_MODEL", "text-embedding-3-small")
+EMBEDDINGS_LOTE     = int(os.getenv("EMBEDDINGS_LOTE", "256"))            # textos por llamada
+HASHING_DIM         = int(os.getenv("EMBEDDINGS_HASHING_DIM", "512"))
+RELOAD_SECONDS      = float(os.getenv("EMBEDDINGS_RELOAD_SECONDS", "5"))
+CACHE_ACTIVA        = os.getenv("EMBEDDINGS_CACHE", "1") == "1"
+CACHE_DIR           = Path(os.getenv("EMBEDDINGS_CACHE_DIR", ".cache/embeddings"))
+
+NOMBRE_INDICE = "catalogo"
+TIPOS = {"servicio": 1, "producto": 2}
+_TIPO_DE = {v: k for k, v in TIPOS.items()}
+
+__all__ = [
+    "Embedder", "EmbedderHashing", "EmbedderOpenAI", "proveedor",
+    "CacheEmbeddings", "EmbedderEnCache", "cache_embeddings", "normalizar_texto", "clave_texto",
+    "Fila", "Resultado", "IndiceCatalogo", "filas_catalogo",
+    "sincronizar_catalogo", "indice_catalogo",
+]
+
+# ───────────────────────── Proveedores ────────────────────────────
+
+class Embedder(ABC):
+    """Texto → vector ``float32`` normalizado (producto punto = coseno)."""
+
+    modelo: str
+    dim: int
+
+    def __init__(self) -> None:
+        self.metricas: Counter[str] = Counter()      # llamadas, textos
+
+    @abstractmethod
+    def _calcular(self, textos: List[str]) -> np.ndarray:
+        """Una llamada al proveedor para *textos* (ya en lotes)."""
+
+    def embed(self, textos: Sequence[str], lote: int = EMBEDDINGS_LOTE) -> np.ndarray:
+        textos = list(textos)
+        if not textos:
+            return np.zeros((0, self.dim), dtype="float32")
+        partes = []
+        for i in range(0, len(textos), lote):
+            partes.append(self._calcular(textos[i:i + lote]))
+            self.metricas["llamadas"] += 1
+            self.metricas["textos"] += len(textos[i:i + lote])
+        vectores = np.ascontiguousarray(np.vstack(partes), dtype="float32")
+        faiss.normalize_L2(vectores)
+        return vectores
+
+
+class EmbedderHashing(Embedder):
+    """N‑gramas de caracteres con *hashing*: sin red, sin estado, determinista."""
+
+    def __init__(self, dim: int = HASHING_DIM) -> None:
+        super().__init__()
+        self.dim = dim
+        self.modelo = f"hashing-char35-{dim}"
+        self._vectorizador = HashingVectorizer(
+            n_features=dim, analyzer="char_wb", ngram_range=(3, 5),
+            preprocessor=lambda t: plegar_acentos(t.lower()), norm=None,
+        )
+
+    def _calcular(self, textos: List[str]) -> np.ndarray:
+        return self._vectorizador.transform(textos).toarray().astype("float32")
+
+
+class EmbedderOpenAI(Embedder):
+    """API de embeddings de OpenAI con el cliente compartido de ``core.llm_gateway``."""
+
+    _DIMENSIONES = {"text-embedding-3-small": 1536, "text-embedding-3-large": 3072,
+                    "text-embedding-ada-002": 1536}
+
+    def __init__(self, modelo: str = EMBEDDINGS_MODEL) -> None:
+        super().__init__()
+        self.modelo = modelo
+        self.dim = self._DIMENSIONES.get(modelo, 0)      # 0 → se conoce en la 1.ª llamada
+
+    def _calcular(self, textos: List[str]) -> np.ndarray:
+        from core.llm_gateway import llm
+
+        respuesta = llm.cliente.embeddings.create(model=self.modelo, input=textos)
+        vectores = np.array([d.embedding for d in sorted(respuesta.data, key=lambda d: d.index)], dtype="float32")
+        self.dim = vectores.shape[1]
+        return vectores
+
+
+# ───────────────────────── Caché de vectores ──────────────────────
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS modelos (
+    modelo TEXT PRIMARY KEY,
+    dim    INTEGER NOT NULL,
+    filas  INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS vectores (
+    modelo TEXT NOT NULL,
+    clave  BLOB NOT NULL,
+    fila   INTEGER NOT NULL,
+    PRIMARY KEY (modelo, clave)
+) WITHOUT ROWID;
+"""
+_MAX_VARIABLES = 500            # claves por SELECT … IN (…)
+_NO_ARCHIVO = re.compile(r"[^\w.-]")
+
+
+def normalizar_texto(texto: str) -> str:
+    """Forma canónica que se envía al proveedor y se usa de clave: NFC y
+    espacios colapsados (mayúsculas y acentos sí cambian el vector)."""
+    return " ".join(unicodedata.normalize("NFC", texto).split())
+
+
+def clave_texto(texto: str) -> bytes:
+    """sha256 del texto ya normalizado (32 bytes)."""
+    return hashlib.sha256(texto.encode()).digest()
+
+
+class CacheEmbeddings:
+    """``(modelo, sha256) → vector float32`` compartida entre *workers* y reinicios.
+
+    Por modelo hay un archivo ``<modelo>.f32`` de filas contiguas que sólo
+    crece y se lee con ``np.memmap``; el índice clave → fila vive en
+    ``indice.sqlite3`` (WAL). Al guardar, el vector se escribe antes de
+    confirmar su fila en el índice: quien lee nunca ve una fila sin datos y
+    lo escrito tras una caída sin confirmar se sobrescribe en la siguiente.
+    """
+
+    def __init__(self, directorio: Path | str = CACHE_DIR) -> None:
+        self.directorio = Path(directorio)
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid = 0
+        self._matrices: Dict[str, np.memmap] = {}
+        self.metricas_: Counter[str] = Counter()
+
+    # ---------- helpers ----------
+    def _conexion(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            self.directorio.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.directorio / "indice.sqlite3", timeout=10,
+                                   check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_ESQUEMA)
+            self._conn, self._pid = conn, os.getpid()
+            self._matrices.clear()
+        return self._conn
+
+    def _ruta(self, modelo: str) -> Path:
+        return self.directorio / (_NO_ARCHIVO.sub("_", modelo) + ".f32")
+
+    @staticmethod
+    def _filas(conn: sqlite3.Connection, modelo: str, claves: List[bytes]) -> Dict[bytes, int]:
+        """clave → fila de las *claves* presentes (``IN`` por tramos)."""
+        filas: Dict[bytes, int] = {}
+        for i in range(0, len(claves), _MAX_VARIABLES):
+            parte = claves[i:i + _MAX_VARIABLES]
+            filas.update(conn.execute(
+                f"SELECT clave, fila FROM vectores WHERE modelo = ? "
+                f"AND clave IN ({','.join('?' * len(parte))})", (modelo, *parte),
+            ))
+        return filas
+
+    def _matriz(self, modelo: str, dim: int, filas: int) -> np.memmap:
+        """Vista ``mmap`` con al menos *filas* filas (se reabre si el archivo creció)."""
+        matriz = self._matrices.get(modelo)
+        if matriz is None or matriz.shape[0] < filas:
+            matriz = np.memmap(self._ruta(modelo), dtype="float32", mode="r", shape=(filas, dim))
+            self._matrices[modelo] = matriz
+        return matriz
+
+    # ---------- API ----------
+    def buscar(self, modelo: str, claves: Iterable[bytes]) -> Dict[bytes, np.ndarray]:
+        """Vectores guardados para *claves* (las que no están, no aparecen)."""
+        claves = list(dict.fromkeys(claves))
+        with self._lock:
+            conn = self._conexion()
+            filas = self._filas(conn, modelo, claves)
+            encontrados: Dict[bytes, np.ndarray] = {}
+            if filas:
+                dim, total = conn.execute("SELECT dim, filas FROM modelos WHERE modelo = ?", (modelo,)).fetchone()
+                orden = list(filas)
+                vectores = self._matriz(modelo, dim, total)[[filas[c] for c in orden]]
+                encontrados = dict(zip(orden, vectores))
+            self.metricas_["aciertos"] += len(encontrados)
+            self.metricas_["fallos"] += len(claves) - len(encontrados)
+            return encontrados
+
+    def guardar(self, modelo: str, claves: Sequence[bytes], vectores: np.ndarray) -> None:
+        """Agrega *vectores* (fila i ↔ clave i); las claves ya presentes se ignoran."""
+        vectores = np.ascontiguousarray(vectores, dtype="float32")
+        with self._lock:
+            conn = self._conexion()
+            conn.execute("BEGIN IMMEDIATE")                 # un escritor a la vez entre procesos
+            try:
+                fila = conn.execute("SELECT dim, filas FROM modelos WHERE modelo = ?", (modelo,)).fetchone()
+                dim, inicio = fila if fila else (vectores.shape[1], 0)
+                if dim != vectores.shape[1]:
+                    raise ValueError(f"{modelo}: la caché tiene dim {dim} y llegaron {vectores.shape[1]}")
+                unicas = {c: i for i, c in enumerate(claves)}     # clave → fila de *vectores*
+                existentes = self._filas(conn, modelo, list(unicas))
+                nuevas = [c for c in unicas if c not in existentes]
+                if nuevas:
+                    bloque = vectores[[unicas[c] for c in nuevas]]
+                    ruta = self._ruta(modelo)
+                    with open(ruta, "r+b" if ruta.exists() else "wb") as f:
+                        f.seek(inicio * dim * 4)
+                        f.write(bloque.tobytes())
+                        f.flush()
+                        os.fsync(f.fileno())
+                    conn.executemany(
+                        "INSERT INTO vectores (modelo, clave, fila) VALUES (?, ?, ?)",
+                        [(modelo, c, inicio + n) for n, c in enumerate(nuevas)],
+                    )
+                    conn.execute(
+                        "INSERT OR REPLACE INTO modelos (modelo, dim, filas) VALUES (?, ?, ?)",
+                        (modelo, dim, inicio + len(nuevas)),
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            self.metricas_["escrituras"] += len(nuevas)
+
+    def metricas(self) -> Dict[str, float]:
+        """Contadores del proceso + ``hit_ratio``."""
+        with self._lock:
+            m: Dict[str, float] = dict(self.metricas_)
+        total = m.get("aciertos", 0) + m.get("fallos", 0)
+        m["hit_ratio"] = m.get("aciertos", 0) / total if total else 0.0
+        return m
+
+
+cache_embeddings = CacheEmbeddings()
+
+
+class EmbedderEnCache(Embedder):
+    """Envuelve otro ``Embedder``: busca primero en ``CacheEmbeddings`` y sólo
+    manda al proveedor lo que falta (sin repetidos, en un solo lote).
+
+    ``metricas`` es la del proveedor envuelto: ``llamadas`` y ``textos``
+    cuentan sólo lo que de verdad salió a la API.
+    """
+
+    def __init__(self, base: Embedder, cache: Optional[CacheEmbeddings] = None) -> None:
+        self.base = base
+        self.cache = cache if cache is not None else cache_embeddings
+        self.metricas = base.metricas
+
+    @property
+    def modelo(self) -> str:          # type: ignore[override]
+        return self.base.modelo
+
+    @property
+    def dim(self) -> int:             # type: ignore[override]
+        return self.base.dim
+
+    def _calcular(self, textos: List[str]) -> np.ndarray:
+        return self.base._calcular(textos)
+
+    def embed(self, textos: Sequence[str], lote: int = EMBEDDINGS_LOTE) -> np.ndarray:
+        textos = [normalizar_texto(t) for t in textos]
+        if not textos:
+            return np.zeros((0, self.dim), dtype="float32")
+        claves = [clave_texto(t) for t in textos]
+        vectores = self.cache.buscar(self.modelo, claves)
+        faltan = {c: t for c, t in zip(claves, textos) if c not in vectores}
+        if faltan:
+            # Todo lo que falta en una llamada (hasta el tope de entradas de la API)
+            nuevos = self.base.embed(list(faltan.values()), lote=max(lote, min(len(faltan), 2048)))
+            self.cache.guardar(self.modelo, list(faltan), nuevos)
+            vectores.update(zip(faltan, nuevos))
+        return np.ascontiguousarray(np.vstack([vectores[c] for c in claves]), dtype="float32")
+
+
+def proveedor(nombre: str = EMBEDDINGS_PROVIDER) -> Embedder:
+    """Proveedor configurado (``EMBEDDINGS_PROVIDER``).
+
+    El de OpenAI va detrás de ``cache_embeddings`` (``EMBEDDINGS_CACHE=0`` lo
+    desactiva); el de *hashing* sale más barato recalcularlo que leerlo.
+    """
+    if nombre == "hashing":
+        return EmbedderHashing()
+    if nombre == "openai":
+        return EmbedderEnCache(EmbedderOpenAI()) if CACHE_ACTIVA else EmbedderOpenAI()
+    raise ValueError(f"EMBEDDINGS_PROVIDER desconocido: {nombre!r} (openai | hashing)")
+
+# ───────────────────────── Filas del catálogo ─────────────────────
+
+@dataclass(frozen=True)
+class Fila:
+    tipo: str           # "servicio" | "producto"
+    id: int
+    nombre: str
+    texto: str
+
+    @property
+    def clave(self) -> int:
+        return TIPOS[self.tipo] << 32 | self.id
+
+    @property
+    def huella(self) -> str:
+        return hashlib.sha256(self.texto.encode()).hexdigest()[:16]
+
+
+@dataclass(frozen=True)
+class Resultado:
+    tipo: str
+    id: int
+    nombre: str
+    score: float
+
+
+def _texto(nombre: str, categoria: str, detalles: Optional[str]) -> str:
+    partes = (nombre, categoria, detalles or "")
+    return ". ".join(" ".join(p.split()) for p in partes if p and p.strip())
+
+
+def filas_catalogo(session: Any, tipos: Iterable[str] = tuple(TIPOS)) -> List[Fila]:
+    """Servicios activos y productos actuales de la BD como ``Fila``."""
+    from sqlalchemy import or_
+
+    from db.models import Producto, Servicio
+
+    filas: List[Fila] = []
+    if "servicio" in tipos:
+        activos = or_(Servicio.activo.is_(None), Servicio.activo == True)  # noqa: E712
+        for s in session.query(Servicio).filter(activos):
+            filas.append(Fila("servicio", s.id, s.nombre, _texto(s.nombre, s.categoria, s.detalles)))
+    if "producto" in tipos:
+        for p in session.query(Producto):
+            filas.append(Fila("producto", p.id, p.nombre, _texto(p.nombre, p.categoria, p.detalles)))
+    return filas
+
+# ───────────────────────── Índice ─────────────────────────────────
+
+class IndiceCatalogo:
+    """``catalogo.faiss`` + ``catalogo.json``; búsqueda por coseno y altas/bajas incrementales."""
+
+    def __init__(
+        self,
+        directorio: Path | str = EMBEDDINGS_DIR,
+        embedder: Optional[Embedder] = None,
+        mmap: bool = True,
+        reload_seconds: float = RELOAD_SECONDS,
+        nombre: str = NOMBRE_INDICE,
+    ) -> None:
+        self.directorio = Path(directorio)
+        self.ruta_indice = self.directorio / f"{nombre}.faiss"
+        self.ruta_mapa = self.directorio / f"{nombre}.json"
+        self.mmap = mmap
+        self.reload_seconds = reload_seconds
+        self._embedder = embedder
+        self._lock = threading.Lock()
+        self._indice: Any = None
+        self._mapa: Dict[int, Dict[str, Any]] = {}
+        self._firma: Optional[Tuple[Tuple[int, int], ...]] = None
+        self._ultimo_chequeo = 0.0
+        self.version = 0
+        self.segundos_carga = 0.0
+
+    @property
+    def embedder(self) -> Embedder:
+        if self._embedder is None:
+            self._embedder = proveedor()
+        return self._embedder
+
+    # ---------- disco ----------
+    def _firma_archivos(self) -> Tuple[Tuple[int, int], ...]:
+        return tuple((r.stat().st_mtime_ns, r.stat().st_size) for r in (self.ruta_indice, self.ruta_mapa))
+
+    def _leer(self, mmap: bool) -> Tuple[Any, Dict[int, Dict[str, Any]]]:
+        with open(self.ruta_mapa, encoding="utf-8") as f:
+            datos = json.load(f)
+        if datos["modelo"] != self.embedder.modelo:
+            raise ValueError(
+                f"{self.ruta_indice.name} se construyó con {datos['modelo']!r} y el proveedor es "
+                f"{self.embedder.modelo!r}: hay que reconstruirlo"
+            )
+        indice = faiss.read_index(str(self.ruta_indice), faiss.IO_FLAG_MMAP if mmap else 0)
+        mapa = {int(k): v for k, v in datos["ids"].items()}
+        if indice.ntotal != len(mapa):      # pareja a medio escribir: se reintenta luego
+            raise ValueError(f"{self.ruta_indice.name}: {indice.ntotal} vectores y {len(mapa)} ids")
+        return indice, mapa
+
+    def _escribir(self, indice: Any, mapa: Dict[int, Dict[str, Any]]) -> None:
+        """Temporal + ``os.replace`` (índice primero, luego el mapa)."""
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        tmp_indice = self.ruta_indice.with_suffix(".faiss.tmp")
+        tmp_mapa = self.ruta_mapa.with_suffix(".json.tmp")
+        faiss.write_index(indice, str(tmp_indice))
+        with open(tmp_mapa, "w", encoding="utf-8") as f:
+            json.dump({"modelo": self.embedder.modelo, "dim": indice.d,
+                       "ids": {str(k): v for k, v in mapa.items()}}, f, ensure_ascii=False)
+        os.replace(tmp_indice, self.ruta_indice)
+        os.replace(tmp_mapa, self.ruta_mapa)
+
+    # ---------- lectura ----------
+    def cargar(self) -> bool:
+        """Abre el índice del disco (``mmap``); ``False`` si no existe o no valida."""
+        with self._lock:
+            self._ultimo_chequeo = _time.monotonic()
+            try:
+                firma = self._firma_archivos()
+                if firma == self._firma and self._indice is not None:
+                    return True
+                t0 = _time.perf_counter()
+                indice, mapa = self._leer(self.mmap)
+            except FileNotFoundError:
+                return self._indice is not None
+            except Exception as e:
+                logger.error("❌ Índice del catálogo no cargado, se mantiene el previo: %s", e)
+                return self._indice is not None
+            self._indice, self._mapa, self._firma = indice, mapa, firma
+            self.version += 1
+            self.segundos_carga = _time.perf_counter() - t0
+            if self.version > 1:
+                logger.info("🔄 Índice del catálogo recargado (v%d, %d vectores)", self.version, indice.ntotal)
+            return True
+
+    def _vigente(self) -> Tuple[Any, Dict[int, Dict[str, Any]]]:
+        if self._indice is None or _time.monotonic() - self._ultimo_chequeo >= self.reload_seconds:
+            self.cargar()
+        return self._indice, self._mapa
+
+    def buscar(self, texto: str, k: int = 5, tipo: Optional[str] = None) -> List[Resultado]:
+        """Las *k* filas más parecidas a *texto* (opcionalmente de un solo *tipo*)."""
+        indice, mapa = self._vigente()
+        if indice is None or indice.ntotal == 0:
+            return []
+        consulta = self.embedder.embed([texto])
+        params = None
+        if tipo is not None:
+            t = TIPOS[tipo]
+            params = faiss.SearchParameters(sel=faiss.IDSelectorRange(t << 32, (t + 1) << 32))
+        scores, ids = indice.search(consulta, min(k, indice.ntotal), params=params)
+        resultados = []
+        for score, clave in zip(scores[0], ids[0]):
+            meta = mapa.get(int(clave))
+            if clave < 0 or meta is None:
+                continue
+            resultados.append(Resultado(_TIPO_DE[int(clave) >> 32], int(clave) & 0xFFFFFFFF,
+                                        meta["nombre"], float(score)))
+        return resultados
+
+    # ---------- escritura ----------
+    def sincronizar(self, filas: Iterable[Fila], tipos: Optional[Iterable[str]] = None) -> Dict[str, int]:
+        """Deja el índice igual a *filas* para los *tipos* dados (por defecto los de *filas*).
+
+        Sólo se calculan vectores de filas nuevas o cuyo texto cambió; las
+        claves de esos tipos que ya no vienen se eliminan. Escribe a disco y
+        recarga la vista de búsqueda.
+        """
+        filas = list(filas)
+        tipos = set(tipos) if tipos is not None else {f.tipo for f in filas}
+        try:
+            indice, mapa = self._leer(mmap=False)           # copia propia, escribible
+        except FileNotFoundError:
+            indice, mapa = None, {}
+
+        vigentes = {f.clave: f for f in filas}
+        cambiadas = [f for f in filas if mapa.get(f.clave, {}).get("huella") != f.huella]
+        sobran = [c for c, m in mapa.items() if m["tipo"] in tipos and c not in vigentes]
+        cambios = {
+            "agregados": sum(f.clave not in mapa for f in cambiadas),
+            "actualizados": sum(f.clave in mapa for f in cambiadas),
+            "eliminados": len(sobran),
+            "sin_cambios": len(filas) - len(cambiadas),
+        }
+        if not cambiadas and not sobran and indice is not None:
+            return cambios
+
+        vectores = self.embedder.embed([f.texto for f in cambiadas])
+        if indice is None:
+            indice = faiss.IndexIDMap2(faiss.IndexFlatIP(self.embedder.dim))
+        quitar = sobran + [f.clave for f in cambiadas if f.clave in mapa]
+        if quitar:
+            indice.remove_ids(np.array(quitar, dtype="int64"))
+            for c in sobran:
+                del mapa[c]
+        if cambiadas:
+            indice.add_with_ids(vectores, np.array([f.clave for f in cambiadas], dtype="int64"))
+            for f in cambiadas:
+                mapa[f.clave] = {"tipo": f.tipo, "id": f.id, "nombre": f.nombre, "huella": f.huella}
+        self._escribir(indice, mapa)
+        self.cargar()
+        return cambios
+
+    def reporte(self) -> Dict[str, Any]:
+        indice = self._indice
+        return {
+            "modelo": self.embedder.modelo,
+            "vectores": indice.ntotal if indice is not None else 0,
+            "version": self.version,
+            "segundos_carga": round(self.segundos_carga, 4),
+            "bytes_disco": self.ruta_indice.stat().st_size if self.ruta_indice.exists() else 0,
+        }
+
+
+indice_catalogo = IndiceCatalogo()
+
+
+def sincronizar_catalogo(session: Any, tipos: Iterable[str] = tuple(TIPOS)) -> Dict[str, int]:
+    """Refleja en ``indice_catalogo`` el estado actual de la BD para *tipos*."""
+    tipos = tuple(tipos)
+    return indice_catalogo.sincronizar(filas_catalogo(session, tipos), tipos=tipos)
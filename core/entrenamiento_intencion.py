@@ -0,0 +1,250 @@
+# core/entrenamiento_intencion.py
+"""Reentrenamiento incremental (*out‑of‑core*) del modelo de intención.
+
+Flujo:
+    chat_history (por páginas) → ejemplos ``(texto, intención)`` → lotes →
+    ``HashingVectorizer`` (sin vocabulario en memoria) →
+    ``SGDClassifier.partial_fit`` → artefacto versionado en ``models/``.
+
+👀 Responsabilidades:
+    - Leer el historial en páginas (nunca la colección entera en memoria) y
+      quedarse con los mensajes de usuario etiquetados (campo extra
+      ``intent`` de ``save_message``; incluye lo que resolvió el LLM).
+    - Reservar ~1/``HOLDOUT`` de los textos (hash estable) para evaluar.
+    - Medir, sobre esa reserva y sólo con textos que no atrapan las reglas,
+      qué fracción caería al LLM con el modelo vigente y con el nuevo, y el
+      acierto de las respuestas que sí se queda el nivel local.
+    - Publicar ``versiones/modelo_intencion-<version>.pkl`` (+ ``.json`` con
+      el reporte) y apuntar ``versiones/modelo_intencion.actual`` a ella con
+      ``os.replace``; ``core.model_registry`` la recarga en caliente.
+      ``versiones/`` no se versiona: el ``modelo_intencion.pkl`` del repo no
+      se toca y sigue de respaldo si no hay nada publicado.
+    - Continuar desde la última versión: ``partial_fit`` sólo con mensajes
+      posteriores a su marca de agua (``hasta``).
+
+Las etiquetas salen del campo ``intent`` que se guarde con
+``firebase.history.save_message(..., intent=...)``; sin mensajes etiquetados
+no hay lotes y no se publica nada.
+
+Uso:
+    python -m scripts.entrenar_intencion --continuar
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import zlib
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import joblib
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import SGDClassifier
+from sklearn.pipeline import Pipeline
+
+from core.message_predictor import ALLOWED_INTENTS, ML_THRESHOLD, _RULES, _etiqueta_pkl
+from core.model_registry import MODELS_DIR, VERSIONES, ruta_puntero
+from core.texto import normalizar, plegar_acentos
+
+logger = logging.getLogger(__name__)
+
+# ───────────────────────── Configuración ──────────────────────────
+TAM_PAGINA = int(os.getenv("ENTRENAMIENTO_PAGINA", "200"))      # documentos por lectura
+TAM_LOTE   = int(os.getenv("ENTRENAMIENTO_LOTE", "2000"))       # ejemplos por partial_fit
+BITS       = int(os.getenv("ENTRENAMIENTO_BITS", "18"))         # 2**BITS columnas hash
+MAX_EVAL   = int(os.getenv("ENTRENAMIENTO_MAX_EVAL", "20000"))  # tope de la reserva
+HOLDOUT    = 10                                                  # 1 de cada 10 textos
+
+NOMBRE         = "modelo_intencion"
+ETIQUETA_CAMPOS = ("intent", "intencion")
+
+Ejemplo = Tuple[str, str, Optional[datetime]]     # (texto, intención, timestamp)
+
+__all__ = [
+    "Reporte", "documentos_firestore", "ejemplos", "nuevo_modelo",
+    "entrenar", "evaluar", "publicar", "ultima_version",
+]
+
+# ───────────────────────── Fuente de datos ────────────────────────
+
+def documentos_firestore(tam_pagina: int = TAM_PAGINA) -> Iterator[Dict[str, Any]]:
+    """Un ``{"messages": [...]}`` por usuario de ``chat_history``.
+
+    Los usuarios se recorren en páginas de *tam_pagina* y sus mensajes con
+    ``firebase.history.iterar_historial``, así que nada se carga completo en
+    memoria. Usa el backend configurado (``HISTORIAL_BACKEND``).
+    """
+    from firebase.almacen import almacen
+    from firebase.history import COLLECTION, iterar_historial
+
+    for user_id in almacen().usuarios(COLLECTION, tam_pagina):
+        yield {"messages": iterar_historial(user_id, tam_pagina)}
+
+
+def _utc(ts: Any) -> Optional[datetime]:
+    if not isinstance(ts, datetime):
+        return None
+    return ts if ts.tzinfo is not None else ts.replace(tzinfo=timezone.utc)
+
+
+def ejemplos(
+    documentos: Iterable[Dict[str, Any]], desde: Optional[datetime] = None
+) -> Iterator[Ejemplo]:
+    """Mensajes de usuario con intención válida (posteriores a *desde*)."""
+    desde = _utc(desde)
+    for doc in documentos:
+        for m in doc.get("messages", []):
+            if m.get("role") != "user" or not m.get("content"):
+                continue
+            etiqueta = next((m[c] for c in ETIQUETA_CAMPOS if m.get(c)), None)
+            if etiqueta not in ALLOWED_INTENTS:
+                continue
+            ts = _utc(m.get("timestamp"))
+            if desde is not None and (ts is None or ts <= desde):
+                continue
+            yield m["content"].lower().strip(), etiqueta, ts
+
+
+def _es_reserva(texto: str) -> bool:
+    return zlib.crc32(normalizar(texto).encode()) % HOLDOUT == 0
+
+# ───────────────────────── Modelo ─────────────────────────────────
+
+def nuevo_modelo() -> Pipeline:
+    """``HashingVectorizer`` (sin estado) + SGD logístico (tiene ``predict_proba``)."""
+    return Pipeline([
+        ("hashing", HashingVectorizer(
+            n_features=2 ** BITS, alternate_sign=False, ngram_range=(1, 2),
+            preprocessor=plegar_acentos, norm="l2",
+        )),
+        ("sgd", SGDClassifier(loss="log_loss", alpha=1e-5, random_state=0)),
+    ])
+
+
+@dataclass
+class Reporte:
+    """Resultado de una corrida (se guarda junto al artefacto)."""
+    ejemplos: int = 0
+    lotes: int = 0
+    evaluados: int = 0
+    fallback_antes: float = 1.0      # fracción que iría al LLM con el modelo vigente
+    fallback_despues: float = 1.0    # … y con el nuevo
+    acierto_antes: float = 0.0       # acierto de las respuestas locales confiadas
+    acierto_despues: float = 0.0
+    hasta: Optional[str] = None      # marca de agua (ISO) para continuar
+
+    @property
+    def mejora(self) -> bool:
+        return self.fallback_despues < self.fallback_antes and self.acierto_despues >= self.acierto_antes - 0.02
+
+
+def evaluar(modelo: Any, textos: List[str], etiquetas: List[str]) -> Tuple[float, float]:
+    """``(fallback, acierto)`` con el mismo criterio que la cascada.
+
+    Cae al LLM lo que queda bajo ``ML_THRESHOLD`` o con etiqueta sin mapeo.
+    """
+    if not textos:
+        return 0.0, 0.0
+    if modelo is None:
+        return 1.0, 0.0
+    proba = modelo.predict_proba(textos)
+    idx = np.argmax(proba, axis=1)
+    locales = aciertos = 0
+    for fila, esperado in enumerate(etiquetas):
+        intent = _etiqueta_pkl(str(modelo.classes_[idx[fila]]))
+        if intent is not None and proba[fila, idx[fila]] >= ML_THRESHOLD:
+            locales += 1
+            aciertos += intent == esperado
+    return 1 - locales / len(textos), (aciertos / locales if locales else 0.0)
+
+
+def entrenar(
+    datos: Iterable[Ejemplo],
+    previo: Optional[Pipeline] = None,
+    vigente: Any = None,
+    lote: int = TAM_LOTE,
+) -> Tuple[Pipeline, Reporte]:
+    """``partial_fit`` por lotes sobre *datos*; *vigente* es la línea base.
+
+    *previo* (un pipeline de ``nuevo_modelo`` ya entrenado) se sigue
+    ajustando en lugar de empezar de cero.
+    """
+    modelo = previo if previo is not None else nuevo_modelo()
+    vect, clf = modelo.steps[0][1], modelo.steps[-1][1]
+    clases = np.array(ALLOWED_INTENTS)
+    if hasattr(clf, "classes_") and list(clf.classes_) != sorted(ALLOWED_INTENTS):
+        raise ValueError("El modelo previo tiene otras clases; entrena uno nuevo")
+
+    reporte = Reporte()
+    eval_textos: List[str] = []
+    eval_etiquetas: List[str] = []
+    textos: List[str] = []
+    etiquetas: List[str] = []
+    hasta: Optional[datetime] = None
+
+    def ajustar() -> None:
+        clf.partial_fit(vect.transform(textos), etiquetas, classes=clases)
+        reporte.lotes += 1
+        textos.clear()
+        etiquetas.clear()
+
+    for texto, etiqueta, ts in datos:
+        if ts is not None and (hasta is None or ts > hasta):
+            hasta = ts
+        if _es_reserva(texto):
+            # sólo cuenta lo que llega al nivel pkl (las reglas no lo atrapan)
+            if len(eval_textos) < MAX_EVAL and _RULES.buscar(plegar_acentos(texto)) is None:
+                eval_textos.append(texto)
+                eval_etiquetas.append(etiqueta)
+            continue
+        textos.append(texto)
+        etiquetas.append(etiqueta)
+        reporte.ejemplos += 1
+        if len(textos) >= lote:
+            ajustar()
+    if textos:
+        ajustar()
+
+    reporte.evaluados = len(eval_textos)
+    reporte.hasta = hasta.isoformat() if hasta else None
+    reporte.fallback_antes, reporte.acierto_antes = evaluar(vigente, eval_textos, eval_etiquetas)
+    if reporte.lotes:
+        reporte.fallback_despues, reporte.acierto_despues = evaluar(modelo, eval_textos, eval_etiquetas)
+    else:
+        reporte.fallback_despues, reporte.acierto_despues = reporte.fallback_antes, reporte.acierto_antes
+    return modelo, reporte
+
+# ───────────────────────── Artefactos ─────────────────────────────
+
+def publicar(modelo: Pipeline, reporte: Reporte, directorio: Path | str = MODELS_DIR) -> Path:
+    """Guarda la versión en ``versiones/`` y la activa moviendo el puntero
+    con un ``rename`` atómico (el ``.pkl`` del repo no se toca)."""
+    directorio = Path(directorio)
+    versiones = directorio / VERSIONES
+    versiones.mkdir(parents=True, exist_ok=True)
+    version = datetime.now().strftime("%Y%m%d%H%M%S")
+    ruta = versiones / f"{NOMBRE}-{version}.pkl"
+    joblib.dump(modelo, ruta)                    # sin compresión: admite mmap
+    ruta.with_suffix(".json").write_text(
+        json.dumps({"version": version, **asdict(reporte)}, indent=2)
+    )
+    puntero = ruta_puntero(directorio, NOMBRE)
+    tmp = puntero.with_suffix(".actual.tmp")
+    tmp.write_text(ruta.name)
+    os.replace(tmp, puntero)
+    logger.info("📦 %s publicado (%s)", NOMBRE, ruta.name)
+    return ruta
+
+
+def ultima_version(directorio: Path | str = MODELS_DIR) -> Tuple[Optional[Pipeline], Optional[datetime]]:
+    """Último artefacto SGD publicado y su marca de agua (para continuar)."""
+    rutas = sorted((Path(directorio) / VERSIONES).glob(f"{NOMBRE}-*.pkl"))
+    if not rutas:
+        return None, None
+    meta = json.loads(rutas[-1].with_suffix(".json").read_text())
+    hasta = datetime.fromisoformat(meta["hasta"]) if meta.get("hasta") else None
+    return joblib.load(rutas[-1]), hasta
@@ -8,6 +8,7 @@ def cargar_servicios():
         servicios = session.query(Servicio).filter(Servicio.activo == True).all()
         return [
             {
+                "Id": s.id,
                 "Categoria": s.categoria,
                 "Nombre": s.nombre,
                 "Duracion": s.duracion_txt,
@@ -0,0 +1,167 @@
+# core/llm_cache.py
+"""Caché persistente de clasificaciones del LLM (SQLite en disco + LRU en memoria).
+
+👀 Responsabilidades:
+    - Compartir entre *workers* de gunicorn y entre reinicios las respuestas
+      del LLM para una misma frase: un archivo SQLite (WAL) local.
+    - Responder lo más frecuente sin tocar el disco: LRU pequeño por proceso
+      delante del SQLite.
+    - Claves normalizadas (``core.texto.normalizar``) + nombre del modelo:
+      cambiar ``LLM_INTENT_MODEL`` deja de encontrar las entradas viejas.
+    - Caducar por TTL y acotar el tamaño (se desalojan las menos usadas).
+    - Contar aciertos / fallos (``metricas``).
+
+Nota:
+    - La conexión se abre perezosamente y se reabre tras un ``fork`` (los
+      *workers* no heredan el descriptor del proceso maestro).
+"""
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time as _time
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from core.texto import normalizar
+
+# ───────────────────────── Configuración ──────────────────────────
+CACHE_PATH     = os.getenv("LLM_CACHE_PATH", ".cache/llm_intent_cache.sqlite3")
+CACHE_TTL      = float(os.getenv("LLM_CACHE_TTL", str(30 * 24 * 3600)))   # s
+CACHE_MAX      = int(os.getenv("LLM_CACHE_MAX", "50000"))                 # filas
+CACHE_FRONT    = int(os.getenv("LLM_CACHE_FRONT", "512"))                 # en memoria
+PODA_CADA      = 256            # escrituras entre podas (TTL + tamaño)
+
+__all__ = ["CacheLLM"]
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS llm_cache (
+    modelo   TEXT NOT NULL,
+    clave    TEXT NOT NULL,
+    etiqueta TEXT NOT NULL,
+    creado   REAL NOT NULL,
+    usado    REAL NOT NULL,
+    PRIMARY KEY (modelo, clave)
+);
+CREATE INDEX IF NOT EXISTS ix_llm_cache_usado ON llm_cache (usado);
+"""
+
+
+class CacheLLM:
+    """Caché ``(modelo, texto normalizado) → etiqueta`` con TTL y tope de tamaño."""
+
+    def __init__(
+        self,
+        modelo: str,
+        path: str | Path = CACHE_PATH,
+        ttl: float = CACHE_TTL,
+        max_entradas: int = CACHE_MAX,
+        front: int = CACHE_FRONT,
+    ) -> None:
+        self.modelo = modelo
+        self.path = str(path)
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self.front = front
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid = 0
+        self._memoria: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._escrituras = 0
+        self.metricas_: Counter[str] = Counter()
+
+    # ---------- helpers ----------
+    def _conexion(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            if self.path != ":memory:":
+                Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_ESQUEMA)
+            self._conn, self._pid = conn, os.getpid()
+            self._memoria.clear()
+        return self._conn
+
+    def _recordar(self, clave: str, etiqueta: str, creado: float) -> None:
+        self._memoria[clave] = (etiqueta, creado)
+        self._memoria.move_to_end(clave)
+        while len(self._memoria) > self.front:
+            self._memoria.popitem(last=False)
+
+    def _podar(self, conn: sqlite3.Connection, ahora: float) -> None:
+        borradas = conn.execute(
+            "DELETE FROM llm_cache WHERE creado < ?", (ahora - self.ttl,)
+        ).rowcount
+        exceso = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0] - self.max_entradas
+        if exceso > 0:
+            borradas += conn.execute(
+                "DELETE FROM llm_cache WHERE rowid IN "
+                "(SELECT rowid FROM llm_cache ORDER BY usado LIMIT ?)",
+                (exceso,),
+            ).rowcount
+        self.metricas_["desalojos"] += borradas
+
+    # ---------- API ----------
+    def obtener(self, text: str) -> Optional[str]:
+        """Etiqueta guardada para *text* (o ``None`` si no hay / caducó)."""
+        clave = normalizar(text)
+        ahora = _time.time()
+        with self._lock:
+            conn = self._conexion()
+            en_memoria = self._memoria.get(clave)
+            if en_memoria is not None and ahora - en_memoria[1] < self.ttl:
+                self._memoria.move_to_end(clave)
+                self.metricas_["hits_memoria"] += 1
+                return en_memoria[0]
+            row = conn.execute(
+                "SELECT etiqueta, creado FROM llm_cache WHERE modelo = ? AND clave = ?",
+                (self.modelo, clave),
+            ).fetchone()
+            if row is None or ahora - row[1] >= self.ttl:
+                self.metricas_["misses"] += 1
+                return None
+            conn.execute(
+                "UPDATE llm_cache SET usado = ? WHERE modelo = ? AND clave = ?",
+                (ahora, self.modelo, clave),
+            )
+            conn.commit()
+            self._recordar(clave, row[0], row[1])
+            self.metricas_["hits_disco"] += 1
+            return row[0]
+
+    def guardar(self, text: str, etiqueta: str) -> None:
+        clave = normalizar(text)
+        ahora = _time.time()
+        with self._lock:
+            conn = self._conexion()
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (modelo, clave, etiqueta, creado, usado) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (self.modelo, clave, etiqueta, ahora, ahora),
+            )
+            self._escrituras += 1
+            if self._escrituras % PODA_CADA == 0:
+                self._podar(conn, ahora)
+            conn.commit()
+            self._recordar(clave, etiqueta, ahora)
+            self.metricas_["escrituras"] += 1
+
+    def limpiar(self) -> None:
+        """Borra todo (memoria y disco)."""
+        with self._lock:
+            conn = self._conexion()
+            conn.execute("DELETE FROM llm_cache")
+            conn.commit()
+            self._memoria.clear()
+
+    def metricas(self) -> Dict[str, float]:
+        """Contadores del proceso + ``hit_ratio``."""
+        with self._lock:
+            m: Dict[str, float] = dict(self.metricas_)
+        hits = m.get("hits_memoria", 0) + m.get("hits_disco", 0)
+        total = hits + m.get("misses", 0)
+        m["hit_ratio"] = hits / total if total else 0.0
+        return m
@@ -0,0 +1,225 @@
+# core/llm_gateway.py
+"""Capa común de llamadas al LLM (OpenAI) para toda la cascada.
+
+👀 Responsabilidades:
+    - *Single‑flight*: peticiones idénticas en vuelo (mismo modelo, mensajes y
+      parámetros) comparten **una** llamada; el resto espera su resultado.
+    - Plazo por llamada: si no hay respuesta a tiempo se devuelve ``None`` y
+      quien llama usa su respaldo ("otro", lista vacía…); nunca se bloquea
+      un *worker* de Flask indefinidamente.
+    - Concurrencia acotada con un semáforo (``LLM_MAX_CONCURRENCIA``).
+    - Variante ``asyncio`` (``achat``) con las mismas garantías.
+    - Métricas: llamadas, coalescidas, timeouts, errores, saturado.
+
+Uso:
+    texto = llm.chat([{"role": "user", "content": "..."}], max_tokens=15)
+    if texto is None:
+        ...  # respaldo
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time as _time
+import weakref
+from collections import Counter
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from openai import AsyncOpenAI, OpenAI
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# ───────────────────────── Configuración ──────────────────────────
+LLM_TIMEOUT          = float(os.getenv("LLM_TIMEOUT", "8"))           # s por llamada
+LLM_MAX_CONCURRENCIA = int(os.getenv("LLM_MAX_CONCURRENCIA", "16"))   # por proceso
+LLM_BASE_URL         = os.getenv("OPENAI_BASE_URL") or None
+
+__all__ = ["LLMGateway", "llm"]
+
+
+def _clave(model: str, messages: List[Dict[str, str]], params: Dict[str, Any]) -> str:
+    crudo = json.dumps([model, messages, params], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(crudo.encode()).hexdigest()
+
+
+class LLMGateway:
+    """Cliente OpenAI compartido con *single‑flight*, plazo y semáforo."""
+
+    def __init__(
+        self,
+        cliente: Optional[OpenAI] = None,
+        cliente_async: Optional[AsyncOpenAI] = None,
+        timeout: float = LLM_TIMEOUT,
+        max_concurrencia: int = LLM_MAX_CONCURRENCIA,
+    ) -> None:
+        self._cliente = cliente
+        self._cliente_async = cliente_async
+        self.timeout = timeout
+        self.max_concurrencia = max_concurrencia
+        self._lock = threading.Lock()
+        self._semaforo = threading.BoundedSemaphore(max_concurrencia)
+        self._en_vuelo: Dict[str, Future] = {}
+        # asyncio: futuros y semáforo por event loop
+        self._por_loop: "weakref.WeakKeyDictionary[Any, Tuple[Dict[str, asyncio.Future], asyncio.Semaphore]]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self.metricas: Counter[str] = Counter()
+
+    # ---------- clientes (perezosos: no exigen API key al importar) ----------
+    @property
+    def cliente(self) -> OpenAI:
+        if self._cliente is None:
+            self._cliente = OpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"), base_url=LLM_BASE_URL, max_retries=0
+            )
+        return self._cliente
+
+    @property
+    def cliente_async(self) -> AsyncOpenAI:
+        if self._cliente_async is None:
+            self._cliente_async = AsyncOpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"), base_url=LLM_BASE_URL, max_retries=0
+            )
+        return self._cliente_async
+
+    def _contar(self, nombre: str) -> None:
+        with self._lock:
+            self.metricas[nombre] += 1
+
+    # ---------- síncrono ----------
+    def chat(
+        self,
+        messages: List[Dict[str, str]],
+        *,
+        model: str = "gpt-3.5-turbo",
+        timeout: Optional[float] = None,
+        **params: Any,
+    ) -> Optional[str]:
+        """Contenido de la respuesta, o ``None`` si venció el plazo / hubo error."""
+        plazo = _time.monotonic() + (self.timeout if timeout is None else timeout)
+        clave = _clave(model, messages, params)
+        with self._lock:
+            futuro = self._en_vuelo.get(clave)
+            lider = futuro is None
+            if lider:
+                futuro = self._en_vuelo[clave] = Future()
+            else:
+                self.metricas["coalescidas"] += 1
+
+        if not lider:
+            try:
+                return futuro.result(timeout=max(0.0, plazo - _time.monotonic()))
+            except FutureTimeout:
+                self._contar("timeouts")
+                return None
+
+        resultado: Optional[str] = None
+        try:
+            resultado = self._llamar(messages, model, plazo, params)
+        finally:
+            with self._lock:
+                self._en_vuelo.pop(clave, None)
+            futuro.set_result(resultado)
+        return resultado
+
+    def _llamar(
+        self, messages: List[Dict[str, str]], model: str, plazo: float, params: Dict[str, Any]
+    ) -> Optional[str]:
+        if not self._semaforo.acquire(timeout=max(0.0, plazo - _time.monotonic())):
+            self._contar("saturado")
+            return None
+        try:
+            restante = plazo - _time.monotonic()
+            if restante <= 0:
+                self._contar("timeouts")
+                return None
+            self._contar("llamadas")
+            resp = self.cliente.chat.completions.create(
+                model=model, messages=messages, timeout=restante, **params
+            )
+            return resp.choices[0].message.content
+        except Exception as e:          # timeout de red, 5xx, respuesta rara…
+            self._contar("timeouts" if _time.monotonic() >= plazo else "errores")
+            logger.warning("LLM sin respuesta (%s): %s", model, e)
+            return None
+        finally:
+            self._semaforo.release()
+
+    # ---------- asyncio ----------
+    def _estado_loop(self) -> Tuple[Dict[str, asyncio.Future], asyncio.Semaphore]:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            estado = self._por_loop.get(loop)
+            if estado is None:
+                estado = self._por_loop[loop] = ({}, asyncio.Semaphore(self.max_concurrencia))
+        return estado
+
+    async def achat(
+        self,
+        messages: List[Dict[str, str]],
+        *,
+        model: str = "gpt-3.5-turbo",
+        timeout: Optional[float] = None,
+        **params: Any,
+    ) -> Optional[str]:
+        """Versión ``async`` de ``chat`` (mismo *single‑flight*, plazo y tope)."""
+        limite = self.timeout if timeout is None else timeout
+        plazo = _time.monotonic() + limite
+        clave = _clave(model, messages, params)
+        en_vuelo, semaforo = self._estado_loop()
+
+        futuro = en_vuelo.get(clave)
+        if futuro is not None:
+            self._contar("coalescidas")
+            try:
+                return await asyncio.wait_for(asyncio.shield(futuro), max(0.0, limite))
+            except asyncio.TimeoutError:
+                self._contar("timeouts")
+                return None
+
+        futuro = en_vuelo[clave] = asyncio.get_running_loop().create_future()
+        resultado: Optional[str] = None
+        try:
+            resultado = await asyncio.wait_for(
+                self._allamar(semaforo, messages, model, plazo, params), max(0.0, limite)
+            )
+        except asyncio.TimeoutError:
+            self._contar("timeouts")
+        finally:
+            en_vuelo.pop(clave, None)
+            futuro.set_result(resultado)
+        return resultado
+
+    async def _allamar(
+        self,
+        semaforo: asyncio.Semaphore,
+        messages: List[Dict[str, str]],
+        model: str,
+        plazo: float,
+        params: Dict[str, Any],
+    ) -> Optional[str]:
+        async with semaforo:
+            self._contar("llamadas")
+            try:
+                resp = await self.cliente_async.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    timeout=max(0.001, plazo - _time.monotonic()),
+                    **params,
+                )
+                return resp.choices[0].message.content
+            except Exception as e:
+                self._contar("errores")
+                logger.warning("LLM sin respuesta (%s): %s", model, e)
+                return None
+
+
+llm = LLMGateway()
@@ -2,7 +2,7 @@
 =================================
 Clasifica un mensaje entrante mediante una **cascada de tres niveles**:
 
-1. Reglas rápidas (regex) – µs, sin costo.
+1. Reglas rápidas (una sola regex compilada, texto sin acentos) – µs, sin costo.
 2. Modelo ligero (scikit‑learn pkl) – ms, 100 % local.
 3. LLM (GPT‑3.5‑turbo o similar) – sólo si la confianza del paso 2 < umbral.
 
@@ -13,14 +13,21 @@ from __future__ import annotations
 import os
 import re
 import json
-from functools import lru_cache
-from pathlib import Path
-from typing import Literal, Tuple, Dict, cast, get_args
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Literal, Tuple, Dict, List, Optional, Sequence, cast, get_args
 
-import joblib
 import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+from sklearn.preprocessing import normalize
 from dotenv import load_dotenv
-from openai import OpenAI
+from core.llm_cache import CacheLLM
+from core.llm_gateway import llm
+from core.model_registry import ModeloCargado, registro
+from core.texto import normalizar, plegar_acentos
 
 # ───────────────────────── Configuración ──────────────────────────
 load_dotenv()
@@ -31,8 +38,10 @@ if not OPENAI_API_KEY:
 LLM_MODEL       = os.getenv("LLM_INTENT_MODEL", "gpt-3.5-turbo")
 LLM_CONFIDENCE  = 0.90   # confianza fija asignada al LLM
 ML_THRESHOLD    = 0.25   # pkl debe superar esto para saltar el LLM
+LLM_MAX_WORKERS = int(os.getenv("LLM_MAX_WORKERS", "8"))   # llamadas simultáneas por lote
+SERVICIO_THRESHOLD = float(os.getenv("SERVICIO_THRESHOLD", "0.35"))   # para preseleccionar servicio
 
-openai = OpenAI(api_key=OPENAI_API_KEY)
+llm_cache = CacheLLM(LLM_MODEL)   # persistente entre workers y reinicios
 
 # ───────────────────────── Tipos y etiquetas ─────────────────────
 Intent = Literal[
@@ -47,36 +56,250 @@ Intent = Literal[
 ]
 ALLOWED_INTENTS: Tuple[str, ...] = get_args(Intent)
 
-__all__ = ["Intent", "predict_intent"]
+__all__ = [
+    "Intent", "predict_intent", "predict_intent_many",
+    "Prediccion", "predict_message", "predict_message_many", "CabezasCompartidas",
+    "ReglasCompiladas", "plegar_acentos", "rule_hits", "llm_cache",
+]
 
 # ───────────────────────── 1) Reglas rápidas ─────────────────────
-_QUICK_RULES: Dict[Intent, list[re.Pattern[str]]] = {
-    "saludo":            [re.compile(r"\b(hola|buenas|hey|qué onda)\b", re.I)],
-    "ubicacion":         [re.compile(r"\b(ubicaci[oó]n|d[oó]nde est[aá]n?)\b", re.I)],
-    "pago":              [re.compile(r"\b(pago|tarjeta|factura|transferencia)\b", re.I)],
-    "listar_servicios":  [re.compile(r"\b(servicio[s]?|corte|tinte|tratamiento)\b", re.I)],
-    "listar_productos":  [re.compile(r"\b(producto[s]?|shampoo|crema|aceite)\b", re.I)],
-    "agendar_cita":      [re.compile(r"\b(cita|agendar|reservar|apartad[oa])\b", re.I)],
-    "soporte_tecnico":   [re.compile(r"\b(ayuda|soporte|no funciona)\b", re.I)],
+# Palabras clave SIN acentos (el texto se pliega antes de buscar); admiten
+# ``x?`` y ``[ab]`` para plurales / género. El orden de las intenciones es la
+# prioridad: si un mensaje activa varias, gana la primera ("hola, quiero una
+# cita" → saludo), igual que antes.
+_QUICK_RULES: Dict[Intent, list[str]] = {
+    "saludo":            [r"hola", r"buenas", r"hey", r"que onda"],
+    "ubicacion":         [r"ubicacion", r"donde estan?"],
+    "pago":              [r"pago", r"tarjeta", r"factura", r"transferencia"],
+    "listar_servicios":  [r"servicios?", r"corte", r"tinte", r"tratamiento"],
+    "listar_productos":  [r"productos?", r"shampoo", r"crema", r"aceite"],
+    "agendar_cita":      [r"cita", r"agendar", r"reservar", r"apartad[oa]"],
+    "soporte_tecnico":   [r"ayuda", r"soporte", r"no funciona"],
 }
 
+_TOKEN_REGLA = re.compile(r"(\[[^\]]+\]|[^\[?])(\?)?")
+
+
+def _expandir(patron: str) -> list[str]:
+    """``"apartad[oa]s?"`` → todas sus variantes literales."""
+    variantes = [""]
+    for clase, opcional in _TOKEN_REGLA.findall(patron):
+        letras = list(clase[1:-1]) if clase.startswith("[") else [clase]
+        if opcional:
+            letras.append("")
+        variantes = [v + c for v in variantes for c in letras]
+    return variantes
+
+
+def _trie_regex(palabras: list[str]) -> str:
+    """Alternancia factorizada como trie: ``hola|hey`` → ``h(?:ey|ola)``.
+
+    El motor de ``re`` baja carácter a carácter en vez de probar cada
+    palabra en cada posición; a igual inicio gana la palabra más larga.
+    """
+    trie: dict = {}
+    for palabra in palabras:
+        nodo = trie
+        for c in palabra:
+            nodo = nodo.setdefault(c, {})
+        nodo[""] = {}
+
+    def _nodo(nodo: dict) -> str:
+        hijos = [re.escape(c) + _nodo(sub) for c, sub in sorted(nodo.items()) if c]
+        if not hijos:
+            return ""
+        cuerpo = hijos[0] if len(hijos) == 1 else "(?:" + "|".join(hijos) + ")"
+        return f"(?:{cuerpo})?" if "" in nodo else cuerpo
+
+    return _nodo(trie)
+
+
+class ReglasCompiladas:
+    """Todas las reglas en **una** regex (trie de palabras clave).
+
+    Las variantes literales de cada regla se indexan en un ``dict`` hacia su
+    regla; un solo ``finditer`` recorre el texto y se queda con la de mayor
+    prioridad (termina en cuanto aparece una de la primera intención).
+    ``hits`` cuenta qué regla decidió.
+    """
+
+    def __init__(self, reglas: Dict[str, list[str]]) -> None:
+        self._reglas: list[Tuple[str, str]] = [
+            (intent, patron) for intent, patrones in reglas.items() for patron in patrones
+        ]
+        prioridad = {intent: i for i, intent in enumerate(reglas)}
+        self._prioridad = [prioridad[intent] for intent, _ in self._reglas]
+        self._literal: Dict[str, int] = {}
+        for i, (_, patron) in enumerate(self._reglas):
+            for variante in _expandir(patron):
+                if variante:
+                    self._literal.setdefault(variante, i)   # la 1.ª regla manda
+        self._regex = re.compile(rf"\b(?:{_trie_regex(list(self._literal))})\b")
+        self._lock = threading.Lock()
+        self.hits: Counter[Tuple[str, str]] = Counter()
+
+    def buscar(self, text: str) -> Optional[str]:
+        """Intención de mayor prioridad presente en *text* (ya plegado) o ``None``."""
+        mejor: Optional[int] = None
+        for m in self._regex.finditer(text):
+            i = self._literal[m.group()]
+            if mejor is None or self._prioridad[i] < self._prioridad[mejor]:
+                mejor = i
+                if self._prioridad[i] == 0:
+                    break
+        if mejor is None:
+            return None
+        with self._lock:
+            self.hits[self._reglas[mejor]] += 1
+        return self._reglas[mejor][0]
+
+
+_RULES = ReglasCompiladas(_QUICK_RULES)
+
+
+def rule_hits() -> Dict[Tuple[str, str], int]:
+    """Copia de los contadores ``(intención, patrón) → aciertos``."""
+    with _RULES._lock:
+        return dict(_RULES.hits)
+
 # ───────────────────────── 2) Modelo local pkl ───────────────────
-_MODEL_FILE = Path("models/modelo_intencion.pkl")
-_VEC_FILE   = Path("models/vectorizador.pkl")
-
-@lru_cache(maxsize=1)
-def _load_local_model():
-    """Carga perezosa del clasificador & vectorizador."""
-    if _MODEL_FILE.exists() and _VEC_FILE.exists():
-        clf  = joblib.load(_MODEL_FILE)
-        vect = joblib.load(_VEC_FILE)
-        return clf, vect
-    return None, None  # type: ignore[return-value]
+_MODELO_INTENCION = "modelo_intencion"
+# Etiquetas del pkl → intención, sólo las equivalentes exactas. Las que no
+# figuren aquí ni en ``ALLOWED_INTENTS`` ("consultar", "opinar": demasiado
+# amplias) se delegan al LLM, igual que "otro": del pkl significa "no sé".
+_ETIQUETAS_PKL: Dict[str, Intent] = {
+    "agendar": "agendar_cita",
+}
+
+def _load_local_model() -> Optional[ModeloCargado]:
+    """Versión vigente del clasificador (``core.model_registry``, recarga en caliente)."""
+    return registro.obtener(_MODELO_INTENCION)
+
+
+def _etiqueta_pkl(label: str) -> Optional[Intent]:
+    if label in ALLOWED_INTENTS and label != "otro":
+        return cast(Intent, label)
+    return _ETIQUETAS_PKL.get(label)
+
+# ───────────────────────── 2b) Multi‑cabeza ──────────────────────
+_CABEZAS = (_MODELO_INTENCION, "modelo_sentimiento", "modelo_servicio")
+# Parámetros que definen el tokenizado (deben coincidir para compartirlo)
+_PARAMS_TOKEN = (
+    "input", "encoding", "decode_error", "strip_accents", "lowercase",
+    "preprocessor", "tokenizer", "stop_words", "token_pattern", "ngram_range", "analyzer",
+)
+
+
+def _tfidf_de(modelo: ModeloCargado) -> Optional[TfidfVectorizer]:
+    """``TfidfVectorizer`` de un ``Pipeline(tfidf, clf)`` (``None`` si no encaja)."""
+    pasos = getattr(modelo.estimador, "steps", None)
+    if modelo.vectorizador is not None or not pasos or len(pasos) != 2:
+        return None
+    tfidf = pasos[0][1]
+    if not isinstance(tfidf, TfidfVectorizer) or not hasattr(tfidf, "vocabulary_"):
+        return None
+    return tfidf
+
+
+class CabezasCompartidas:
+    """Intención, sentimiento y servicio sobre **un** tokenizado.
+
+    Los pkl son ``Pipeline(TfidfVectorizer, clasificador)`` con vocabularios
+    propios.  Se arma un ``CountVectorizer`` con la unión de vocabularios; cada
+    cabeza toma sus columnas de esa matriz de conteos y aplica su idf y
+    normalización (mismo resultado que su ``transform``).  Las cabezas que no
+    encajan (otro vectorizador o tokenizado) usan su ``predict_proba`` normal.
+    """
+
+    def __init__(self, modelos: Dict[str, ModeloCargado]) -> None:
+        self.modelos = modelos
+        self.contador: Optional[CountVectorizer] = None
+        self._fusionadas: Dict[str, Tuple[np.ndarray, TfidfVectorizer, Any]] = {}
+
+        base: Optional[Dict[str, Any]] = None
+        candidatas: Dict[str, TfidfVectorizer] = {}
+        for nombre, modelo in modelos.items():
+            tfidf = _tfidf_de(modelo)
+            if tfidf is None:
+                continue
+            params = {k: tfidf.get_params()[k] for k in _PARAMS_TOKEN}
+            base = base or params
+            if params == base:
+                candidatas[nombre] = tfidf
+        if not candidatas:
+            return
+
+        union = sorted(set().union(*(t.vocabulary_ for t in candidatas.values())))
+        indice = {termino: j for j, termino in enumerate(union)}
+        self.contador = CountVectorizer(vocabulary=indice, dtype=np.float64, **base)
+        for nombre, tfidf in candidatas.items():
+            terminos = sorted(tfidf.vocabulary_, key=tfidf.vocabulary_.__getitem__)
+            columnas = np.fromiter((indice[t] for t in terminos), dtype=np.intp, count=len(terminos))
+            self._fusionadas[nombre] = (columnas, tfidf, modelos[nombre].estimador.steps[-1][1])
+
+    def vigente(self, modelos: Dict[str, ModeloCargado]) -> bool:
+        return modelos.keys() == self.modelos.keys() and all(
+            modelos[n] is self.modelos[n] for n in modelos
+        )
+
+    @staticmethod
+    def _ponderar(conteos: sparse.csr_matrix, columnas: np.ndarray, tfidf: TfidfVectorizer):
+        X = conteos[:, columnas]
+        if tfidf.binary:
+            X.data[:] = 1
+        if tfidf.sublinear_tf:
+            np.log(X.data, X.data)
+            X.data += 1
+        if tfidf.use_idf:
+            X = X.multiply(tfidf.idf_).tocsr()
+        if tfidf.norm:
+            X = normalize(X, norm=tfidf.norm, copy=False)
+        return X.astype(tfidf.dtype, copy=False)
+
+    def predict_proba(self, textos: Sequence[str]) -> Dict[str, Tuple[Any, np.ndarray]]:
+        """``nombre → (clases, proba)`` para cada cabeza, tokenizando una vez."""
+        out: Dict[str, Tuple[Any, np.ndarray]] = {}
+        if self.contador is not None:
+            conteos = self.contador.transform(textos).tocsr()
+            for nombre, (columnas, tfidf, clf) in self._fusionadas.items():
+                out[nombre] = (clf.classes_, clf.predict_proba(self._ponderar(conteos, columnas, tfidf)))
+        for nombre, modelo in self.modelos.items():
+            if nombre not in out:
+                out[nombre] = (modelo.classes_, modelo.predict_proba(textos))
+        return out
+
+
+_cabezas_lock = threading.Lock()
+_cabezas_cache: Optional[CabezasCompartidas] = None
+
+def _cabezas() -> Optional[CabezasCompartidas]:
+    """Cabezas vigentes; se rearman sólo si el registro cambió de versión."""
+    global _cabezas_cache
+    modelos = {n: m for n in _CABEZAS if (m := registro.obtener(n)) is not None}
+    if not modelos:
+        return None
+    with _cabezas_lock:
+        if _cabezas_cache is None or not _cabezas_cache.vigente(modelos):
+            _cabezas_cache = CabezasCompartidas(modelos)
+        return _cabezas_cache
 
 # ───────────────────────── 3) LLM fallback ───────────────────────
-@lru_cache(maxsize=512)
 def _ask_llm(text: str) -> Intent:
-    """Pregunta al modelo en la nube (few‑shot) y devuelve la etiqueta."""
+    """Etiqueta del LLM para *text*, pasando antes por ``llm_cache``."""
+    label = llm_cache.obtener(text)
+    if label is None:
+        label = _consultar_llm(text)
+        if label is None:               # sin respuesta a tiempo: respaldo, no se cachea
+            return "otro"
+        llm_cache.guardar(text, label)
+    return cast(Intent, label)
+
+
+def _consultar_llm(text: str) -> Optional[Intent]:
+    """Pregunta al modelo en la nube (few‑shot) y devuelve la etiqueta.
+
+    ``None`` si el LLM no respondió dentro del plazo (``core.llm_gateway``).
+    """
     messages = [
         {
             "role": "system",
@@ -88,36 +311,141 @@ def _ask_llm(text: str) -> Intent:
         },
         {"role": "user", "content": text},
     ]
-    resp = openai.chat.completions.create(
-        model=LLM_MODEL,
-        messages=messages,
-        temperature=0,
-        max_tokens=15,
-    )
-    label = resp.choices[0].message.content.strip().split()[0]
+    content = llm.chat(messages, model=LLM_MODEL, temperature=0, max_tokens=15)
+    if content is None:
+        return None
+    palabras = content.strip().split()
+    label = palabras[0] if palabras else "otro"
     return cast(Intent, label if label in ALLOWED_INTENTS else "otro")
 
 # ───────────────────────── API público ───────────────────────────
 
 def predict_intent(text: str) -> Tuple[Intent, float]:
     """Devuelve `(intención, confianza)` usando la cascada regex → pkl → LLM."""
-    text = text.lower().strip()
-
-    # 1) regex ultra‑rápido
-    for intent, patterns in _QUICK_RULES.items():
-        if any(p.search(text) for p in patterns):
-            return intent, 1.0
-
-    # 2) modelo local
-    clf, vect = _load_local_model()
-    if clf is not None:
-        proba = clf.predict_proba(vect.transform([text]))[0]
-        idx   = int(np.argmax(proba))
-        conf  = float(proba[idx])
-        label: Intent = cast(Intent, clf.classes_[idx])  # type: ignore[assignment]
-        if conf >= ML_THRESHOLD:
-            return label, conf
-
-    # 3) LLM (ambigüedad)
-    label_llm = _ask_llm(text)
-    return label_llm, LLM_CONFIDENCE
+    return predict_intent_many([text])[0]
+
+
+def predict_intent_many(texts: Sequence[str]) -> List[Tuple[Intent, float]]:
+    """Versión por lotes de ``predict_intent`` (mismo orden que *texts*).
+
+    1) Reglas sobre todos los textos.
+    2) Los que queden pasan por **un** ``transform`` + ``predict_proba``.
+    3) Los de baja confianza (sin repetir) van al LLM en paralelo.
+    """
+    limpios = [t.lower().strip() for t in texts]
+    modelo = _load_local_model()
+
+    def clasificar(pendientes: List[int]) -> Optional[Tuple[Any, np.ndarray]]:
+        if modelo is None:
+            return None
+        return modelo.classes_, modelo.predict_proba([limpios[i] for i in pendientes])
+
+    return _cascada(limpios, clasificar)
+
+
+def _cascada(
+    limpios: List[str],
+    clasificar: Callable[[List[int]], Optional[Tuple[Any, np.ndarray]]],
+) -> List[Tuple[Intent, float]]:
+    """Reglas → pkl → LLM; *clasificar* da ``(clases, proba)`` de los pendientes."""
+    out: List[Optional[Tuple[Intent, float]]] = [None] * len(limpios)
+
+    # 1) regex ultra‑rápido (una pasada sobre el texto sin acentos)
+    pendientes: List[int] = []
+    for i, text in enumerate(limpios):
+        intent = _RULES.buscar(plegar_acentos(text))
+        if intent is not None:
+            out[i] = (cast(Intent, intent), 1.0)
+        else:
+            pendientes.append(i)
+
+    # 2) modelo local: una sola matriz dispersa para todo el lote
+    ml = clasificar(pendientes) if pendientes else None
+    if ml is not None:
+        clases, proba = ml
+        idx = np.argmax(proba, axis=1)
+        dudosos: List[int] = []
+        for fila, i in enumerate(pendientes):
+            conf = float(proba[fila, idx[fila]])
+            intent = _etiqueta_pkl(str(clases[idx[fila]]))
+            if intent is not None and conf >= ML_THRESHOLD:
+                out[i] = (intent, conf)
+            else:
+                dudosos.append(i)
+        pendientes = dudosos
+
+    # 3) LLM (ambigüedad), una llamada por texto distinto
+    if pendientes:
+        unicos = list(dict.fromkeys(limpios[i] for i in pendientes))
+        if len(unicos) == 1:
+            etiquetas = {unicos[0]: _ask_llm(unicos[0])}
+        else:
+            with ThreadPoolExecutor(max_workers=min(LLM_MAX_WORKERS, len(unicos))) as pool:
+                etiquetas = dict(zip(unicos, pool.map(_ask_llm, unicos)))
+        for i in pendientes:
+            out[i] = (etiquetas[limpios[i]], LLM_CONFIDENCE)
+
+    return cast(List[Tuple[Intent, float]], out)
+
+
+@dataclass(frozen=True)
+class Prediccion:
+    """Resultado combinado de ``predict_message``.
+
+    ``servicio`` / ``servicio_conf`` son la clase más probable del modelo de
+    servicios; ``servicio_id`` sólo se llena si supera ``SERVICIO_THRESHOLD``
+    y el nombre existe en el catálogo recibido.
+    """
+    intent: Intent
+    intent_conf: float
+    sentimiento: Optional[str] = None
+    sentimiento_conf: float = 0.0
+    servicio: Optional[str] = None
+    servicio_conf: float = 0.0
+    servicio_id: Optional[int] = None
+
+
+def predict_message(text: str, servicios: Optional[Sequence[Dict[str, Any]]] = None) -> Prediccion:
+    """Intención + sentimiento + servicio probable en una sola pasada.
+
+    *servicios* es el catálogo de ``core.functions.cargar_servicios``
+    (claves ``Nombre`` e ``Id``) para traducir el servicio a ``servicio_id``.
+    """
+    return predict_message_many([text], servicios)[0]
+
+
+def predict_message_many(
+    texts: Sequence[str], servicios: Optional[Sequence[Dict[str, Any]]] = None
+) -> List[Prediccion]:
+    """Versión por lotes de ``predict_message`` (un solo tokenizado por lote)."""
+    limpios = [t.lower().strip() for t in texts]
+    cabezas = _cabezas()
+    probas = cabezas.predict_proba(limpios) if cabezas is not None and limpios else {}
+
+    def clasificar(pendientes: List[int]) -> Optional[Tuple[Any, np.ndarray]]:
+        if _MODELO_INTENCION not in probas:
+            return None
+        clases, proba = probas[_MODELO_INTENCION]
+        return clases, proba[pendientes]
+
+    intents = _cascada(limpios, clasificar)
+    ids = {normalizar(s["Nombre"]): s["Id"] for s in servicios or ()}
+
+    def mejor(nombre: str, fila: int) -> Tuple[Optional[str], float]:
+        if nombre not in probas:
+            return None, 0.0
+        clases, proba = probas[nombre]
+        j = int(np.argmax(proba[fila]))
+        return str(clases[j]), float(proba[fila, j])
+
+    out: List[Prediccion] = []
+    for fila, (intent, conf) in enumerate(intents):
+        sentimiento, sent_conf = mejor("modelo_sentimiento", fila)
+        servicio, serv_conf = mejor("modelo_servicio", fila)
+        servicio_id = (
+            ids.get(normalizar(servicio))
+            if servicio is not None and serv_conf >= SERVICIO_THRESHOLD
+            else None
+        )
+        out.append(Prediccion(intent, conf, sentimiento, sent_conf, servicio, serv_conf, servicio_id))
+    return out
@@ -0,0 +1,260 @@
+# core/model_registry.py
+"""Registro de modelos locales (``models/*.pkl``) con recarga en caliente.
+
+👀 Responsabilidades:
+    - Cargar **una vez** todos los ``modelo_*.pkl`` con ``joblib`` en modo
+      ``mmap`` (los arrays NumPy quedan respaldados por el archivo y los
+      *workers* que hacen ``fork`` comparten esas páginas).
+    - Validar al arrancar que cada modelo tenga lo que necesita: un
+      ``Pipeline`` con vectorizador propio, o bien un clasificador suelto con
+      su compañero ``<nombre>_vectorizador.pkl`` (o el histórico
+      ``vectorizador.pkl``), y ``predict_proba`` / ``classes_``.
+    - Detectar archivos nuevos (``mtime`` + tamaño, consultado como máximo
+      cada ``MODEL_RELOAD_SECONDS``) y sustituir la versión en memoria de
+      forma atómica, sin reiniciar; si la nueva no valida, se conserva la
+      anterior.
+    - Reportar tiempo de carga y memoria residente por modelo (``reporte``).
+
+Nota:
+    - Para publicar una versión nueva conviene escribirla a un temporal y
+      hacer ``rename``; una copia a medias simplemente no valida y se
+      reintenta en la siguiente consulta.
+    - Si existe ``versiones/<nombre>.actual`` (puntero con el nombre de un
+      archivo de ``versiones/``, fuera de git) se carga ese artefacto; el
+      ``<nombre>.pkl`` versionado en el repo queda como respaldo.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time as _time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import joblib
+
+logger = logging.getLogger(__name__)
+
+# ───────────────────────── Configuración ──────────────────────────
+MODELS_DIR     = Path(os.getenv("MODELS_DIR", "models"))
+RELOAD_SECONDS = float(os.getenv("MODEL_RELOAD_SECONDS", "5"))
+MMAP_MODE      = os.getenv("MODEL_MMAP_MODE", "r") or None
+
+VERSIONES      = "versiones"                 # subdirectorio sin versionar (ver .gitignore)
+
+Firma = Tuple[Tuple[int, int], ...]      # (mtime_ns, tamaño) del modelo y su compañero
+
+__all__ = ["ModeloCargado", "ModelRegistry", "ModeloInvalidoError", "registro", "ruta_puntero"]
+
+
+def ruta_puntero(directorio: Path | str, nombre: str) -> Path:
+    """``<directorio>/versiones/<nombre>.actual``: versión publicada de *nombre*."""
+    return Path(directorio) / VERSIONES / f"{nombre}.actual"
+
+
+class ModeloInvalidoError(RuntimeError):
+    """El artefacto no sirve para inferencia (falta compañero, API, etc.)."""
+    pass
+
+
+def _rss_bytes() -> int:
+    """Memoria residente del proceso (Linux ``/proc``; 0 si no está disponible)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _tiene_vectorizador(estimador: Any) -> bool:
+    pasos = getattr(estimador, "steps", None)
+    return bool(pasos) and hasattr(pasos[0][1], "transform")
+
+# ───────────────────────── Modelo cargado ─────────────────────────
+
+@dataclass(frozen=True)
+class ModeloCargado:
+    """Versión inmutable de un modelo; se reemplaza entera al recargar."""
+    nombre: str
+    ruta: Path
+    estimador: Any
+    vectorizador: Any = None
+    firma: Firma = ()
+    version: int = 1
+    segundos_carga: float = 0.0
+    memoria_bytes: int = 0
+
+    @property
+    def classes_(self) -> Any:
+        return self.estimador.classes_
+
+    def predict_proba(self, textos: Sequence[str]) -> Any:
+        """``predict_proba`` sobre texto crudo (vectoriza si hace falta)."""
+        X = self.vectorizador.transform(textos) if self.vectorizador is not None else textos
+        return self.estimador.predict_proba(X)
+
+
+@dataclass
+class _Entrada:
+    modelo: Optional[ModeloCargado] = None
+    ultimo_chequeo: float = float("-inf")
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+# ───────────────────────── Registro ───────────────────────────────
+
+class ModelRegistry:
+    """Modelos ``modelo_*.pkl`` de un directorio, por nombre (``modelo_intencion``…)."""
+
+    def __init__(
+        self,
+        directorio: Path | str = MODELS_DIR,
+        reload_seconds: float = RELOAD_SECONDS,
+        mmap_mode: Optional[str] = MMAP_MODE,
+    ) -> None:
+        self.directorio = Path(directorio)
+        self.reload_seconds = reload_seconds
+        self.mmap_mode = mmap_mode
+        self._lock = threading.Lock()
+        self._entradas: Dict[str, _Entrada] = {}
+
+    # ---------- helpers ----------
+    def _companero(self, nombre: str) -> Optional[Path]:
+        for candidato in (f"{nombre}_vectorizador.pkl", "vectorizador.pkl"):
+            ruta = self.directorio / candidato
+            if ruta.exists():
+                return ruta
+        return None
+
+    def _ruta(self, nombre: str) -> Path:
+        """Artefacto vigente: el del puntero publicado o, si no hay, ``<nombre>.pkl``."""
+        try:
+            ruta = self.directorio / VERSIONES / ruta_puntero(self.directorio, nombre).read_text().strip()
+        except FileNotFoundError:
+            return self.directorio / f"{nombre}.pkl"
+        if not ruta.exists():
+            logger.error("❌ %s apunta a %s, que no existe: se usa %s.pkl", nombre, ruta.name, nombre)
+            return self.directorio / f"{nombre}.pkl"
+        return ruta
+
+    def _firma(self, nombre: str) -> Firma:
+        rutas = [self._ruta(nombre)]
+        companero = self._companero(nombre)
+        if companero is not None:
+            rutas.append(companero)
+        firma = []
+        for ruta in rutas:
+            st = ruta.stat()
+            firma.append((st.st_mtime_ns, st.st_size))
+        return tuple(firma)
+
+    def _cargar(self, nombre: str, version: int) -> ModeloCargado:
+        ruta = self._ruta(nombre)
+        firma = self._firma(nombre)
+        rss0, t0 = _rss_bytes(), _time.perf_counter()
+        estimador = joblib.load(ruta, mmap_mode=self.mmap_mode)
+        vectorizador = None
+        if not _tiene_vectorizador(estimador):
+            companero = self._companero(nombre)
+            if companero is None:
+                raise ModeloInvalidoError(
+                    f"{ruta.name}: clasificador sin vectorizador "
+                    f"(falta {nombre}_vectorizador.pkl)"
+                )
+            vectorizador = joblib.load(companero, mmap_mode=self.mmap_mode)
+            if not hasattr(vectorizador, "transform"):
+                raise ModeloInvalidoError(f"{companero.name}: no tiene transform()")
+        if not (hasattr(estimador, "predict_proba") and hasattr(estimador, "classes_")):
+            raise ModeloInvalidoError(f"{ruta.name}: sin predict_proba / classes_")
+        return ModeloCargado(
+            nombre=nombre,
+            ruta=ruta,
+            estimador=estimador,
+            vectorizador=vectorizador,
+            firma=firma,
+            version=version,
+            segundos_carga=_time.perf_counter() - t0,
+            memoria_bytes=max(_rss_bytes() - rss0, 0),
+        )
+
+    def _entrada(self, nombre: str) -> _Entrada:
+        with self._lock:
+            entrada = self._entradas.get(nombre)
+            if entrada is None:
+                entrada = self._entradas[nombre] = _Entrada()
+            return entrada
+
+    # ---------- API ----------
+    def cargar_todo(self, estricto: bool = False) -> Dict[str, ModeloCargado]:
+        """Carga y valida todos los ``modelo_*.pkl`` del directorio.
+
+        Los inválidos se registran en el log y se omiten; con ``estricto``
+        se lanza ``ModeloInvalidoError`` con la lista de problemas.
+        """
+        errores: List[str] = []
+        nombres = {r.stem for r in self.directorio.glob("modelo_*.pkl")}
+        nombres |= {r.stem for r in (self.directorio / VERSIONES).glob("modelo_*.actual")}
+        for nombre in sorted(nombres):
+            if nombre.endswith("_vectorizador"):
+                continue
+            try:
+                self.recargar(nombre, forzar=True)
+            except Exception as e:
+                errores.append(f"{nombre}: {e}")
+                logger.error("❌ Modelo %s no disponible: %s", nombre, e)
+        if errores and estricto:
+            raise ModeloInvalidoError("; ".join(errores))
+        return {n: e.modelo for n, e in self._entradas.items() if e.modelo is not None}
+
+    def recargar(self, nombre: str, forzar: bool = False) -> Optional[ModeloCargado]:
+        """Recarga *nombre* si su archivo cambió (o siempre con *forzar*).
+
+        La carga ocurre fuera del candado del registro; el cambio de versión
+        es una sola asignación, así que los lectores ven la vieja o la nueva.
+        """
+        entrada = self._entrada(nombre)
+        with entrada.lock:
+            entrada.ultimo_chequeo = _time.monotonic()
+            actual = entrada.modelo
+            if not forzar and actual is not None and self._firma(nombre) == actual.firma:
+                return actual
+            nuevo = self._cargar(nombre, version=(actual.version + 1) if actual else 1)
+            entrada.modelo = nuevo
+            if actual is not None:
+                logger.info("🔄 Modelo %s recargado (v%d)", nombre, nuevo.version)
+            return nuevo
+
+    def obtener(self, nombre: str) -> Optional[ModeloCargado]:
+        """Modelo vigente de *nombre* (``None`` si no existe o no valida)."""
+        entrada = self._entrada(nombre)
+        modelo = entrada.modelo
+        if modelo is not None and _time.monotonic() - entrada.ultimo_chequeo < self.reload_seconds:
+            return modelo
+        try:
+            return self.recargar(nombre)
+        except FileNotFoundError:
+            entrada.ultimo_chequeo = _time.monotonic()
+            return modelo
+        except Exception as e:
+            entrada.ultimo_chequeo = _time.monotonic()
+            logger.error("❌ Modelo %s no recargado, se mantiene la versión previa: %s", nombre, e)
+            return modelo
+
+    def reporte(self) -> List[Dict[str, Any]]:
+        """Versión, tiempo de carga y memoria residente de cada modelo cargado."""
+        with self._lock:
+            modelos = [e.modelo for e in self._entradas.values() if e.modelo is not None]
+        return [
+            {
+                "modelo": m.nombre,
+                "version": m.version,
+                "segundos_carga": round(m.segundos_carga, 4),
+                "memoria_bytes": m.memoria_bytes,
+                "clases": len(m.classes_),
+            }
+            for m in sorted(modelos, key=lambda m: m.nombre)
+        ]
+
+
+registro = ModelRegistry()
@@ -4,25 +4,40 @@
 👀 Responsabilidades:
     - Validar que un empleado tenga un *slot* libre antes de confirmar cita.
     - Detectar solapamientos según duración del servicio.
+    - Rechazar días en que el empleado está ausente (``DisponibilidadPersonal``).
     - Crear la cita (persistencia) aislando la lógica de *core* de la capa HTTP.
+    - Cancelar citas liberando el hueco.
+    - Sugerir los próximos huecos libres (``core.slot_engine``, bitmaps NumPy).
+    - Mantener el resumen de días con hueco (``core.disponibilidad_resumen``)
+      en la misma transacción que cada reserva / cancelación.
 
 Nota:
     - Se usa la sesión de SQLAlchemy como dependencia explícita para que las
       capas superiores (Flask, tests, scripts) gestionen el ciclo de vida
       (commit/rollback/context‑manager).
+    - Los solapamientos se resuelven contra ``core.agenda_index`` (intervalos
+      en memoria por empleado/día); la BD sólo se consulta la primera vez.
+    - Las ausencias se resuelven contra ``core.calendario_ausencias`` (bitset
+      por empleado precalculado, O(1) por día).
 """
 from __future__ import annotations
-from datetime import datetime,date, time, timedelta
+from datetime import datetime,date, time
 from typing import Optional
 
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
+from sqlalchemy import exists, or_, select
 
-from db.models import Cita, Servicio
+from db.models import Cita, DisponibilidadPersonal, Servicio, fin_de_cita
+from core.agenda_index import agenda_index, duracion_servicio, minutos
+from core.calendario_ausencias import calendario_ausencias
+from core import disponibilidad_resumen, slot_engine
 
 class SlotOccupiedError(Exception):
     """Excepción personalizada para indicar que el slot ya está ocupado."""
     pass
+class EmpleadoAusenteError(SlotOccupiedError):
+    """El empleado tiene una ausencia registrada ese día."""
+    pass
 class InvalidInputError(Exception):
     """Parametros invalidos como fecha pasada. duracion negativa, etc."""
     pass
@@ -32,15 +47,42 @@ class InvalidInputError(Exception):
 
 def _compute_end(hora: time, duracion_min: int) -> time:
     """Suma *duracion_min* a *hora* y devuelve la nueva ``time``.
-    No valida overflow a día siguiente (las citas de Oliva son mismo día).
+    Se topa en ``time.max`` (las citas de Oliva son mismo día).
     """
-    dt_start = datetime.combine(date.today(), hora)
-    dt_end = dt_start + timedelta(minutes=duracion_min)
-    return dt_end.time()
+    return fin_de_cita(hora, duracion_min)
+
+def _conflicto(fecha: date, hora: time, hora_fin: time, empleado_id: int):
+    """Predicado SQL: cita solapada **o** ausencia del empleado ese día."""
+    cita = exists().where(
+        Cita.empleado_id == empleado_id,
+        Cita.fecha == fecha,
+        Cita.hora < hora_fin,
+        Cita.hora_fin > hora,
+    )
+    ausencia = exists().where(
+        DisponibilidadPersonal.empleado_id == empleado_id,
+        DisponibilidadPersonal.fecha_ini <= fecha,
+        DisponibilidadPersonal.fecha_fin >= fecha,
+    )
+    return or_(cita, ausencia)
+
+def validar_hora(hora: time) -> None:
+    """Lanza ``InvalidInputError`` si *hora* no cae en la rejilla de la agenda."""
+    if not slot_engine.en_rejilla(hora):
+        raise InvalidInputError(
+            f"Hora fuera de la rejilla de {slot_engine.RESOLUCION_MIN} min: {hora.isoformat()}"
+        )
 
-def _slot_overlaps(start_a: time, end_a: time, start_b: time, end_b: time) -> bool:
-    """Comprueba si dos intervalos de tiempo se solapan."""
-    return start_a < end_b and start_b < end_a
+def _overlap_exists(
+    db: Session, fecha: date, hora: time, hora_fin: time, empleado_id: int
+) -> bool:
+    """``EXISTS`` de una cita que se solape con ``[hora, hora_fin)`` o de una ausencia.
+
+    El predicado se evalúa en el ``WHERE`` sobre el índice
+    ``(empleado_id, fecha, hora)`` usando el ``hora_fin`` persistido de cada
+    cita; la BD sólo devuelve un booleano (sin materializar objetos ORM).
+    """
+    return bool(db.scalar(select(_conflicto(fecha, hora, hora_fin, empleado_id))))
 
 # ────────────────────────────────────────────────────────────────────────────────
 # API público
@@ -52,42 +94,160 @@ def is_slot_available(
     hora: time,
     empleado_id: int,
     servicio: Servicio | int,
+    usar_indice: bool = True,
 ) -> bool:
     """Devuelve **True** si *empleado_id* está libre en *fecha* a *hora*.
 
+    Aplica las mismas reglas que ``first_free_employee``: horario del salón,
+    días cerrados y nada en el pasado (``slot_engine.en_horario``).
+
     Args:
         db: Sesión SQLAlchemy viva.
         fecha: Día elegido.
-        hora: Hora de inicio (time).
+        hora: Hora de inicio (time), en la rejilla de ``RESOLUCION_MIN``.
         empleado_id: ID del estilista / barbero.
         servicio: Instancia ``Servicio`` **o** ``servicio_id``.
+        usar_indice: False → consulta autoritativa ``EXISTS`` en la BD.
+
+    Raises:
+        InvalidInputError: *hora* fuera de la rejilla.
     """
+    validar_hora(hora)
     # Asegura instancia Servicio
     if isinstance(servicio, int):
         servicio = db.get(Servicio, servicio)
     if not servicio:
         raise ValueError(f"Servicio no encontrado: {servicio} 👀")
     
-    # Rango de la nueva cita
-    new_start = hora
-    new_end = _compute_end(hora, servicio.duracion_max or servicio.duracion_min)
-
-    # Consulta citas existentes ese día con posible solapamiento
-    existing: list[Cita] = (
-        db.query(Cita)
-        .filter(
-            Cita.empleado_id == empleado_id,
-            Cita.fecha == fecha,
-        )
-        .all()
+    duracion = duracion_servicio(servicio.duracion_max, servicio.duracion_min)
+    if not slot_engine.en_horario(fecha, hora, duracion):
+        return False
+    if not usar_indice:
+        return not _overlap_exists(db, fecha, hora, _compute_end(hora, duracion), empleado_id)
+
+    # Ausencias: bitset precalculado, O(1) por día
+    if calendario_ausencias.ausente(db, empleado_id, fecha):
+        return False
+
+    # Rango de la nueva cita (minutos desde medianoche)
+    new_start = minutos(hora)
+    new_end = new_start + duracion
+
+    # Solapamiento contra el índice en memoria (bisect, sin ir a la BD)
+    return not agenda_index.hay_solape(db, empleado_id, fecha, new_start, new_end)
+
+def next_free_slots(
+    db: Session,
+    fecha: date,
+    hora: time,
+    empleado_id: int,
+    servicio: Servicio | int,
+    n: int = 3,
+    step_min: int = 30,
+    dias: int = 14,
+) -> list[dict[str, str | int]]:
+    """Próximos *n* huecos libres de *empleado_id* a partir de *fecha* / *hora*.
+
+    Se resuelve en una sola pasada sobre el bitmap de ocupación de los
+    siguientes *dias* (ver ``core.slot_engine``).
+
+    Returns:
+        ``[{"empleado_id": 1, "inicio": "2025-07-18T10:30:00", "fin": "…"}, …]``
+    """
+    if isinstance(servicio, int):
+        servicio = db.get(Servicio, servicio)
+    if not servicio:
+        raise ValueError(f"Servicio no encontrado: {servicio} 👀")
+    if n <= 0 or step_min <= 0 or dias <= 0:
+        raise InvalidInputError("n, step_min y dias deben ser positivos")
+
+    huecos = slot_engine.buscar_huecos(
+        db,
+        empleado_id,
+        fecha,
+        duracion_servicio(servicio.duracion_max, servicio.duracion_min),
+        hora_min=hora,
+        n=n,
+        step_min=step_min,
+        dias=dias,
     )
+    return [
+        {"empleado_id": empleado_id, "inicio": ini.isoformat(), "fin": fin.isoformat()}
+        for ini, fin in huecos
+    ]
 
-    # Revisa si hay solapamientos
-    for cita in existing:
-        cita_end = _compute_end(cita.hora, servicio.duracion_max or servicio.duracion_min)
-        if _slot_overlaps(new_start, new_end, cita.hora, cita_end):
-            return False
-    return True
+def next_free_slots_any(
+    db: Session,
+    fecha: date,
+    hora: Optional[time],
+    servicio: Servicio | int,
+    n: int = 3,
+    step_min: int = 30,
+    dias: int = 14,
+    empleado_ids: Optional[list[int]] = None,
+) -> list[dict[str, str | int]]:
+    """Huecos más próximos con **cualquier** empleado ("me da igual quién").
+
+    Toda la plantilla (o *empleado_ids*) se evalúa en una sola pasada: una
+    consulta de citas + una de plantilla/ausencias, y las listas por
+    empleado se mezclan con un *heap*. Una opción por hora de inicio.
+
+    Returns:
+        Misma forma que ``next_free_slots``.
+    """
+    if isinstance(servicio, int):
+        servicio = db.get(Servicio, servicio)
+    if not servicio:
+        raise ValueError(f"Servicio no encontrado: {servicio} 👀")
+    if n <= 0 or step_min <= 0 or dias <= 0:
+        raise InvalidInputError("n, step_min y dias deben ser positivos")
+
+    huecos = slot_engine.buscar_huecos_multi(
+        db,
+        empleado_ids,
+        fecha,
+        duracion_servicio(servicio.duracion_max, servicio.duracion_min),
+        hora_min=hora,
+        n=n,
+        step_min=step_min,
+        dias=dias,
+    )
+    return [
+        {"empleado_id": emp, "inicio": ini.isoformat(), "fin": fin.isoformat()}
+        for ini, fin, emp in huecos
+    ]
+
+def first_free_employee(
+    db: Session,
+    fecha: date,
+    hora: time,
+    servicio: Servicio | int,
+    empleado_ids: Optional[list[int]] = None,
+) -> Optional[int]:
+    """ID del primer empleado libre justo en *fecha* / *hora*, o ``None``.
+
+    Raises:
+        InvalidInputError: *hora* fuera de la rejilla (nunca coincidiría).
+    """
+    validar_hora(hora)
+    if isinstance(servicio, int):
+        servicio = db.get(Servicio, servicio)
+    if not servicio:
+        raise ValueError(f"Servicio no encontrado: {servicio} 👀")
+
+    huecos = slot_engine.buscar_huecos_multi(
+        db,
+        empleado_ids,
+        fecha,
+        duracion_servicio(servicio.duracion_max, servicio.duracion_min),
+        hora_min=hora,
+        n=1,
+        step_min=slot_engine.RESOLUCION_MIN,
+        dias=1,
+    )
+    if huecos and huecos[0][0] == datetime.combine(fecha, hora):
+        return huecos[0][2]
+    return None
 
 def book_slot(
     db: Session,
@@ -97,25 +257,119 @@ def book_slot(
     fecha: date,
     hora: time,
 ) -> Cita:
-    """Crea la cita *si y solo si* el slot está libre; de lo contrario lanza ``ValueError``."""
+    """Crea la cita *si y solo si* el slot está libre; de lo contrario lanza ``SlotOccupiedError``.
+
+    La verificación es contra la BD (``EXISTS``), no contra el índice en
+    memoria: es el camino de escritura y debe ver lo último confirmado. Las
+    ausencias ya conocidas se rechazan antes, en O(1), con
+    ``EmpleadoAusenteError``; el ``EXISTS`` también las cubre.
+    """
     servicio = db.get(Servicio, servicio_id)
     if servicio is None:
         raise ValueError("Servicio inexistente")
 
-    if not is_slot_available(db, fecha, hora, empleado_id, servicio):
+    if calendario_ausencias.ausente(db, empleado_id, fecha):
+        raise EmpleadoAusenteError("Empleado ausente ese día ⛔")
+
+    duracion = duracion_servicio(servicio.duracion_max, servicio.duracion_min)
+    hora_fin = _compute_end(hora, duracion)
+    if _overlap_exists(db, fecha, hora, hora_fin, empleado_id):
         raise SlotOccupiedError("Slot no disponible ⛔")
-    
+
     cita = Cita(
         fecha=fecha,
         hora=hora,
+        hora_fin=hora_fin,
+        duracion_min=duracion,
         cliente_id=cliente_id,
         servicio_id=servicio_id,
         empleado_id=empleado_id,
     )
     db.add(cita)
     db.flush()  # obtiene ID sin commit para que capa superior decida
+    disponibilidad_resumen.actualizar(db, [(empleado_id, fecha)])
     return cita
 
+def book_slots(
+    db: Session,
+    cliente_id: int,
+    items: list[tuple[int, int, date, time]],
+) -> list[Cita]:
+    """Reserva varias citas (combo) de forma atómica: todas o ninguna.
+
+    Args:
+        items: ``[(servicio_id, empleado_id, fecha, hora), …]``.
+
+    Una sola consulta de servicios, **un** ``SELECT`` con el ``OR`` de los
+    ``EXISTS`` de todos los rangos (citas y ausencias) y un único ``flush`` (INSERT por lotes). Como ``book_slot``,
+    no hace commit.
+    """
+    ids = {servicio_id for servicio_id, *_ in items}
+    servicios = {
+        s.id: s for s in db.scalars(select(Servicio).where(Servicio.id.in_(ids)))
+    }
+    if missing := ids - servicios.keys():
+        raise ValueError(f"Servicio inexistente: {sorted(missing)}")
+
+    rangos: list[tuple[int, int, date, time, time]] = []
+    for servicio_id, empleado_id, fecha, hora in items:
+        s = servicios[servicio_id]
+        duracion = duracion_servicio(s.duracion_max, s.duracion_min)
+        rangos.append((servicio_id, empleado_id, fecha, hora, _compute_end(hora, duracion)))
+
+    # las partes del combo tampoco pueden chocar entre sí
+    for i, (_, emp_a, f_a, ini_a, fin_a) in enumerate(rangos):
+        for _, emp_b, f_b, ini_b, fin_b in rangos[i + 1:]:
+            if emp_a == emp_b and f_a == f_b and ini_a < fin_b and ini_b < fin_a:
+                raise SlotOccupiedError("Partes del combo se solapan ⛔")
+
+    for _, empleado_id, fecha, *_ in rangos:
+        if calendario_ausencias.ausente(db, empleado_id, fecha):
+            raise EmpleadoAusenteError("Empleado ausente ese día ⛔")
+
+    choque = select(
+        or_(*[
+            _conflicto(fecha, hora, hora_fin, empleado_id)
+            for _, empleado_id, fecha, hora, hora_fin in rangos
+        ])
+    )
+    if db.scalar(choque):
+        raise SlotOccupiedError("Slot no disponible ⛔")
+
+    citas = [
+        Cita(
+            fecha=fecha,
+            hora=hora,
+            hora_fin=hora_fin,
+            duracion_min=duracion_servicio(
+                servicios[servicio_id].duracion_max, servicios[servicio_id].duracion_min
+            ),
+            cliente_id=cliente_id,
+            servicio_id=servicio_id,
+            empleado_id=empleado_id,
+        )
+        for servicio_id, empleado_id, fecha, hora, hora_fin in rangos
+    ]
+    db.add_all(citas)
+    db.flush()  # un INSERT … RETURNING por lotes (insertmanyvalues)
+    disponibilidad_resumen.actualizar(db, [(c.empleado_id, c.fecha) for c in citas])
+    return citas
+
+def cancel_slot(db: Session, cita_id: int) -> None:
+    """Elimina la cita *cita_id* liberando el hueco.
+
+    Igual que ``book_slot`` sólo hace ``flush`` (y ajusta el resumen de
+    disponibilidad); el índice de agenda se actualiza cuando la capa
+    superior confirma con ``commit``.
+    """
+    cita = db.get(Cita, cita_id)
+    if cita is None:
+        raise InvalidInputError(f"Cita inexistente: {cita_id}")
+    clave = (cita.empleado_id, cita.fecha)
+    db.delete(cita)
+    db.flush()
+    disponibilidad_resumen.actualizar(db, [clave])
+
 # ────────────────────────────────────────────────────────────────────────────────
 # Ejemplo CLI
 # ────────────────────────────────────────────────────────────────────────────────
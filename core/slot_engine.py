@@ -0,0 +1,407 @@
+# core/slot_engine.py
+"""Motor vectorizado de búsqueda de huecos libres (NumPy).
+
+👀 Idea:
+    - Cada empleado/día se representa como un *bitmap* de ocupación con una
+      celda por ``RESOLUCION_MIN`` minutos dentro del horario del salón.
+    - Las citas (vía ``core.agenda_index``), los días cerrados y las ausencias
+      (vía ``core.calendario_ausencias``) marcan celdas ocupadas.
+    - Un hueco para un servicio de *k* celdas existe donde la suma móvil
+      (``cumsum``) de celdas libres vale *k*; se evalúa para todos los días del
+      rango a la vez y se toman los primeros *n* inicios.
+
+Así "los 3 próximos huecos en 14 días" cuesta una consulta de citas + una de
+plantilla (las ausencias salen de memoria), en lugar de cientos de
+``is_slot_available``. Buscar en toda la plantilla ("me da igual quién")
+cuesta lo mismo, sin importar cuántos empleados haya.
+"""
+from __future__ import annotations
+
+import heapq
+import os
+from datetime import date, datetime, time, timedelta
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from db.models import Empleado
+from core.agenda_index import DiaAgenda, agenda_index, minutos
+from core.calendario_ausencias import calendario_ausencias
+
+# ───────────────────────── Horario del salón ──────────────────────
+def _hora_env(nombre: str, default: str) -> time:
+    return time.fromisoformat(os.getenv(nombre, default))
+
+RESOLUCION_MIN = 5
+HORA_APERTURA  = _hora_env("SALON_APERTURA", "09:00")
+HORA_CIERRE    = _hora_env("SALON_CIERRE", "20:00")
+DIAS_CERRADO   = frozenset(                 # 0 = lunes … 6 = domingo
+    int(d) for d in os.getenv("SALON_DIAS_CERRADO", "6").split(",") if d.strip()
+)
+
+APERTURA_MIN = minutos(HORA_APERTURA)
+CELDAS_DIA   = (minutos(HORA_CIERRE) - APERTURA_MIN) // RESOLUCION_MIN
+
+__all__ = [
+    "RESOLUCION_MIN", "HORA_APERTURA", "HORA_CIERRE", "DIAS_CERRADO",
+    "mapa_ocupacion", "inicios_libres", "minutos_libres", "ocupacion",
+    "plantilla", "buscar_huecos", "buscar_huecos_multi", "buscar_combo",
+    "dias_con_hueco", "en_rejilla", "en_horario",
+]
+
+# ───────────────────────── Bitmaps ────────────────────────────────
+
+def _celdas(ini_min: int, fin_min: int) -> Tuple[int, int]:
+    """Rango de celdas ``[a, b)`` que toca el intervalo ``[ini, fin)``."""
+    a = (ini_min - APERTURA_MIN) // RESOLUCION_MIN
+    b = -(-(fin_min - APERTURA_MIN) // RESOLUCION_MIN)        # ceil
+    return max(a, 0), min(b, CELDAS_DIA)
+
+
+def _celdas_servicio(duracion_min: int) -> int:
+    """Celdas que ocupa un servicio de *duracion_min* (redondeo hacia arriba)."""
+    return max(1, -(-duracion_min // RESOLUCION_MIN))
+
+
+def mapa_ocupacion(
+    dias: Sequence[DiaAgenda | None], bloqueados: np.ndarray
+) -> np.ndarray:
+    """Bitmap ``(D, CELDAS_DIA)`` con ``True`` = ocupado.
+
+    Args:
+        dias: Intervalos ocupados por día (``None`` = sin citas).
+        bloqueados: Vector booleano ``(D,)``; día entero no disponible
+            (salón cerrado o empleado ausente).
+    """
+    n = len(dias)
+    diff = np.zeros((n, CELDAS_DIA + 1), dtype=np.int16)
+    filas: List[int] = []
+    desde: List[int] = []
+    hasta: List[int] = []
+    for d, dia in enumerate(dias):
+        if dia is None:
+            continue
+        for ini, fin in zip(dia.inicios, dia.fines):
+            a, b = _celdas(ini, fin)
+            if a < b:
+                filas.append(d); desde.append(a); hasta.append(b)
+    if filas:
+        np.add.at(diff, (filas, desde), 1)
+        np.add.at(diff, (filas, hasta), -1)
+    ocupado = np.cumsum(diff[:, :-1], axis=1) > 0
+    ocupado[bloqueados] = True
+    return ocupado
+
+
+def inicios_libres(
+    ocupado: np.ndarray, duracion_min: int, step_min: int = 30
+) -> np.ndarray:
+    """Máscara ``(..., CELDAS_DIA)`` de celdas donde cabe el servicio completo.
+
+    Suma móvil de celdas libres con ``cumsum``: un inicio *c* es válido si
+    las ``k`` celdas ``[c, c+k)`` están libres y *c* cae en la rejilla de
+    ``step_min`` desde la apertura.
+    """
+    k = _celdas_servicio(duracion_min)
+    celdas = ocupado.shape[-1]
+    valido = np.zeros(ocupado.shape, dtype=bool)
+    if k > celdas:
+        return valido
+    libre = (~ocupado).astype(np.int32)
+    cs = np.concatenate(
+        [np.zeros(ocupado.shape[:-1] + (1,), dtype=np.int32), np.cumsum(libre, axis=-1)],
+        axis=-1,
+    )
+    valido[..., : celdas - k + 1] = (cs[..., k:] - cs[..., :-k]) == k
+    valido[..., np.arange(celdas) % _paso(step_min) != 0] = False
+    return valido
+
+
+def minutos_libres(ocupado: np.ndarray, umbrales: Sequence[int]) -> np.ndarray:
+    """Minutos libres ``(..., len(umbrales))`` en tramos de al menos cada umbral.
+
+    Para cada fila del bitmap se localizan los tramos libres contiguos (un
+    ``diff`` sobre el array aplanado, con una celda ocupada de relleno entre
+    filas) y se suman los que duran ``≥ umbral`` minutos: un servicio de esa
+    duración cabe ese día si el resultado es > 0.
+    """
+    forma = ocupado.shape[:-1]
+    filas = ocupado.reshape(-1, ocupado.shape[-1])
+    n, celdas = filas.shape
+    libre = np.zeros((n, celdas + 2), dtype=np.int8)
+    libre[:, 1:-1] = ~filas
+    cambios = np.diff(libre.ravel())
+    inicios = np.flatnonzero(cambios == 1)
+    fines = np.flatnonzero(cambios == -1)
+    fila = inicios // (celdas + 2)
+    largo = (fines - inicios) * RESOLUCION_MIN
+    out = np.zeros((n, len(umbrales)), dtype=np.int64)
+    for j, umbral in enumerate(umbrales):
+        out[:, j] = np.bincount(fila, weights=np.where(largo >= umbral, largo, 0), minlength=n)
+    return out.reshape(*forma, len(umbrales))
+
+
+def _paso(step_min: int) -> int:
+    """Rejilla de inicios en celdas."""
+    return max(1, step_min // RESOLUCION_MIN)
+
+# ───────────────────────── Datos ──────────────────────────────────
+
+def _cerrados(fechas: Sequence[date]) -> np.ndarray:
+    return np.array([f.weekday() in DIAS_CERRADO for f in fechas], dtype=bool)
+
+
+def _corte_inicial(
+    fechas: Sequence[date], hora_min: Optional[time], ahora: datetime
+) -> np.ndarray:
+    """Primera celda permitida por día (no antes de *hora_min* ni de *ahora*)."""
+    corte = np.zeros(len(fechas), dtype=np.int64)
+    for d, f in enumerate(fechas):
+        limite = -1
+        if d == 0 and hora_min is not None:
+            limite = minutos(hora_min)
+        if f == ahora.date():
+            limite = max(limite, minutos(ahora.time()) + (ahora.second > 0))
+        elif f < ahora.date():
+            limite = 24 * 60
+        if limite >= 0:
+            corte[d] = -(-(limite - APERTURA_MIN) // RESOLUCION_MIN)
+    return corte
+
+def plantilla(db: Session, empleado_ids: Optional[Sequence[int]] = None) -> List[int]:
+    """IDs de la plantilla (o de los *empleado_ids* que existan), ordenados."""
+    stmt = select(Empleado.id).order_by(Empleado.id)
+    if empleado_ids is not None:
+        stmt = stmt.where(Empleado.id.in_(empleado_ids))
+    return list(db.scalars(stmt))
+
+# ───────────────────────── API ────────────────────────────────────
+
+Hueco = Tuple[datetime, datetime, int]          # (inicio, fin, empleado_id)
+
+
+def ocupacion(
+    db: Session, empleado_ids: Optional[Sequence[int]], fechas: Sequence[date]
+) -> Tuple[List[int], np.ndarray]:
+    """``(empleados, bitmap (E, D, CELDAS_DIA))`` de *fechas* consecutivas, cargado en bloque."""
+    desde, hasta = fechas[0], fechas[-1]
+    emps = plantilla(db, empleado_ids)
+    if not emps:
+        return [], np.zeros((0, len(fechas), CELDAS_DIA), dtype=bool)
+    agenda = agenda_index.dias_rango(db, emps, desde, hasta)
+    bloqueados = calendario_ausencias.mascara(db, emps, desde, len(fechas)) | _cerrados(fechas)
+    ocupado = np.stack([
+        mapa_ocupacion([agenda.get((emp, f)) for f in fechas], bloqueados[e])
+        for e, emp in enumerate(emps)
+    ])
+    return emps, ocupado
+
+
+def _huecos_empleado(
+    valido: np.ndarray, fechas: Sequence[date], empleado_id: int,
+    duracion_min: int, n: int,
+) -> List[Hueco]:
+    out: List[Hueco] = []
+    for idx in np.flatnonzero(valido)[:n]:
+        d, c = divmod(int(idx), CELDAS_DIA)
+        inicio = datetime.combine(fechas[d], HORA_APERTURA) + timedelta(
+            minutes=c * RESOLUCION_MIN
+        )
+        out.append((inicio, inicio + timedelta(minutes=duracion_min), empleado_id))
+    return out
+
+
+def buscar_huecos_multi(
+    db: Session,
+    empleado_ids: Optional[Sequence[int]],
+    desde: date,
+    duracion_min: int,
+    *,
+    hora_min: Optional[time] = None,
+    n: int = 3,
+    step_min: int = 30,
+    dias: int = 14,
+    ahora: Optional[datetime] = None,
+    distintos: bool = True,
+) -> List[Hueco]:
+    """Primeros *n* huecos entre varios empleados (``None`` = toda la plantilla).
+
+    Carga en bloque (una consulta de citas + una de plantilla/ausencias),
+    arma un bitmap ``(E, D, CELDAS_DIA)``, escanea todos a la vez y mezcla
+    las listas por empleado con ``heapq.merge``.
+
+    Args:
+        distintos: Si es True, una sola opción por hora de inicio (la del
+            primer empleado libre), útil para "me da igual quién".
+        (resto igual que ``buscar_huecos``)
+    """
+    ahora = ahora or datetime.now()
+    fechas = [desde + timedelta(days=i) for i in range(dias)]
+    emps, ocupado = ocupacion(db, empleado_ids, fechas)
+    if not emps:
+        return []
+
+    valido = inicios_libres(ocupado, duracion_min, step_min)
+    corte = _corte_inicial(fechas, hora_min, ahora)
+    valido &= (np.arange(CELDAS_DIA)[None, :] >= corte[:, None])[None, :, :]
+
+    por_empleado = [
+        _huecos_empleado(valido[e], fechas, emp, duracion_min, n)
+        for e, emp in enumerate(emps)
+    ]
+    out: List[Hueco] = []
+    for hueco in heapq.merge(*por_empleado):
+        if distintos and out and out[-1][0] == hueco[0]:
+            continue
+        out.append(hueco)
+        if len(out) >= n:
+            break
+    return out
+
+
+def dias_con_hueco(
+    db: Session,
+    empleado_ids: Optional[Sequence[int]],
+    fechas: Sequence[date],
+    duracion_min: int,
+    *,
+    step_min: int = 30,
+    ahora: Optional[datetime] = None,
+) -> List[date]:
+    """*fechas* (consecutivas) en las que algún empleado tiene un inicio válido.
+
+    Cálculo exacto sobre el bitmap, sin el redondeo a bucket de
+    ``core.disponibilidad_resumen``; respeta *ahora* (lo ya pasado no cuenta).
+    """
+    ahora = ahora or datetime.now()
+    emps, ocupado = ocupacion(db, empleado_ids, fechas)
+    if not emps:
+        return []
+    valido = inicios_libres(ocupado, duracion_min, step_min)
+    corte = _corte_inicial(fechas, None, ahora)
+    valido &= (np.arange(CELDAS_DIA)[None, :] >= corte[:, None])[None, :, :]
+    hay = valido.any(axis=(0, 2))
+    return [f for f, ok in zip(fechas, hay) if ok]
+
+
+def en_rejilla(hora: time) -> bool:
+    """True si *hora* cae en una celda exacta (múltiplo de ``RESOLUCION_MIN``)."""
+    return (
+        not hora.second and not hora.microsecond
+        and (minutos(hora) - APERTURA_MIN) % RESOLUCION_MIN == 0
+    )
+
+
+def en_horario(
+    fecha: date,
+    hora: time,
+    duracion_min: int,
+    *,
+    ahora: Optional[datetime] = None,
+) -> bool:
+    """True si un servicio de *duracion_min* puede empezar en *fecha* / *hora*.
+
+    Mismas reglas que la búsqueda de huecos: salón abierto ese día, dentro
+    del horario completo y no antes de *ahora*. Supone *hora* en la rejilla
+    (``en_rejilla``).
+    """
+    ahora = ahora or datetime.now()
+    celda = (minutos(hora) - APERTURA_MIN) // RESOLUCION_MIN
+    return (
+        not _cerrados([fecha])[0]
+        and celda >= _corte_inicial([fecha], None, ahora)[0]
+        and celda + _celdas_servicio(duracion_min) <= CELDAS_DIA
+    )
+
+
+def buscar_combo(
+    db: Session,
+    items: Sequence[Tuple[Optional[int], int]],
+    desde: date,
+    *,
+    hora_min: Optional[time] = None,
+    n: int = 3,
+    step_min: int = 30,
+    dias: int = 14,
+    ahora: Optional[datetime] = None,
+) -> List[List[Hueco]]:
+    """Secuencias *back‑to‑back* factibles para un combo de servicios.
+
+    Args:
+        items: ``[(empleado_id | None, duracion_min), …]`` en orden; ``None``
+            = cualquier empleado para esa parte.
+        (resto igual que ``buscar_huecos``; *step_min* aplica al inicio del
+        combo, las partes siguientes van pegadas a la anterior.)
+
+    Cada parte *i* se evalúa sobre el mismo bitmap ``(E, D, C)`` desplazada
+    por la suma de duraciones previas; el combo es factible en la celda *c*
+    si todas las partes lo son (AND vectorizado). Devuelve hasta *n*
+    secuencias ``[(inicio, fin, empleado_id), …]`` en orden cronológico.
+    """
+    if not items:
+        return []
+    ahora = ahora or datetime.now()
+    fechas = [desde + timedelta(days=i) for i in range(dias)]
+    pool = None if any(emp is None for emp, _ in items) else sorted({e for e, _ in items})
+    emps, ocupado = ocupacion(db, pool, fechas)
+    fila = {emp: i for i, emp in enumerate(emps)}
+    if any(emp is not None and emp not in fila for emp, _ in items):
+        return []
+
+    celda = np.arange(CELDAS_DIA)
+    factible = np.broadcast_to(celda % _paso(step_min) == 0, (len(fechas), CELDAS_DIA)).copy()
+    factible &= celda[None, :] >= _corte_inicial(fechas, hora_min, ahora)[:, None]
+
+    partes: List[Tuple[List[int], np.ndarray, int]] = []
+    offset = 0
+    for emp, dur in items:
+        filas = [fila[emp]] if emp is not None else list(range(len(emps)))
+        valido = inicios_libres(ocupado[filas], dur, RESOLUCION_MIN)
+        movido = np.zeros_like(valido)
+        if offset < CELDAS_DIA:
+            movido[..., : CELDAS_DIA - offset] = valido[..., offset:]
+        factible &= movido.any(axis=0)
+        partes.append((filas, movido, dur))
+        offset += _celdas_servicio(dur)
+
+    out: List[List[Hueco]] = []
+    for idx in np.flatnonzero(factible)[:n]:
+        d, c = divmod(int(idx), CELDAS_DIA)
+        inicio = datetime.combine(fechas[d], HORA_APERTURA) + timedelta(
+            minutes=c * RESOLUCION_MIN
+        )
+        secuencia: List[Hueco] = []
+        for filas, movido, dur in partes:
+            e = filas[int(np.argmax(movido[:, d, c]))]
+            secuencia.append((inicio, inicio + timedelta(minutes=dur), emps[e]))
+            inicio += timedelta(minutes=_celdas_servicio(dur) * RESOLUCION_MIN)
+        out.append(secuencia)
+    return out
+
+
+def buscar_huecos(
+    db: Session,
+    empleado_id: int,
+    desde: date,
+    duracion_min: int,
+    **kwargs,
+) -> List[Tuple[datetime, datetime]]:
+    """Primeros *n* huecos ``(inicio, fin)`` de *empleado_id* desde *desde*.
+
+    Args:
+        db: Sesión SQLAlchemy viva.
+        empleado_id: ID del estilista / barbero.
+        desde: Primer día a revisar.
+        duracion_min: Duración del servicio a acomodar.
+        hora_min: Hora mínima de inicio **sólo** para el primer día.
+        n: Cuántos huecos devolver.
+        step_min: Rejilla de inicios (30 → 9:00, 9:30, …).
+        dias: Ventana de búsqueda en días.
+        ahora: Instante de referencia (inyectable en pruebas).
+    """
+    huecos = buscar_huecos_multi(
+        db, [empleado_id], desde, duracion_min, distintos=False, **kwargs
+    )
+    return [(ini, fin) for ini, fin, _ in huecos]
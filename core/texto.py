@@ -0,0 +1,27 @@
+# core/texto.py
+"""Normalización de texto compartida por la cascada de intenciones y sus cachés."""
+from __future__ import annotations
+
+import re
+import unicodedata
+
+# á→a, Ü→U… (se conserva la ñ: "año" ≠ "ano")
+_PLIEGUE = {
+    i: unicodedata.normalize("NFKD", chr(i))[0]
+    for i in range(0xC0, 0x250)
+    if chr(i) not in "ñÑ" and len(unicodedata.normalize("NFKD", chr(i))) > 1
+}
+_ESPACIOS = re.compile(r"\s+")
+
+__all__ = ["plegar_acentos", "normalizar"]
+
+
+def plegar_acentos(text: str) -> str:
+    """Minúsculas y sin diacríticos (``str.translate``, una pasada)."""
+    return text.lower().translate(_PLIEGUE)
+
+
+def normalizar(text: str) -> str:
+    """Clave canónica: sin acentos, minúsculas, espacios colapsados y sin
+    signos de apertura / cierre en los extremos (``¿Dónde?`` ≡ ``donde``)."""
+    return _ESPACIOS.sub(" ", plegar_acentos(text)).strip(" ¿¡?!.,;:")
@@ -4,7 +4,10 @@
 # ==============================================================================
 
 from .engine import engine
-from .models import Base, Cliente, Empleado, DisponibilidadPersonal, Servicio, Producto, Cita
+from .models import (
+    Base, Cliente, Empleado, DisponibilidadPersonal, Servicio, Producto, Cita, AgendaBloqueo,
+    ResumenDisponibilidad,
+)
 
 def bootstrap_db():
     """
@@ -1,9 +1,10 @@
 # db/models.py
-from datetime import datetime, date, time                # ← tipos Python
+from datetime import datetime, date, time, timedelta     # ← tipos Python
 from decimal import Decimal
 from sqlalchemy import (
     Column, String, Integer, Date, Time, Text, Numeric,
-    DateTime, MetaData, UniqueConstraint, Boolean, ForeignKey
+    DateTime, MetaData, UniqueConstraint, Boolean, ForeignKey, Index,
+    event, inspect, select
 )
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
@@ -134,6 +135,8 @@ class Cita(Base):
     __tablename__ = "citas"
     __table_args__ = (
         UniqueConstraint("fecha", "hora", "empleado_id", name="uq_empleado_slot"),
+        # agenda de un empleado en un día → rango por hora (EXISTS de solapes)
+        Index("ix_citas_empleado_fecha_hora", "empleado_id", "fecha", "hora"),
     )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
@@ -141,6 +144,10 @@ class Cita(Base):
     fecha: Mapped[date] = mapped_column(Date,  nullable=False)   # ← date/time Python
     hora:  Mapped[time] = mapped_column(Time,  nullable=False)
 
+    # duración/fin propios de la cita (se fijan al reservar; ver before_insert)
+    duracion_min: Mapped[int]  = mapped_column(Integer, nullable=False)
+    hora_fin:     Mapped[time] = mapped_column(Time,    nullable=False)
+
     cliente_id:  Mapped[int] = mapped_column(ForeignKey("clientes_oliva.id"),    nullable=False)
     servicio_id: Mapped[int] = mapped_column(ForeignKey("servicios_oliva.id"),   nullable=False)
     empleado_id: Mapped[int] = mapped_column(ForeignKey("personal_oliva.id"),    nullable=True)
@@ -149,6 +156,70 @@ class Cita(Base):
     servicio = relationship("Servicio")
     empleado = relationship("Empleado", back_populates="citas")
 
+
+# ─────────────────────── 5-Bis. Candado de agenda ───────────────────────
+class AgendaBloqueo(Base):
+    """Fila-candado por (empleado, día): se actualiza antes de reservar para
+    serializar, a nivel BD, las reservas concurrentes de esa agenda."""
+    __tablename__ = "agenda_bloqueos"
+
+    empleado_id: Mapped[int]  = mapped_column(ForeignKey("personal_oliva.id"), primary_key=True)
+    fecha:       Mapped[date] = mapped_column(Date, primary_key=True)
+    version:     Mapped[int]  = mapped_column(Integer, nullable=False, default=0)
+
+
+# ─────────────────────── 5-Ter. Resumen de disponibilidad ───────────────────────
+class ResumenDisponibilidad(Base):
+    """Minutos libres materializados por (empleado, día, bucket de duración).
+
+    ``minutos_libres`` suma los tramos libres de al menos ``duracion_bucket``
+    minutos; > 0 ⇒ ese día aún cabe un servicio de esa duración. Lo mantiene
+    ``core.disponibilidad_resumen``."""
+    __tablename__ = "disponibilidad_resumen"
+    __table_args__ = (
+        # teclado de fechas: bucket + rango de días → una lectura por índice
+        Index(
+            "ix_disponibilidad_resumen_bucket_fecha",
+            "duracion_bucket", "fecha", "minutos_libres",
+        ),
+    )
+
+    empleado_id:     Mapped[int]  = mapped_column(ForeignKey("personal_oliva.id"), primary_key=True)
+    fecha:           Mapped[date] = mapped_column(Date, primary_key=True)
+    duracion_bucket: Mapped[int]  = mapped_column(Integer, primary_key=True)
+    minutos_libres:  Mapped[int]  = mapped_column(Integer, nullable=False, default=0)
+
+
+DURACION_DEFAULT_MIN = 60
+
+
+def fin_de_cita(hora: time, duracion_min: int) -> time:
+    """``hora + duracion_min`` sin pasar de medianoche (citas del mismo día)."""
+    fin = datetime.combine(date.min, hora) + timedelta(minutes=duracion_min)
+    return fin.time() if fin.date() == date.min else time.max
+
+
+@event.listens_for(Cita, "before_insert")
+def _fijar_fin_cita(_mapper, connection, target: Cita) -> None:
+    """Si no se indicó duración, se toma la del servicio reservado."""
+    if target.duracion_min is None:
+        row = connection.execute(
+            select(Servicio.duracion_max, Servicio.duracion_min)
+            .where(Servicio.id == target.servicio_id)
+        ).first()
+        target.duracion_min = (row and (row[0] or row[1])) or DURACION_DEFAULT_MIN
+    if target.hora_fin is None:
+        target.hora_fin = fin_de_cita(target.hora, target.duracion_min)
+
+
+@event.listens_for(Cita, "before_update")
+def _recalcular_fin_cita(_mapper, _connection, target: Cita) -> None:
+    """Reagendar (cambiar hora o duración) mueve también ``hora_fin``."""
+    estado = inspect(target)
+    cambio = estado.attrs.hora.history.has_changes() or estado.attrs.duracion_min.history.has_changes()
+    if cambio and not estado.attrs.hora_fin.history.has_changes():
+        target.hora_fin = fin_de_cita(target.hora, target.duracion_min)
+
 # ─────────────────────── (más tablas…) ───────────────────────
 #  Cuando crees Venta, DetalleTicket, etc. - agrégalas DESPUÉS
 #  y actualiza las relationships que habían quedado comentadas.
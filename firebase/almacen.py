@@ -0,0 +1,344 @@
+# firebase/almacen.py
+"""Almacenamiento del historial de chat, intercambiable por ``HISTORIAL_BACKEND``.
+
+Semántica común (la usan ``firebase.history``, ``firebase.write_behind`` y
+``firebase.langchain_memory``):
+    - Un registro *append‑only* por ``(colección, user_id)``; cada mensaje
+      tiene un ``id`` ordenable por tiempo (``nuevo_id``) que sirve de cursor.
+    - ``agregar(lote)`` escribe sin leer antes y es idempotente por id
+      (reintentar un lote escrito a medias no duplica).
+    - ``pagina(colección, user_id, limit, before)`` devuelve del más nuevo
+      al más viejo, cada mensaje con su ``id``; el costo depende de
+      ``limit``, no del largo del historial.
+
+Backends:
+    firestore → ``{colección}/{user_id}/messages/{id}`` (+ arreglo legado
+                ``messages`` en el padre mientras no se migre).
+    sqlite    → un archivo local en modo WAL (``HISTORIAL_SQLITE``): pruebas
+                de carga sin proyecto y despliegues de un solo nodo.
+
+Uso:
+    from firebase.almacen import almacen
+    almacen().agregar([("chat_history", "u1", nuevo_id(ahora), {...})])
+"""
+from __future__ import annotations
+
+import json
+import os
+import secrets
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from google.api_core.exceptions import FailedPrecondition
+from google.cloud import firestore
+
+# ───────────────────────── Configuración ──────────────────────────
+BACKEND        = os.getenv("HISTORIAL_BACKEND", "firestore").lower()     # firestore | sqlite
+SQLITE_RUTA    = os.getenv("HISTORIAL_SQLITE", "data/historial.sqlite3")
+FS_MAX_BATCH   = 500                                                     # límite de Firestore
+
+Pendiente = Tuple[str, str, str, Dict[str, Any]]   # (colección, user_id, msg_id, entrada)
+
+__all__ = [
+    "AlmacenHistorial", "AlmacenFirestore", "AlmacenSQLite",
+    "almacen", "nuevo_id", "micros", "ordenar_pagina",
+]
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_lock_ids = threading.Lock()
+_ultimo_micros = 0
+
+# ───────────────────────── ids ordenables ─────────────────────────
+
+def micros(ts: Any) -> int:
+    """Microsegundos UTC desde 1970 (``0`` si *ts* no es fecha)."""
+    if not isinstance(ts, datetime):
+        return 0
+    if ts.tzinfo is None:                       # utcnow() ingenuo
+        ts = ts.replace(tzinfo=timezone.utc)
+    return (ts - _EPOCH) // timedelta(microseconds=1)
+
+
+def nuevo_id(ts: datetime) -> str:
+    """Id ordenable; dentro del proceso nunca repite ni retrocede el µs."""
+    global _ultimo_micros
+    with _lock_ids:
+        _ultimo_micros = max(micros(ts), _ultimo_micros + 1)
+        return f"{_ultimo_micros:016d}-{secrets.token_hex(3)}"
+
+
+def _id_legado(ts: Any, i: int) -> str:
+    return f"{micros(ts):016d}-v1{i:05d}"
+
+
+def ordenar_pagina(
+    mensajes: Iterable[Dict[str, Any]], limit: Optional[int], before: Optional[str]
+) -> List[Dict[str, Any]]:
+    """Sin duplicados (por ``id``), anteriores a *before*, del más nuevo al más viejo."""
+    unicos = {m["id"]: m for m in mensajes if not before or m["id"] < before}
+    return sorted(unicos.values(), key=lambda m: m["id"], reverse=True)[:limit]
+
+# ───────────────────────── Interfaz ───────────────────────────────
+
+class AlmacenHistorial(ABC):
+    """Registro de mensajes por ``(colección, user_id)``."""
+
+    @abstractmethod
+    def agregar(self, lote: Iterable[Pendiente]) -> int:
+        """Escribe *lote* sin leer antes; devuelve los *commits* hechos."""
+
+    @abstractmethod
+    def pagina(
+        self, coleccion: str, user_id: str,
+        limit: Optional[int] = None, before: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """Hasta *limit* mensajes (todos si es ``None``) con id < *before*, nuevos primero."""
+
+    @abstractmethod
+    def usuarios(self, coleccion: str, tam_pagina: int = 200) -> Iterator[str]:
+        """Todos los ``user_id`` de *coleccion*, leídos por páginas."""
+
+    @abstractmethod
+    def borrar(self, coleccion: str, user_id: str) -> None:
+        """Elimina el historial completo de *user_id*."""
+
+    def migrar(self, coleccion: str, user_id: str) -> int:
+        """Pasa datos con esquema viejo al actual; ``0`` si no hay nada que migrar."""
+        return 0
+
+# ───────────────────────── Firestore ──────────────────────────────
+
+class AlmacenFirestore(AlmacenHistorial):
+    """Subcolección append‑only; lee también el arreglo legado del padre."""
+
+    def __init__(self, db: Any = None, subcoleccion: str = "messages") -> None:
+        self._db = db
+        self.subcoleccion = subcoleccion
+
+    @property
+    def db(self) -> Any:
+        if self._db is None:
+            from firebase.client import db     # perezoso: no inicializa Firebase al importar
+            self._db = db
+        return self._db
+
+    def _padre(self, coleccion: str, user_id: str) -> Any:
+        return self.db.collection(coleccion).document(user_id)
+
+    def agregar(self, lote: Iterable[Pendiente]) -> int:
+        """Un ``set`` por mensaje + ``last_updated`` por usuario; ``WriteBatch`` de hasta 500."""
+        ahora = datetime.utcnow()
+        ops: List[Tuple[Any, Dict[str, Any], bool]] = []
+        padres = set()
+        for coleccion, user_id, msg_id, entrada in lote:
+            padre = self._padre(coleccion, user_id)
+            if (coleccion, user_id) not in padres:
+                padres.add((coleccion, user_id))
+                ops.append((padre, {"last_updated": ahora}, True))
+            ops.append((padre.collection(self.subcoleccion).document(msg_id), entrada, False))
+        commits = 0
+        for i in range(0, len(ops), FS_MAX_BATCH):
+            batch = self.db.batch()
+            for ref, datos, merge in ops[i:i + FS_MAX_BATCH]:
+                batch.set(ref, datos, merge=merge)
+            batch.commit()
+            commits += 1
+        return commits
+
+    def pagina(
+        self, coleccion: str, user_id: str,
+        limit: Optional[int] = None, before: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        padre = self._padre(coleccion, user_id)
+        mensajes = padre.collection(self.subcoleccion)
+        consulta = mensajes.order_by("__name__", direction=firestore.Query.DESCENDING)
+        if before:
+            consulta = consulta.where(filter=firestore.FieldFilter("__name__", "<", mensajes.document(before)))
+        if limit is not None:
+            consulta = consulta.limit(limit)
+        pagina = [{**s.to_dict(), "id": s.id} for s in consulta.stream()]
+        if limit is None or len(pagina) < limit:     # quizá quede historial sin migrar
+            pagina += self._legado(padre)
+        return ordenar_pagina(pagina, limit, before)
+
+    @staticmethod
+    def _legado(padre: Any) -> List[Dict[str, Any]]:
+        snap = padre.get()
+        legado = (snap.to_dict() or {}).get("messages") if snap.exists else None
+        return [{**m, "id": _id_legado(m.get("timestamp"), i)} for i, m in enumerate(legado or [])]
+
+    def usuarios(self, coleccion: str, tam_pagina: int = 200) -> Iterator[str]:
+        ultimo = None
+        while True:
+            consulta = self.db.collection(coleccion).order_by("__name__").limit(tam_pagina)
+            if ultimo is not None:
+                consulta = consulta.start_after(ultimo)
+            pagina = list(consulta.stream())
+            for snap in pagina:
+                yield snap.id
+            if len(pagina) < tam_pagina:
+                return
+            ultimo = pagina[-1]
+
+    def borrar(self, coleccion: str, user_id: str) -> None:
+        padre = self._padre(coleccion, user_id)
+        refs = [s.reference for s in padre.collection(self.subcoleccion).stream()]
+        for i in range(0, len(refs), FS_MAX_BATCH):
+            batch = self.db.batch()
+            for ref in refs[i:i + FS_MAX_BATCH]:
+                batch.delete(ref)
+            batch.commit()
+        padre.set({"messages": firestore.DELETE_FIELD}, merge=True)
+
+    def migrar(self, coleccion: str, user_id: str) -> int:
+        """Copia el arreglo ``messages`` del padre a la subcolección (idempotente).
+
+        Mientras dura, las lecturas combinan ambos lados sin duplicar (mismos
+        ids); al final se borra el arreglo. Devuelve los mensajes copiados.
+        """
+        padre = self._padre(coleccion, user_id)
+        mensajes = padre.collection(self.subcoleccion)
+        for _ in range(5):
+            snap = padre.get()
+            legado = (snap.to_dict() or {}).get("messages") if snap.exists else None
+            if not legado:
+                return 0
+            for i in range(0, len(legado), FS_MAX_BATCH):
+                batch = self.db.batch()
+                for j, m in enumerate(legado[i:i + FS_MAX_BATCH], start=i):
+                    batch.set(mensajes.document(_id_legado(m.get("timestamp"), j)), m)
+                batch.commit()
+            try:
+                # sólo si nadie tocó el padre desde la lectura (p. ej. una
+                # instancia vieja agregando al arreglo); si no, se repite
+                padre.update(
+                    {"messages": firestore.DELETE_FIELD},
+                    option=self.db.write_option(last_update_time=snap.update_time),
+                )
+                return len(legado)
+            except FailedPrecondition:
+                continue
+        raise RuntimeError(f"No se pudo migrar el historial de {user_id}: el documento cambia sin parar")
+
+# ───────────────────────── SQLite ─────────────────────────────────
+
+def _a_json(valor: Any) -> Any:
+    if isinstance(valor, datetime):
+        return {"$dt": valor.isoformat()}
+    raise TypeError(f"No serializable: {type(valor).__name__}")
+
+
+def _de_json(obj: Dict[str, Any]) -> Any:
+    return datetime.fromisoformat(obj["$dt"]) if obj.keys() == {"$dt"} else obj
+
+
+class AlmacenSQLite(AlmacenHistorial):
+    """Un archivo local en modo WAL; lectores concurrentes con un escritor.
+
+    La clave primaria ``(coleccion, user_id, id)`` hace que una página sea
+    un recorrido de índice de *limit* filas. Una conexión por hilo.
+    """
+
+    def __init__(self, ruta: Union[str, Path] = SQLITE_RUTA) -> None:
+        self.ruta = str(ruta)
+        if self.ruta != ":memory:":
+            Path(self.ruta).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._conexiones: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._con().execute(
+            "CREATE TABLE IF NOT EXISTS mensajes ("
+            " coleccion TEXT NOT NULL, user_id TEXT NOT NULL, id TEXT NOT NULL,"
+            " datos TEXT NOT NULL, PRIMARY KEY (coleccion, user_id, id)"
+            ") WITHOUT ROWID"
+        )
+
+    def _con(self) -> sqlite3.Connection:
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.ruta, timeout=30, isolation_level=None, check_same_thread=False)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")     # durable por commit de WAL, sin fsync por mensaje
+            self._local.con = con
+            with self._lock:
+                self._conexiones.append(con)
+        return con
+
+    def agregar(self, lote: Iterable[Pendiente]) -> int:
+        filas = [
+            (c, u, m, json.dumps(e, default=_a_json, ensure_ascii=False)) for c, u, m, e in lote
+        ]
+        if not filas:
+            return 0
+        con = self._con()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            con.executemany("INSERT OR REPLACE INTO mensajes VALUES (?, ?, ?, ?)", filas)
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+        con.execute("COMMIT")
+        return 1
+
+    def pagina(
+        self, coleccion: str, user_id: str,
+        limit: Optional[int] = None, before: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        sql = "SELECT id, datos FROM mensajes WHERE coleccion = ? AND user_id = ?"
+        params: List[Any] = [coleccion, user_id]
+        if before:
+            sql += " AND id < ?"
+            params.append(before)
+        sql += " ORDER BY id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [
+            {**json.loads(datos, object_hook=_de_json), "id": msg_id}
+            for msg_id, datos in self._con().execute(sql, params)
+        ]
+
+    def usuarios(self, coleccion: str, tam_pagina: int = 200) -> Iterator[str]:
+        ultimo = ""
+        while True:
+            pagina = [u for (u,) in self._con().execute(
+                "SELECT DISTINCT user_id FROM mensajes WHERE coleccion = ? AND user_id > ?"
+                " ORDER BY user_id LIMIT ?", (coleccion, ultimo, tam_pagina),
+            )]
+            yield from pagina
+            if len(pagina) < tam_pagina:
+                return
+            ultimo = pagina[-1]
+
+    def borrar(self, coleccion: str, user_id: str) -> None:
+        self._con().execute("DELETE FROM mensajes WHERE coleccion = ? AND user_id = ?", (coleccion, user_id))
+
+    def cerrar(self) -> None:
+        with self._lock:
+            for con in self._conexiones:
+                con.close()
+            self._conexiones.clear()
+        self._local = threading.local()
+
+# ───────────────────────── Selección ──────────────────────────────
+
+_almacen: Optional[AlmacenHistorial] = None
+_lock_almacen = threading.Lock()
+
+
+def almacen() -> AlmacenHistorial:
+    """Backend del proceso según ``HISTORIAL_BACKEND`` (se crea al primer uso)."""
+    global _almacen
+    with _lock_almacen:
+        if _almacen is None:
+            if BACKEND == "sqlite":
+                _almacen = AlmacenSQLite(SQLITE_RUTA)
+            elif BACKEND == "firestore":
+                _almacen = AlmacenFirestore()
+            else:
+                raise ValueError(f"HISTORIAL_BACKEND desconocido: {BACKEND!r} (firestore | sqlite)")
+        return _almacen
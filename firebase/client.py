@@ -1,5 +1,6 @@
 from dotenv import load_dotenv
 import os
+import threading
 import firebase_admin
 from firebase_admin import credentials, firestore
 
@@ -8,10 +9,26 @@ load_dotenv()
 #clave
 cred_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS", "firebase/firebase_key.json")
 
-#inicializa Firebase si no se ha hecho ya
-if not firebase_admin._apps:
-    cred = credentials.Certificate(cred_path)
-    firebase_admin.initialize_app(cred)
+_db = None
+_lock = threading.Lock()
 
-#cliente de Firestore disponible para importar desde otros módulos
-db = firestore.client()
+def get_db():
+    """
+    Cliente de Firestore; inicializa Firebase en la primera llamada (no al
+    importar), así el backend SQLite y las pruebas no necesitan la clave.
+    """
+    global _db
+    with _lock:
+        if _db is None:
+            #inicializa Firebase si no se ha hecho ya
+            if not firebase_admin._apps:
+                cred = credentials.Certificate(cred_path)
+                firebase_admin.initialize_app(cred)
+            _db = firestore.client()
+        return _db
+
+def __getattr__(nombre):
+    #cliente de Firestore disponible para importar desde otros módulos: from firebase.client import db
+    if nombre == "db":
+        return get_db()
+    raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
@@ -1,17 +1,51 @@
-from firebase.client import db
+"""Historial de chat por usuario.
+
+Esquema (append‑only, un registro por mensaje; ver ``firebase.almacen``):
+
+    chat_history/{user_id}                     → {"last_updated": …}
+    chat_history/{user_id}/messages/{msg_id}   → {"role", "content", "timestamp", …}
+
+``msg_id`` = microsegundos UTC (16 dígitos) + sufijo: ordena por tiempo y
+sirve de cursor, así que leer los últimos N mensajes cuesta N lecturas
+tenga el usuario 10 o 10 000 (y ningún documento se acerca a 1 MiB).
+
+El backend (Firestore o SQLite local) se elige con ``HISTORIAL_BACKEND``;
+importar este módulo no inicializa Firebase.
+
+Migración sin caída (Firestore): los documentos viejos (arreglo
+``messages`` en el padre) se siguen leyendo y completan las páginas
+mientras exista el arreglo. ``migrar_usuario`` copia el arreglo a la
+subcolección con ids deterministas (idempotente) y después borra el
+campo; ``python -m scripts.migrar_historial`` recorre toda la colección.
+"""
+import os
 from datetime import datetime
-from google.cloud.firestore_v1 import ArrayUnion
+from typing import Any, Dict, Iterator, List, Union
+
+from firebase.almacen import almacen, micros, nuevo_id, ordenar_pagina
+from firebase.write_behind import EscrituraDiferida
 
 COLLECTION = "chat_history"
+PAGINA = int(os.getenv("HISTORIAL_PAGINA", "50"))
+WRITE_BEHIND = os.getenv("FS_WRITE_BEHIND", "1") != "0"   # 0 → escritura síncrona
+
+__all__ = ["save_message", "get_history", "iterar_historial", "migrar_usuario", "nuevo_id"]
+
+# Cola compartida del proceso (se vacía sola por tamaño / tiempo y al salir)
+escritura = EscrituraDiferida()
+
+# ───────────────────────── escritura ──────────────────────────────
 
 def save_message(user_id: str, role: str, content: str, **extra_fields):
     """
-    Guarda un mensaje en la colección 'chat_history' en Firestore.
+    Guarda un mensaje en la colección 'chat_history'.
     El rol puede ser 'user', 'assistant', 'bot', etc.
     Extra fields se pueden usar para intención, corte recomendado, etc.
-    """
-    doc_ref = db.collection(COLLECTION).document(user_id)
 
+    Por defecto no espera al backend: el mensaje entra a la cola de
+    escritura diferida (``firebase.write_behind``). Devuelve ``False`` si
+    se descartó por saturación.
+    """
     #entrada base del mensaje
     new_entry = {
         "role": role,
@@ -21,25 +55,48 @@ def save_message(user_id: str, role: str, content: str, **extra_fields):
 
     # Agrega cualquier otro campo adicional proporcionado
     new_entry.update(extra_fields)
+    msg_id = nuevo_id(new_entry["timestamp"])
+
+    if WRITE_BEHIND:
+        return escritura.encolar(COLLECTION, user_id, msg_id, new_entry)
+
+    # Mensaje nuevo + last_updated del padre, sin leer antes (un commit)
+    almacen().agregar([(COLLECTION, user_id, msg_id, new_entry)])
+    return True
 
-    # Actualiza documento o lo crea
-    doc = doc_ref.get()
-    if doc.exists:
-        doc_ref.update({
-            "messages": ArrayUnion([new_entry]),
-            "last_updated": datetime.utcnow()
-        })
-    else:
-        doc_ref.set({
-            "messages": [new_entry],
-            "last_updated": datetime.utcnow()
-        })
-
-def get_history(user_id: str) -> list:
+# ───────────────────────── lectura ────────────────────────────────
+
+def get_history(
+    user_id: str,
+    limit: int = PAGINA,
+    before: Union[str, datetime, None] = None,
+) -> List[Dict[str, Any]]:
     """
-    Recupera el historial completo de un usuario desde Firestore.
+    Página del historial, del mensaje más nuevo al más viejo.
+
+    Cada mensaje trae su ``id``; para la página siguiente se pasa
+    ``before=pagina[-1]["id"]`` (o una fecha). Incluye lo que aún espera en
+    la cola de escritura.
     """
-    doc = db.collection(COLLECTION).document(user_id).get()
-    if doc.exists:
-        return doc.to_dict().get("messages", [])
-    return []
+    if isinstance(before, datetime):
+        before = f"{micros(before):016d}"
+    pagina = almacen().pagina(COLLECTION, user_id, limit=limit, before=before)
+    pagina += escritura.pendientes(COLLECTION, user_id)
+    return ordenar_pagina(pagina, limit, before)
+
+
+def iterar_historial(user_id: str, tam_pagina: int = PAGINA) -> Iterator[Dict[str, Any]]:
+    """Todo el historial de *user_id*, del más nuevo al más viejo, por páginas."""
+    before = None
+    while True:
+        pagina = get_history(user_id, limit=tam_pagina, before=before)
+        yield from pagina
+        if len(pagina) < tam_pagina:
+            return
+        before = pagina[-1]["id"]
+
+# ───────────────────────── migración ──────────────────────────────
+
+def migrar_usuario(user_id: str) -> int:
+    """Pasa el arreglo ``messages`` viejo a registros por mensaje (idempotente)."""
+    return almacen().migrar(COLLECTION, user_id)
@@ -1,8 +1,13 @@
-from google.cloud import firestore
-from typing import List, Dict
+import os
+from typing import List, Dict, Optional, Sequence, Tuple
+from datetime import datetime
 from langchain.schema import BaseMessage, HumanMessage, AIMessage
 from langchain_core.chat_history import BaseChatMessageHistory
-from firebase.client import db
+from firebase.almacen import AlmacenHistorial, almacen as almacen_del_proceso, nuevo_id
+
+# Tope de mensajes que carga ``messages`` (modo buffer): Firestore cobra una
+# lectura por documento de la subcolección. 0 → sin tope.
+HISTORIAL_CARGA_MAX = int(os.getenv("HISTORIAL_CARGA_MAX", "200"))
 
 def _message_to_dict(message: BaseMessage) -> Dict:
     return {
@@ -21,19 +26,54 @@ def _dict_to_message(d: Dict) -> BaseMessage:
 class FirestoreChatHistory(BaseChatMessageHistory):
     """
     Clase compatible con LangChain que guarda historial de mensajes simples
-    en Firestore (colección por default: langchain_memory).
+    en el backend del historial (``firebase.almacen``: Firestore por
+    default, o SQLite local) bajo la colección *namespace* (langchain_memory).
+
+    Un registro por mensaje (ids ordenables de ``nuevo_id``): agregar no lee
+    ni reescribe el resto, y dos mensajes simultáneos no se pisan. En
+    Firestore el arreglo ``messages`` de documentos viejos se sigue leyendo
+    (va antes que la subcolección).
+
+    La lista se lee una sola vez por instancia (una instancia por turno) y
+    se mantiene con *write‑through*: ``save_context`` de LangChain cuesta un
+    solo commit con el mensaje del usuario y la respuesta. Sólo se leen los
+    últimos *limite* mensajes (``HISTORIAL_CARGA_MAX``): el costo de un turno
+    no crece con la antigüedad del cliente.
     """
-    def __init__(self, user_id: str, namespace: str = "langchain_memory"):
+    def __init__(self, user_id: str, namespace: str = "langchain_memory",
+                 almacen: Optional[AlmacenHistorial] = None,
+                 limite: Optional[int] = HISTORIAL_CARGA_MAX or None):
         self.user_id = user_id
         self.namespace = namespace
-        self.collection = db.collection(namespace).document(user_id)
+        self.limite = limite
+        self._almacen = almacen
+        self._cache: Optional[List[BaseMessage]] = None
 
     @property
     def messages(self) -> List[BaseMessage]:
-        doc = self.collection.get()
-        if not doc.exists:
-            return []
-        return [_dict_to_message(d) for d in doc.to_dict().get("messages", [])]
+        if self._cache is None:
+            self._cache = self._cargar()
+        return list(self._cache)
+
+    @property
+    def almacen(self) -> AlmacenHistorial:
+        if self._almacen is None:
+            self._almacen = almacen_del_proceso()
+        return self._almacen
+
+    def _cargar(self) -> List[BaseMessage]:
+        ultimos = self.almacen.pagina(self.namespace, self.user_id, limit=self.limite)  # nuevos primero
+        return [_dict_to_message(d) for d in reversed(ultimos)]
+
+    def en_memoria(self) -> List[BaseMessage]:
+        """Lo que ya está cargado (sin ir al backend); vacío si aún no se leyó."""
+        return list(self._cache or [])
+
+    def ultimos(self, n: int, before: Optional[str] = None) -> List[Tuple[str, BaseMessage]]:
+        """Los últimos *n* mensajes (con id < *before*) con su id, del más viejo
+        al más nuevo, sin leer el resto."""
+        pagina = self.almacen.pagina(self.namespace, self.user_id, limit=n, before=before)
+        return [(d["id"], _dict_to_message(d)) for d in reversed(pagina)]
 
     def add_user_message(self, message: str) -> None:
         self._append_message(HumanMessage(content=message))
@@ -41,12 +81,22 @@ class FirestoreChatHistory(BaseChatMessageHistory):
     def add_ai_message(self, message: str) -> None:
         self._append_message(AIMessage(content=message))
 
+    def add_messages(self, messages: Sequence[BaseMessage]) -> List[str]:
+        """Todos los mensajes en un solo commit (y en la caché local); devuelve sus ids."""
+        if not messages:
+            return []
+        ahora = datetime.utcnow()
+        ids = [nuevo_id(ahora) for _ in messages]
+        self.almacen.agregar([
+            (self.namespace, self.user_id, i, _message_to_dict(m)) for i, m in zip(ids, messages)
+        ])
+        if self._cache is not None:
+            self._cache.extend(messages)
+        return ids
+
     def clear(self) -> None:
-        self.collection.set({"messages": []})
+        self.almacen.borrar(self.namespace, self.user_id)
+        self._cache = []
 
     def _append_message(self, message: BaseMessage) -> None:
-        doc = self.collection.get()
-        current = doc.to_dict() if doc.exists else {}
-        messages = current.get("messages", [])
-        messages.append(_message_to_dict(message))
-        self.collection.set({"messages": messages})
+        self.add_messages([message])
@@ -0,0 +1,182 @@
+# firebase/write_behind.py
+"""Escritura diferida (*write‑behind*) del historial en Firestore.
+
+👀 Responsabilidades:
+    - ``encolar`` devuelve de inmediato: el webhook no espera a Firestore.
+    - Un hilo agrupa los mensajes por usuario y los escribe con
+      ``WriteBatch`` cuando hay ``FS_LOTE`` pendientes o pasan
+      ``FS_FLUSH_SEG`` segundos desde el primero.
+    - Sin lecturas previas: el lote va completo a
+      ``AlmacenHistorial.agregar`` (``firebase.almacen``); en Firestore es un
+      documento nuevo por mensaje y ``last_updated`` una vez por usuario.
+    - Memoria acotada: con ``FS_MAX_PENDIENTES`` en cola, ``encolar`` espera
+      hasta ``FS_ESPERA_MAX`` s; si Firestore sigue sin drenar se descarta
+      el mensaje y se cuenta (``metricas["descartados"]``).
+    - Si un ``commit`` falla, los mensajes vuelven al frente de la cola
+      y se reintenta con *backoff* (los ``msg_id`` se fijan al encolar:
+      reescribir un lote a medias no duplica).
+    - ``cerrar`` (también en ``atexit``) vacía lo pendiente antes de salir.
+"""
+from __future__ import annotations
+
+import atexit
+import logging
+import os
+import threading
+import time as _time
+from collections import Counter, deque
+from typing import Any, Deque, Dict, List, Optional
+
+from firebase.almacen import AlmacenHistorial, Pendiente, almacen as almacen_del_proceso
+
+logger = logging.getLogger(__name__)
+
+# ───────────────────────── Configuración ──────────────────────────
+FS_LOTE           = int(os.getenv("FS_LOTE", "200"))                # mensajes por flush
+FS_FLUSH_SEG      = float(os.getenv("FS_FLUSH_SEG", "0.5"))         # espera máx. de un mensaje
+FS_MAX_PENDIENTES = int(os.getenv("FS_MAX_PENDIENTES", "10000"))    # tope de memoria
+FS_ESPERA_MAX     = float(os.getenv("FS_ESPERA_MAX", "2"))          # s bloqueado si está lleno
+
+__all__ = ["EscrituraDiferida"]
+
+
+class EscrituraDiferida:
+    """Cola de mensajes por usuario con vaciado por tamaño o tiempo."""
+
+    def __init__(
+        self,
+        almacen: Optional[AlmacenHistorial] = None,
+        max_lote: int = FS_LOTE,
+        intervalo: float = FS_FLUSH_SEG,
+        max_pendientes: int = FS_MAX_PENDIENTES,
+        espera_max: float = FS_ESPERA_MAX,
+    ) -> None:
+        self._almacen = almacen
+        self.max_lote = max_lote
+        self.intervalo = intervalo
+        self.max_pendientes = max_pendientes
+        self.espera_max = espera_max
+        self._cola: Deque[Pendiente] = deque()
+        self._cond = threading.Condition()
+        self._en_vuelo = 0
+        self._primero: Optional[float] = None     # monotonic del más antiguo pendiente
+        self._cerrado = False
+        self._hilo: Optional[threading.Thread] = None
+        self.metricas: Counter[str] = Counter()
+
+    @property
+    def almacen(self) -> AlmacenHistorial:
+        if self._almacen is None:             # perezoso: el backend se elige al primer uso
+            self._almacen = almacen_del_proceso()
+        return self._almacen
+
+    # ---------- productor ----------
+    def encolar(self, coleccion: str, user_id: str, msg_id: str, entrada: Dict[str, Any]) -> bool:
+        """Agrega *entrada*; ``False`` si se descartó por contrapresión."""
+        with self._cond:
+            if self._hilo is None:
+                self._arrancar()
+            plazo = _time.monotonic() + self.espera_max
+            while len(self._cola) + self._en_vuelo >= self.max_pendientes and not self._cerrado:
+                self.metricas["esperas"] += 1
+                restante = plazo - _time.monotonic()
+                if restante <= 0 or not self._cond.wait(restante):
+                    self.metricas["descartados"] += 1
+                    logger.warning("Historial saturado: se descarta mensaje de %s", user_id)
+                    return False
+            self._cola.append((coleccion, user_id, msg_id, entrada))
+            self.metricas["encolados"] += 1
+            if self._primero is None:            # arranca el reloj del consumidor
+                self._primero = _time.monotonic()
+                self._cond.notify_all()
+            elif len(self._cola) >= self.max_lote:
+                self._cond.notify_all()
+            return True
+
+    def pendientes(self, coleccion: str, user_id: str) -> List[Dict[str, Any]]:
+        """Entradas aún no escritas de *user_id* (con su ``id``), en orden de llegada."""
+        with self._cond:
+            return [{**e, "id": m} for c, u, m, e in self._cola if c == coleccion and u == user_id]
+
+    # ---------- consumidor ----------
+    def _arrancar(self) -> None:
+        self._hilo = threading.Thread(target=self._bucle, name="historial-write-behind", daemon=True)
+        self._hilo.start()
+        atexit.register(self.cerrar)
+
+    def _tomar_lote(self) -> List[Pendiente]:
+        with self._cond:
+            while not self._cerrado:
+                if len(self._cola) >= self.max_lote:
+                    break
+                if self._primero is not None:
+                    restante = self._primero + self.intervalo - _time.monotonic()
+                    if restante <= 0:
+                        break
+                    self._cond.wait(restante)
+                else:
+                    self._cond.wait()
+            n = min(len(self._cola), self.max_lote)
+            lote = [self._cola.popleft() for _ in range(n)]
+            self._en_vuelo += n
+            self._primero = _time.monotonic() if self._cola else None
+            return lote
+
+    def _bucle(self) -> None:
+        espera = 0.1
+        while True:
+            lote = self._tomar_lote()
+            if not lote:
+                if self._cerrado:
+                    return
+                continue
+            try:
+                self._escribir(lote)
+                espera = 0.1
+                devueltos: List[Pendiente] = []
+            except Exception as e:
+                # ids fijos: reintentar un lote escrito a medias no duplica
+                self.metricas["errores"] += 1
+                logger.warning("Firestore: lote de historial no escrito (%s); se reintenta", e)
+                devueltos = lote
+            with self._cond:
+                self._en_vuelo -= len(lote)
+                if devueltos:
+                    self._cola.extendleft(reversed(devueltos))
+                    self._primero = self._primero or _time.monotonic()
+                self._cond.notify_all()
+            if devueltos:
+                if self._cerrado:
+                    self.metricas["perdidos"] += len(devueltos)
+                    return
+                _time.sleep(espera)
+                espera = min(espera * 2, 5.0)
+
+    def _escribir(self, lote: List[Pendiente]) -> None:
+        self.metricas["commits"] += self.almacen.agregar(lote)
+        self.metricas["escritos"] += len(lote)
+        self.metricas["usuarios"] += len({(c, u) for c, u, _, _ in lote})
+
+    # ---------- control ----------
+    def vaciar(self, timeout: float = 10.0) -> bool:
+        """Fuerza el vaciado y espera a que no quede nada pendiente."""
+        plazo = _time.monotonic() + timeout
+        with self._cond:
+            self._primero = _time.monotonic() - self.intervalo if self._cola else self._primero
+            self._cond.notify_all()
+            while self._cola or self._en_vuelo:
+                restante = plazo - _time.monotonic()
+                if restante <= 0:
+                    return False
+                self._cond.wait(restante)
+        return True
+
+    def cerrar(self, timeout: float = 10.0) -> None:
+        """Vacía lo pendiente y detiene el hilo (idempotente)."""
+        if self._hilo is None or self._cerrado:
+            return
+        self.vaciar(timeout)
+        with self._cond:
+            self._cerrado = True
+            self._cond.notify_all()
+        self._hilo.join(timeout)
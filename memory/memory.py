@@ -1,22 +1,444 @@
 # memory/memory.py
+"""Memoria conversacional del modelo (LangChain) por usuario.
+
+Modos (``MEMORIA_MODO``):
+    acotada → ``MemoriaAcotada``: últimos ``MEMORIA_TURNOS`` turnos literales +
+              un resumen acumulado de lo anterior, con tope de
+              ``MEMORIA_MAX_TOKENS`` por llamada. El prompt deja de crecer con
+              la antigüedad del cliente.
+    buffer  → ``ConversationBufferMemory`` con todo el historial (como antes).
+
+El resumen se guarda junto al historial, en la colección
+``{MEMORY_NAMESPACE}_resumen`` del mismo backend (``firebase.almacen``),
+con el id del último mensaje que cubre: nunca se recalcula desde cero. Las
+llamadas al LLM para resumir corren en un pool propio
+(``en_segundo_plano``), fuera del turno y del candado del usuario.
+
+Métricas (``metricas``): tokens del prompt por turno con la memoria acotada
+(``tokens_prompt``) y los que habría mandado el buffer completo
+(``tokens_sin_acotar``); ``reporte()`` da los promedios por turno.
+
+Caché por *worker* (``cache_memoria``): el estado cargado de cada usuario
+(ventana + resumen, o la lista completa en modo buffer) vive en un LRU con
+TTL por inactividad; los mensajes nuevos se escriben al backend y a la
+caché a la vez, así que en una sesión activa el historial se lee una sola
+vez. Supone que los mensajes de un usuario llegan al mismo *worker*
+(o que ``MEMORIA_CACHE_TTL`` acota lo que puede quedar viejo); cualquier
+cambio hecho por fuera se avisa con ``cache_memoria.invalidar(user_id)``.
+"""
+import logging
+import os
+import sys
+import threading
+import time as _time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from langchain.memory import ConversationBufferMemory
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain.schema import AIMessage, BaseMessage, HumanMessage, SystemMessage, get_buffer_string
+from pydantic import PrivateAttr
+
 from firebase.langchain_memory import FirestoreChatHistory
 
+logger = logging.getLogger(__name__)
+
 # Namespace exclusivo para la memoria del modelo (separado del historial enriquecido)
 MEMORY_NAMESPACE = "langchain_memory"
 
-def get_memory(user_id: str) -> ConversationBufferMemory:
+# ───────────────────────── Configuración ──────────────────────────
+MEMORIA_MODO       = os.getenv("MEMORIA_MODO", "acotada").lower()       # acotada | buffer
+MEMORIA_TURNOS     = int(os.getenv("MEMORIA_TURNOS", "6"))              # turnos literales (K)
+MEMORIA_MAX_TOKENS = int(os.getenv("MEMORIA_MAX_TOKENS", "1500"))       # tope por llamada
+RESUMEN_CADA       = int(os.getenv("MEMORIA_RESUMEN_CADA", "4"))        # mensajes por actualización
+RESUMEN_MAX_TOKENS = int(os.getenv("MEMORIA_RESUMEN_MAX_TOKENS", "250"))
+RESUMEN_ID         = "actual"                                           # un registro por usuario
+RESUMEN_HILOS      = int(os.getenv("MEMORIA_RESUMEN_HILOS", "2"))       # pool de resúmenes
+SEMILLA_MAX        = int(os.getenv("MEMORIA_SEMILLA_MAX", "200"))       # historial previo a resumir
+MEMORIA_CACHE_MAX  = int(os.getenv("MEMORIA_CACHE_MAX", "1000"))        # usuarios por worker
+MEMORIA_CACHE_TTL  = float(os.getenv("MEMORIA_CACHE_TTL", "900"))       # s sin actividad
+
+metricas: Counter = Counter()
+_lock_metricas = threading.Lock()
+
+# ───────────────────────── Tokens ─────────────────────────────────
+
+def estimar_tokens(mensajes: List[BaseMessage]) -> int:
+    """Aproximación barata (~4 caracteres por token + 4 de formato por mensaje).
+
+    Basta para un tope con margen; no depende del tokenizador del modelo.
+    """
+    return sum(len(str(m.content)) // 4 + 4 for m in mensajes)
+
+
+def _recortar(texto: str, tokens: int) -> str:
+    return texto if len(texto) <= tokens * 4 else "…" + texto[-tokens * 4:]
+
+# ───────────────────────── Resumen ────────────────────────────────
+
+def resumir_con_llm(resumen: str, nuevos: List[BaseMessage]) -> Optional[str]:
+    """Resumen previo + mensajes que salen de la ventana → resumen nuevo (o ``None``)."""
+    from core.llm_gateway import llm
+
+    conversacion = get_buffer_string(nuevos, human_prefix="Cliente", ai_prefix="Oliva")
+    return llm.chat([
+        {"role": "system", "content": (
+            "Actualiza el resumen de una conversación entre un cliente y Oliva, la "
+            "asistente del salón. Conserva sólo lo útil para atenderlo después: nombre, "
+            "servicios o productos de interés, citas agendadas/canceladas y preferencias. "
+            f"Responde sólo con el resumen, en español, en menos de {RESUMEN_MAX_TOKENS * 3 // 4} palabras."
+        )},
+        {"role": "user", "content": f"Resumen actual:\n{resumen or '(vacío)'}\n\nMensajes nuevos:\n{conversacion}"},
+    ], max_tokens=RESUMEN_MAX_TOKENS, temperature=0)
+
+_resumidor: Optional[ThreadPoolExecutor] = None
+_lock_resumidor = threading.Lock()
+
+
+def en_segundo_plano(tarea: Callable[[], None]) -> None:
+    """Encola *tarea* en el pool de resúmenes (se crea al primer uso)."""
+    global _resumidor
+    with _lock_resumidor:
+        if _resumidor is None:
+            _resumidor = ThreadPoolExecutor(RESUMEN_HILOS, thread_name_prefix="resumen")
+    _resumidor.submit(tarea)
+
+# ───────────────────────── Memoria acotada ────────────────────────
+
+class MemoriaAcotada(BaseChatMemory):
+    """Ventana de *k* turnos + resumen incremental, con tope de tokens.
+
+    Una instancia por turno: al primer uso lee el resumen y los mensajes
+    posteriores a lo que cubre (``hasta``), en páginas de ``2k + resumen_cada``
+    hacia atrás; normalmente basta una. Lo que sale de la ventana se acumula
+    y, cada ``resumen_cada`` mensajes, se pliega al resumen con una llamada a
+    *resumir* que corre con *diferir* (por defecto ``en_segundo_plano``), sin
+    retener el candado: el turno no espera al LLM. Un solo plegado a la vez
+    por usuario; si falla se reintenta el turno siguiente con los mismos
+    mensajes (también tras reiniciar: siguen después de ``hasta``).
+
+    La primera vez que se ve a un usuario con historial anterior (modo
+    buffer) se guarda un resumen vacío cuyo ``hasta`` lo deja fuera de la
+    ventana y se marca ``semilla``: los últimos ``SEMILLA_MAX`` mensajes de
+    ese historial se resumen una sola vez, también en segundo plano. Si
+    falla, la marca sigue en el backend y se reintenta en la próxima carga.
+    """
+
+    memory_key: str = "chat_history"
+    return_messages: bool = True
+    k: int = MEMORIA_TURNOS
+    max_tokens: int = MEMORIA_MAX_TOKENS
+    resumen_cada: int = RESUMEN_CADA
+    resumir: Callable[[str, List[BaseMessage]], Optional[str]] = resumir_con_llm
+    diferir: Callable[[Callable[[], None]], Any] = en_segundo_plano
+
+    # compartidos con ``cache_memoria`` (``get_memory`` los inyecta)
+    _estado: Dict[str, Any] = PrivateAttr(default_factory=dict)
+    _lock: Any = PrivateAttr(default_factory=threading.RLock)
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+
+    # ---------- estado ----------
+    @property
+    def _coleccion_resumen(self) -> str:
+        return f"{self.chat_memory.namespace}_resumen"
+
+    def _cargar(self) -> Dict[str, Any]:
+        if not self._estado:
+            h = self.chat_memory
+            n = 2 * self.k + self.resumen_cada
+            previo = h.almacen.pagina(self._coleccion_resumen, h.user_id, limit=1)
+            if previo:
+                previo = previo[0]
+                recientes = self._posteriores(previo.get("hasta", ""), n)
+            else:                                     # usuario nuevo para la memoria acotada
+                previo = {"resumen": "", "hasta": "", "tokens_resumidos": 0, "semilla": ""}
+                recientes = h.ultimos(n + 1)
+                if len(recientes) > n:
+                    # lo anterior a ``semilla`` se resume aparte (``_sembrar``)
+                    previo["hasta"] = recientes.pop(0)[0]
+                    previo["semilla"] = recientes[0][0]
+                self._guardar_resumen(previo)
+            corte = max(0, len(recientes) - 2 * self.k)
+            self._estado.update({
+                "resumen": previo.get("resumen", ""),
+                "hasta": previo.get("hasta", ""),
+                "tokens_resumidos": previo.get("tokens_resumidos", 0),
+                "semilla": previo.get("semilla", ""),
+                "pendientes": recientes[:corte],      # fuera de la ventana, sin resumir
+                "ventana": recientes[corte:],
+                "plegando": False,
+            })
+            if self._estado["semilla"]:
+                self._estado["plegando"] = True
+                self.diferir(self._sembrar)
+        return self._estado
+
+    def _posteriores(self, hasta: str, n: int) -> List[Tuple[str, BaseMessage]]:
+        """Todos los mensajes con id > *hasta*, en páginas de *n* hacia atrás."""
+        recientes: List[Tuple[str, BaseMessage]] = []
+        antes: Optional[str] = None
+        while True:
+            pagina = self.chat_memory.ultimos(n, before=antes)
+            nuevos = [(i, m) for i, m in pagina if i > hasta]
+            recientes[:0] = nuevos
+            if len(nuevos) < n:                       # llegó a ``hasta`` o al inicio
+                return recientes
+            antes = pagina[0][0]
+
+    def _guardar_resumen(self, e: Dict[str, Any]) -> None:
+        h = self.chat_memory
+        h.almacen.agregar([(self._coleccion_resumen, h.user_id, RESUMEN_ID, {
+            "resumen": e["resumen"],
+            "hasta": e["hasta"],
+            "tokens_resumidos": e["tokens_resumidos"],
+            "semilla": e.get("semilla", ""),
+            "timestamp": datetime.utcnow(),
+        })])
+
+    # ---------- lectura ----------
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            e = self._cargar()
+            ventana = [m for _, m in e["pendientes"] + e["ventana"]]
+            resumen = e["resumen"]
+            sin_acotar = e["tokens_resumidos"] + estimar_tokens(ventana)
+
+        recortes = 0
+        while ventana and estimar_tokens(self._prompt(resumen, ventana)) > self.max_tokens:
+            ventana.pop(0)                            # primero lo más viejo
+            recortes += 1
+        if estimar_tokens(self._prompt(resumen, ventana)) > self.max_tokens:
+            resumen = _recortar(resumen, self.max_tokens - 8)
+        mensajes = self._prompt(resumen, ventana)
+
+        with _lock_metricas:
+            metricas["turnos"] += 1
+            metricas["tokens_prompt"] += estimar_tokens(mensajes)
+            metricas["tokens_sin_acotar"] += sin_acotar
+            metricas["recortes"] += recortes
+        if self.return_messages:
+            return {self.memory_key: mensajes}
+        return {self.memory_key: get_buffer_string(mensajes)}
+
+    @staticmethod
+    def _prompt(resumen: str, ventana: List[BaseMessage]) -> List[BaseMessage]:
+        if not resumen:
+            return list(ventana)
+        return [SystemMessage(content=f"Resumen de la conversación previa: {resumen}")] + ventana
+
+    # ---------- escritura ----------
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        entrada, salida = self._get_input_output(inputs, outputs)
+        nuevos = [HumanMessage(content=entrada), AIMessage(content=salida)]
+        with self._lock:
+            e = self._cargar()
+            ids = self.chat_memory.add_messages(nuevos)      # write‑through, un commit
+            e["ventana"] += list(zip(ids, nuevos))
+            corte = max(0, len(e["ventana"]) - 2 * self.k)
+            e["pendientes"] += e["ventana"][:corte]
+            e["ventana"] = e["ventana"][corte:]
+            plegar = len(e["pendientes"]) >= self.resumen_cada and not e["plegando"]
+            if plegar:
+                e["plegando"] = True
+        if plegar:
+            self.diferir(self._plegar)
+
+    def _resumir_fuera(self, resumen: str, mensajes: List[BaseMessage]) -> Optional[str]:
+        """*resumir* sin el candado; ``None`` si falla."""
+        try:
+            return self.resumir(resumen, mensajes)
+        except Exception as exc:
+            logger.warning("No se pudo actualizar el resumen de %s: %s", self.chat_memory.user_id, exc)
+            return None
+
+    def _publicar(self, e: Dict[str, Any], ok: bool) -> None:
+        """Cierra un plegado: guarda *e* (copia hecha bajo el candado) y sólo
+        después libera la marca, para que un plegado posterior no la pise."""
+        if ok:
+            try:
+                self._guardar_resumen(e)
+            except Exception:
+                logger.exception("No se pudo guardar el resumen de %s", self.chat_memory.user_id)
+                ok = False
+        with self._lock:
+            if "pendientes" in self._estado:
+                self._estado["plegando"] = False
+        with _lock_metricas:
+            metricas["resumenes" if ok else "resumenes_fallidos"] += 1
+
+    def _plegar(self) -> None:
+        """Pliega los ``pendientes`` actuales al resumen; en *diferir*, no en el turno."""
+        e = self._estado
+        with self._lock:
+            lote = list(e.get("pendientes", []))
+            resumen = e.get("resumen", "")
+        mensajes = [m for _, m in lote]
+        nuevo = self._resumir_fuera(resumen, mensajes) if lote else None
+        with self._lock:
+            if "pendientes" not in e:                 # ``clear`` mientras tanto
+                return
+            # los turnos de mientras sólo agregan al final de ``pendientes``
+            vigente = [i for i, _ in e["pendientes"][:len(lote)]] == [i for i, _ in lote]
+            if nuevo and vigente:
+                e["resumen"] = nuevo.strip()
+                e["hasta"] = lote[-1][0]
+                e["tokens_resumidos"] += estimar_tokens(mensajes)
+                e["pendientes"] = e["pendientes"][len(lote):]
+            copia = dict(e)
+        self._publicar(copia, bool(nuevo and vigente))
+
+    def _sembrar(self) -> None:
+        """Resume una vez el historial anterior a la memoria acotada (ids < ``semilla``)."""
+        e = self._estado
+        with self._lock:
+            semilla = e.get("semilla", "")
+        viejos: List[BaseMessage] = []
+        previo: Optional[str] = None
+        try:
+            if semilla:
+                viejos = [m for _, m in self.chat_memory.ultimos(SEMILLA_MAX, before=semilla)]
+            previo = self._resumir_fuera("", viejos) if viejos else ""
+        except Exception as exc:
+            logger.warning("No se pudo leer el historial previo de %s: %s", self.chat_memory.user_id, exc)
+        with self._lock:
+            if "pendientes" not in e:
+                return
+            ok = previo is not None and e.get("semilla") == semilla
+            if ok:
+                if previo:                            # va antes de lo ya plegado
+                    e["resumen"] = "\n".join(filter(None, [previo.strip(), e["resumen"]]))
+                    e["tokens_resumidos"] += estimar_tokens(viejos)
+                e["semilla"] = ""
+            copia = dict(e)
+        self._publicar(copia, ok)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.chat_memory.clear()
+            self.chat_memory.almacen.borrar(self._coleccion_resumen, self.chat_memory.user_id)
+            self._estado.clear()
+
+
+def reporte() -> Dict[str, float]:
+    """Promedios por turno de ``metricas`` (tokens enviados vs. buffer completo)."""
+    turnos = metricas["turnos"] or 1
+    return {
+        "turnos": metricas["turnos"],
+        "tokens_prompt_por_turno": metricas["tokens_prompt"] / turnos,
+        "tokens_sin_acotar_por_turno": metricas["tokens_sin_acotar"] / turnos,
+        "resumenes": metricas["resumenes"],
+        "resumenes_fallidos": metricas["resumenes_fallidos"],
+        "recortes": metricas["recortes"],
+    }
+
+# ───────────────────────── Caché por worker ───────────────────────
+
+@dataclass
+class Conversacion:
+    """Estado cargado de un usuario; lo comparten las memorias de sus turnos."""
+    historial: FirestoreChatHistory
+    estado: Dict[str, Any] = field(default_factory=dict)       # MemoriaAcotada
+    lock: Any = field(default_factory=threading.RLock)
+    usado: float = field(default_factory=_time.monotonic)
+
+    def bytes_aprox(self) -> int:
+        """Huella aproximada: contenido de los mensajes y del resumen en memoria."""
+        mensajes = self.historial.en_memoria() + [
+            m for _, m in self.estado.get("pendientes", []) + self.estado.get("ventana", [])
+        ]
+        total = sys.getsizeof(self.estado.get("resumen", ""))
+        for m in mensajes:
+            total += sys.getsizeof(m.content) + sys.getsizeof(m)
+        return total
+
+
+class CacheConversaciones:
+    """``user_id → Conversacion`` con LRU (``max_usuarios``) y TTL por inactividad."""
+
+    def __init__(
+        self,
+        max_usuarios: int = MEMORIA_CACHE_MAX,
+        ttl: float = MEMORIA_CACHE_TTL,
+        namespace: str = MEMORY_NAMESPACE,
+    ) -> None:
+        self.max_usuarios = max_usuarios
+        self.ttl = ttl
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._datos: "OrderedDict[str, Conversacion]" = OrderedDict()
+        self.metricas_: Counter[str] = Counter()
+
+    def obtener(self, user_id: str) -> Conversacion:
+        """La conversación en caché de *user_id*, o una nueva (sin leer nada aún)."""
+        ahora = _time.monotonic()
+        with self._lock:
+            conv = self._datos.get(user_id)
+            if conv is not None and ahora - conv.usado > self.ttl:
+                del self._datos[user_id]
+                self.metricas_["expiradas"] += 1
+                conv = None
+            if conv is not None:
+                self._datos.move_to_end(user_id)
+                self.metricas_["hits"] += 1
+            else:
+                conv = Conversacion(FirestoreChatHistory(user_id=user_id, namespace=self.namespace))
+                self._datos[user_id] = conv
+                self.metricas_["misses"] += 1
+                while len(self._datos) > self.max_usuarios:
+                    self._datos.popitem(last=False)
+                    self.metricas_["desalojadas"] += 1
+            conv.usado = ahora
+            return conv
+
+    def invalidar(self, user_id: str) -> bool:
+        """Olvida el estado de *user_id* (p. ej. su historial cambió en otro proceso)."""
+        with self._lock:
+            quitado = self._datos.pop(user_id, None) is not None
+            if quitado:
+                self.metricas_["invalidadas"] += 1
+            return quitado
+
+    def limpiar(self) -> None:
+        with self._lock:
+            self._datos.clear()
+
+    def metricas(self) -> Dict[str, float]:
+        with self._lock:
+            m: Dict[str, float] = dict(self.metricas_)
+            conversaciones = list(self._datos.values())
+        m["entradas"] = len(conversaciones)
+        m["bytes_aprox"] = sum(c.bytes_aprox() for c in conversaciones)
+        total = m.get("hits", 0) + m.get("misses", 0)
+        m["hit_ratio"] = m.get("hits", 0) / total if total else 0.0
+        return m
+
+
+cache_memoria = CacheConversaciones()
+
+# ───────────────────────── Punto de entrada ───────────────────────
+
+def get_memory(user_id: str) -> BaseChatMemory:
     """
     Inicializa la memoria conversacional para el usuario especificado,
-    utilizando Firestore como backend con el namespace 'langchain_memory'.
+    utilizando el backend del historial con el namespace 'langchain_memory'.
+
+    El estado ya cargado se reutiliza desde ``cache_memoria``.
     """
-    chat_history = FirestoreChatHistory(user_id=user_id, namespace=MEMORY_NAMESPACE)
+    conv = cache_memoria.obtener(user_id)
 
-    memory = ConversationBufferMemory(
-        memory_key="chat_history",
-        chat_memory=chat_history,
-        return_messages=True
-    )
+    if MEMORIA_MODO == "buffer":
+        return ConversationBufferMemory(
+            memory_key="chat_history",
+            chat_memory=conv.historial,
+            return_messages=True
+        )
 
-    return memory
+    memoria = MemoriaAcotada(chat_memory=conv.historial)
+    memoria._estado, memoria._lock = conv.estado, conv.lock
+    return memoria
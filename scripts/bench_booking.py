@@ -0,0 +1,141 @@
+"""
+scripts/bench_booking.py
+────────────────────────
+Benchmark de reservas concurrentes (webhooks simultáneos) contra SQLite.
+
+Para 1‑64 clientes en un ``ThreadPoolExecutor`` cada cliente intenta reservar
+horas aleatorias (rejilla de 15 min) de **un mismo empleado**, forzando la
+máxima contención. Se mide, por modo de reserva:
+
+• reservas/s        → citas confirmadas / tiempo total
+• doble booking     → pares de citas solapadas / citas confirmadas
+• errores           → excepciones que hubieran sido un 500
+
+Modos (``core.booking_handler.BOOKING_MODE``):
+• optimista  → check‑then‑insert (comportamiento previo)
+• exclusiva  → candado striped + fila‑candado en BD + reintento
+
+Uso:
+    python -m scripts.bench_booking
+    python -m scripts.bench_booking --clientes 1 8 64 --intentos 30
+
+Requiere el mismo entorno que ``pytest`` (variables AZ_* y OPENAI_API_KEY),
+porque importa ``db`` y ``core.booking_handler``.
+"""
+
+import argparse
+import random
+import tempfile
+import time as _time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from pathlib import Path
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+
+from db.models import Base, Servicio, Empleado, Cliente
+import core.booking_handler as bh
+
+DIAS = 5
+HORAS = [f"{h:02d}:{m:02d}" for h in range(9, 19) for m in (0, 15, 30, 45)]
+
+_SQL_SOLAPES = text("""
+    SELECT COUNT(*) FROM citas a
+    JOIN citas b
+      ON a.empleado_id = b.empleado_id AND a.fecha = b.fecha AND a.id < b.id
+     AND a.hora < b.hora_fin AND b.hora < a.hora_fin
+""")
+
+
+def _engine(path: Path):
+    eng = create_engine(
+        f"sqlite:///{path}",
+        connect_args={"timeout": 30, "check_same_thread": False},
+        pool_size=80, max_overflow=0,
+    )
+
+    @event.listens_for(eng, "connect")
+    def _wal(dbapi_conn, _):
+        dbapi_conn.execute("PRAGMA journal_mode=WAL")
+
+    Base.metadata.create_all(eng)
+    return eng
+
+
+def _seed(Session) -> tuple[int, int, int, date]:
+    with Session() as s:
+        svc = Servicio(nombre="Corte Dama", categoria="Cortes", duracion_min=60)
+        emp = Empleado(nombre="Lupita", puesto="Estilista", telefono="5550001111",
+                       email="lupita@test.com")
+        cli = Cliente(nombre="Ana", telefono="5551234567", email="ana@test.com")
+        s.add_all([svc, emp, cli]); s.commit()
+        ids = svc.id, emp.id, cli.id
+    inicio = date.today() + timedelta(days=1)
+    while inicio.weekday() == 6:
+        inicio += timedelta(days=1)
+    return (*ids, inicio)
+
+
+def correr(modo: str, clientes: int, intentos: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        eng = _engine(Path(tmp) / "bench.db")
+        Session = sessionmaker(bind=eng, autoflush=False)
+        bh.SessionLocal = Session
+        bh.BOOKING_MODE = modo
+        svc_id, emp_id, cli_id, inicio = _seed(Session)
+
+        def cliente(seed: int) -> tuple[int, int]:
+            rnd = random.Random(seed)
+            ok = errores = 0
+            for _ in range(intentos):
+                data = {
+                    "cliente_id": cli_id, "servicio_id": svc_id, "empleado_id": emp_id,
+                    "fecha": (inicio + timedelta(days=rnd.randrange(DIAS))).isoformat(),
+                    "hora": rnd.choice(HORAS),
+                }
+                try:
+                    ok += bool(bh.process_booking_request(data).get("ok"))
+                except Exception:
+                    errores += 1
+            return ok, errores
+
+        t0 = _time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clientes) as pool:
+            res = list(pool.map(cliente, range(clientes)))
+        dt = _time.perf_counter() - t0
+
+        with eng.connect() as conn:
+            solapes = conn.execute(_SQL_SOLAPES).scalar()
+        eng.dispose()
+
+    ok = sum(r[0] for r in res)
+    return {
+        "modo": modo,
+        "clientes": clientes,
+        "reservas": ok,
+        "reservas_s": ok / dt if dt else 0.0,
+        "doble_booking": solapes / ok if ok else 0.0,
+        "errores": sum(r[1] for r in res),
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    ap.add_argument("--clientes", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    ap.add_argument("--intentos", type=int, default=20, help="reservas por cliente")
+    ap.add_argument("--modos", nargs="+", default=["optimista", "exclusiva"])
+    args = ap.parse_args()
+
+    print(f"{'modo':<10} {'clientes':>8} {'reservas':>9} {'res/s':>8} {'doble%':>7} {'errores':>8}")
+    for modo in args.modos:
+        for n in args.clientes:
+            r = correr(modo, n, args.intentos)
+            print(
+                f"{r['modo']:<10} {r['clientes']:>8} {r['reservas']:>9} "
+                f"{r['reservas_s']:>8.1f} {r['doble_booking']*100:>6.1f}% {r['errores']:>8}"
+            )
+
+
+if __name__ == "__main__":
+    main()
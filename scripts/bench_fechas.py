@@ -0,0 +1,85 @@
+"""
+scripts/bench_fechas.py
+───────────────────────
+Exactitud y latencia del parseo de fechas sobre un corpus etiquetado
+(``data/corpus_fechas.csv``, relativo a ``AHORA``).
+
+Compara:
+
+• local   → ``utils.fecha_local.resolver_fecha`` (gramática, sin red)
+• llm     → ``parse_datetime_with_ai`` (una llamada por texto)
+• cascada → ``datetime_parser``: local y, si no resuelve, LLM
+
+Uso:
+    python -m scripts.bench_fechas                # sólo local
+    python -m scripts.bench_fechas --llm          # + llm y cascada (gasta tokens)
+
+Para ``--llm`` se requiere ``OPENAI_API_KEY`` (u ``OPENAI_BASE_URL`` a un
+servidor compatible).
+"""
+
+import argparse
+import csv
+import time as _time
+from datetime import datetime
+from pathlib import Path
+
+from utils.datetime_parser import datetime_parser, detect_datetime_patterns, parse_datetime_with_ai
+from utils.fecha_local import resolver_fecha
+
+CORPUS = Path("data/corpus_fechas.csv")
+AHORA = datetime(2025, 7, 16, 10, 0)        # miércoles
+
+
+def _cargar(ruta: Path) -> list:
+    with open(ruta, newline="", encoding="utf-8") as f:
+        return [(r["texto"], r["esperado"]) for r in csv.DictReader(f)]
+
+
+def _medir(nombre: str, fn, corpus: list, repeticiones: int = 1) -> None:
+    resueltos = correctos = 0
+    t0 = _time.perf_counter()
+    for _ in range(repeticiones):
+        for texto, esperado in corpus:
+            iso = fn(texto)
+            resueltos += iso is not None
+            correctos += iso == esperado
+    dt = (_time.perf_counter() - t0) / (len(corpus) * repeticiones)
+    resueltos //= repeticiones
+    correctos //= repeticiones
+    print(
+        f"{nombre:<8} {correctos / len(corpus):>9.1%} {resueltos / len(corpus):>10.1%} "
+        f"{resueltos - correctos:>8} {dt * 1e3:>12.3f}"
+    )
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    ap.add_argument("--corpus", type=Path, default=CORPUS)
+    ap.add_argument("--llm", action="store_true", help="medir también el LLM (gasta tokens)")
+    ap.add_argument("--repeticiones", type=int, default=200, help="sólo para el camino local")
+    args = ap.parse_args()
+    corpus = _cargar(args.corpus)
+
+    def local(texto):
+        r = resolver_fecha(texto, AHORA)
+        return r.iso() if r else None
+
+    def llm(texto):
+        iso = parse_datetime_with_ai(texto, detect_datetime_patterns(texto), AHORA)
+        return iso[0] if iso else None
+
+    def cascada(texto):
+        iso = datetime_parser(texto, AHORA)
+        return iso[0] if iso else None
+
+    print(f"Corpus: {len(corpus)} textos · ahora = {AHORA:%Y-%m-%d %H:%M (%A)}")
+    print(f"{'camino':<8} {'exactitud':>9} {'resueltos':>10} {'erróneos':>8} {'ms/llamada':>12}")
+    _medir("local", local, corpus, args.repeticiones)
+    if args.llm:
+        _medir("llm", llm, corpus)
+        _medir("cascada", cascada, corpus)
+
+
+if __name__ == "__main__":
+    main()
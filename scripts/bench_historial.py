@@ -0,0 +1,106 @@
+"""
+scripts/bench_historial.py
+──────────────────────────
+Costo de ``save_message`` visto desde el webhook, con N hilos guardando
+mensajes de U usuarios:
+
+• sincrono      → esquema previo: ``get()`` + ``update``/``set`` por mensaje
+• write_behind  → ``firebase.write_behind.EscrituraDiferida`` (un documento por
+                  mensaje en la subcolección, lotes con ``WriteBatch``)
+• sqlite        → ``firebase.almacen.AlmacenSQLite`` síncrono (WAL, un commit
+                  por mensaje): el backend de un solo nodo, sin red
+
+Se reporta la latencia media por llamada (lo que espera el webhook), las
+escrituras/s sostenidas hasta que todo queda en Firestore y las idas y
+vueltas a Firestore.
+
+Uso:
+    python -m scripts.bench_historial                       # Firestore en memoria
+    python -m scripts.bench_historial --latencia 0.03 --mensajes 2000
+    FIRESTORE_EMULATOR_HOST=localhost:8080 python -m scripts.bench_historial --emulador
+"""
+
+import argparse
+import sys
+import tempfile
+import time as _time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+from google.cloud.firestore_v1 import ArrayUnion
+
+from firebase.almacen import AlmacenFirestore, AlmacenSQLite, nuevo_id
+from firebase.write_behind import EscrituraDiferida
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "tests"))
+from fake_firestore import FirestoreEnMemoria  # noqa: E402
+
+COLECCION = "bench_chat_history"
+
+
+def _sincrono(db, user_id: str, entrada: dict) -> None:
+    ref = db.collection(COLECCION).document(user_id)
+    if ref.get().exists:
+        ref.update({"messages": ArrayUnion([entrada]), "last_updated": datetime.utcnow()})
+    else:
+        ref.set({"messages": [entrada], "last_updated": datetime.utcnow()})
+
+
+def _correr(nombre: str, guardar, terminar, args) -> None:
+    def uno(i: int) -> float:
+        t0 = _time.perf_counter()
+        guardar(f"u{i % args.usuarios}", {
+            "role": "user", "content": f"mensaje {i}", "timestamp": datetime.utcnow(),
+        })
+        return _time.perf_counter() - t0
+
+    t0 = _time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.hilos) as pool:
+        latencias = list(pool.map(uno, range(args.mensajes)))
+    terminar()
+    total = _time.perf_counter() - t0
+    print(
+        f"{nombre:<13} {sum(latencias) / len(latencias) * 1e3:>10.2f} "
+        f"{args.mensajes / total:>12,.0f}"
+    )
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    ap.add_argument("--mensajes", type=int, default=1000)
+    ap.add_argument("--usuarios", type=int, default=50)
+    ap.add_argument("--hilos", type=int, default=16)
+    ap.add_argument("--latencia", type=float, default=0.02, help="s por ida y vuelta (en memoria)")
+    ap.add_argument("--emulador", action="store_true", help="usar FIRESTORE_EMULATOR_HOST")
+    args = ap.parse_args()
+
+    def nuevo_db():
+        if args.emulador:
+            from google.cloud import firestore
+            return firestore.Client(project="demo-oliva")
+        return FirestoreEnMemoria(latencia=args.latencia)
+
+    print(f"{args.mensajes} mensajes · {args.usuarios} usuarios · {args.hilos} hilos")
+    print(f"{'esquema':<13} {'ms/llamada':>10} {'mensajes/s':>12}")
+
+    db = nuevo_db()
+    _correr("sincrono", lambda u, e: _sincrono(db, u, e), lambda: None, args)
+    if not args.emulador:
+        print(f"{'':<13} idas a Firestore: {sum(db.metricas.values()):,}")
+
+    db = nuevo_db()
+    cola = EscrituraDiferida(AlmacenFirestore(db))
+    _correr("write_behind", lambda u, e: cola.encolar(COLECCION, u, nuevo_id(e["timestamp"]), e), cola.cerrar, args)
+    if not args.emulador:
+        print(f"{'':<13} idas a Firestore: {db.metricas['commits']:,} commits")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        local = AlmacenSQLite(Path(tmp) / "bench.sqlite3")
+        _correr("sqlite", lambda u, e: local.agregar([(COLECCION, u, nuevo_id(e["timestamp"]), e)]),
+                lambda: None, args)
+        local.cerrar()
+
+
+if __name__ == "__main__":
+    main()
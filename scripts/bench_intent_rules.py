@@ -0,0 +1,106 @@
+"""
+scripts/bench_intent_rules.py
+─────────────────────────────
+Micro‑benchmark del nivel de reglas de ``core.message_predictor``.
+
+Compara, para el mismo juego de reglas:
+
+• por_intencion → una regex por intención, probadas en orden (esquema previo)
+• compiladas    → ``ReglasCompiladas``: trie de palabras clave en una sola
+                  regex, una pasada
+
+con las reglas reales y con *k* palabras clave sintéticas extra por
+intención, para ver cómo escala cada esquema. El corpus mezcla mensajes que
+activan reglas y mensajes que no (el peor caso: se revisan todas).
+
+Uso:
+    python -m scripts.bench_intent_rules
+    python -m scripts.bench_intent_rules --extra 0 100 500 --repeticiones 20
+
+Requiere ``OPENAI_API_KEY`` en el entorno (lo exige ``core.message_predictor``
+al importarse; no se hace ninguna llamada).
+"""
+
+import argparse
+import random
+import re
+import string
+import time as _time
+
+from core.message_predictor import _QUICK_RULES, ReglasCompiladas, plegar_acentos
+
+MENSAJES = [
+    "Hola, buenos días",
+    "¿Dónde están ubicados?",
+    "Quiero pagar con tarjeta",
+    "Me enseñas los servicios",
+    "Necesito agendar cita mañana",
+    "La app no funciona, ayuda",
+    "¿Tienen shampoo sin sal?",
+    "Gracias, nos vemos el viernes",
+    "Perfecto, muchas gracias por todo",
+    "¿Aceptan perros en el local? Es pequeño y tranquilo",
+]
+
+
+def _reglas(extra: int, rnd: random.Random) -> dict:
+    """Reglas reales + *extra* palabras aleatorias (que no aparecen en el corpus)."""
+    reglas = {}
+    for intent, patrones in _QUICK_RULES.items():
+        sinteticas = [
+            "".join(rnd.choices(string.ascii_lowercase, k=rnd.randint(6, 10)))
+            for _ in range(extra)
+        ]
+        reglas[intent] = list(patrones) + sinteticas
+    return reglas
+
+
+class PorIntencion:
+    """Esquema previo: ``\\b(a|b|…)\\b`` por intención, probadas en orden."""
+
+    def __init__(self, reglas: dict) -> None:
+        self._regex = [
+            (intent, re.compile(rf"\b({'|'.join(patrones)})\b"))
+            for intent, patrones in reglas.items()
+        ]
+
+    def buscar(self, text: str):
+        for intent, regex in self._regex:
+            if regex.search(text):
+                return intent
+        return None
+
+
+def _medir(motor, textos: list, repeticiones: int) -> float:
+    t0 = _time.perf_counter()
+    for _ in range(repeticiones):
+        for t in textos:
+            motor.buscar(plegar_acentos(t))
+    dt = _time.perf_counter() - t0
+    return len(textos) * repeticiones / dt
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    ap.add_argument("--extra", type=int, nargs="+", default=[0, 50, 200, 500],
+                    help="palabras clave sintéticas extra por intención")
+    ap.add_argument("--repeticiones", type=int, default=200)
+    args = ap.parse_args()
+
+    rnd = random.Random(7)
+    textos = MENSAJES * 10
+
+    print(f"{'extra':>6} {'reglas':>7} {'por_intencion/s':>16} {'compiladas/s':>13} {'x':>6}")
+    for extra in args.extra:
+        reglas = _reglas(extra, rnd)
+        previo, nuevo = PorIntencion(reglas), ReglasCompiladas(reglas)
+        assert all(previo.buscar(plegar_acentos(t)) == nuevo.buscar(plegar_acentos(t))
+                   for t in textos)
+        a = _medir(previo, textos, args.repeticiones)
+        b = _medir(nuevo, textos, args.repeticiones)
+        n = sum(len(p) for p in reglas.values())
+        print(f"{extra:>6} {n:>7} {a:>16,.0f} {b:>13,.0f} {b / a:>6.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+scripts/entrenar_intencion.py
+─────────────────────────────
+Reentrena el modelo de intención con el historial etiquetado de Firestore
+(``core.entrenamiento_intencion``) y lo publica si reduce la caída al LLM.
+La versión publicada vive en ``models/versiones/`` (fuera de git); el
+``models/modelo_intencion.pkl`` del repo sólo es el respaldo.
+
+Uso:
+    python -m scripts.entrenar_intencion                # desde cero
+    python -m scripts.entrenar_intencion --continuar    # sólo mensajes nuevos
+    python -m scripts.entrenar_intencion --no-publicar  # sólo reporte
+
+Requiere ``OPENAI_API_KEY`` en el entorno (lo exige ``core.message_predictor``
+al importarse; no se hace ninguna llamada) y credenciales de Firebase.
+"""
+
+import argparse
+
+from core.entrenamiento_intencion import (
+    TAM_LOTE, TAM_PAGINA, documentos_firestore, ejemplos, entrenar, publicar, ultima_version,
+)
+from core.model_registry import registro
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    ap.add_argument("--continuar", action="store_true",
+                    help="seguir desde la última versión, con mensajes posteriores a ella")
+    ap.add_argument("--pagina", type=int, default=TAM_PAGINA)
+    ap.add_argument("--lote", type=int, default=TAM_LOTE)
+    ap.add_argument("--no-publicar", dest="publicar", action="store_false")
+    ap.add_argument("--forzar", action="store_true", help="publicar aunque no mejore")
+    args = ap.parse_args()
+
+    previo, desde = ultima_version() if args.continuar else (None, None)
+    datos = ejemplos(documentos_firestore(args.pagina), desde=desde)
+    modelo, rep = entrenar(datos, previo=previo, vigente=registro.obtener("modelo_intencion"), lote=args.lote)
+
+    print(f"Ejemplos: {rep.ejemplos:,} en {rep.lotes} lotes · evaluados: {rep.evaluados:,}")
+    print(f"Caída al LLM: {rep.fallback_antes:.1%} → {rep.fallback_despues:.1%}")
+    print(f"Acierto local: {rep.acierto_antes:.1%} → {rep.acierto_despues:.1%}")
+
+    if not rep.lotes:
+        print("Sin ejemplos nuevos; no se publica.")
+    elif args.publicar and (rep.mejora or args.forzar):
+        print(f"Publicado: {publicar(modelo, rep)}")
+    else:
+        print("No se publica (no mejora; usa --forzar para publicar igual).")
+
+
+if __name__ == "__main__":
+    main()
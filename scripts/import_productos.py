@@ -6,6 +6,9 @@ Estrategia ▸ UPSERT por `nombre`
 --------------------------------
 • Si el nombre YA existe → UPDATE de los campos cambiados
 • Si el nombre NO existe → INSERT de un nuevo producto
+
+Al final actualiza el índice semántico (core/embeddings.py) sólo con los
+productos nuevos o cambiados.
 """
 
 import re
@@ -17,6 +20,7 @@ from sqlalchemy.orm import Session
 
 from db.session import SessionLocal          # factory de scoped_session
 from db.models  import Producto              # ORM → tabla productos_oliva
+from core.embeddings import sincronizar_catalogo
 
 # ───── Ruta del CSV ──────────────────────────────────────────────────
 CSV_FILE = Path("data/productos.csv")        # ajusta la carpeta si cambias
@@ -83,11 +87,18 @@ def import_csv(path: Path = CSV_FILE) -> None:
         session.merge(prod)
 
     session.commit()
+
+    # Índice semántico: sólo se calculan vectores de lo nuevo / cambiado
+    try:
+        indice = sincronizar_catalogo(session, tipos=("producto",))
+    except Exception as e:               # la BD ya quedó; el índice se reintenta luego
+        indice = f"no actualizado ({e})"
     session.close()
 
     print(
         f"✅ Productos cargados / actualizados sin errores.\n"
-        f"   Nuevos: {nuevos} · Actualizados: {actualizados}"
+        f"   Nuevos: {nuevos} · Actualizados: {actualizados}\n"
+        f"   Índice semántico: {indice}"
     )
 
 
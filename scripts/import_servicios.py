@@ -6,6 +6,9 @@ dejándolos normalizados en la tabla dbo.servicios_oliva.
 
 • Si el nombre ya existe           → UPDATE  
 • Si el nombre no existe           → INSERT  
+
+Al final actualiza el índice semántico (core/embeddings.py) sólo con los
+servicios nuevos o cambiados.
 """
 
 import re
@@ -18,6 +21,7 @@ from sqlalchemy.orm import Session
 
 from db.session import SessionLocal          # scoped_session factory
 from db.models  import Servicio              # ORM
+from core.embeddings import sincronizar_catalogo
 
 CSV_FILE = Path("data/servicios.csv")        # <- ajusta ruta si es necesario
 # ──────────────────────────────────────────────────────────────────────────────
@@ -127,12 +131,19 @@ def import_csv(csv_path: Path = CSV_FILE) -> None:
             insertados += 1
 
     session.commit()
+
+    # Índice semántico: sólo se calculan vectores de lo nuevo / cambiado
+    try:
+        indice = sincronizar_catalogo(session, tipos=("servicio",))
+    except Exception as e:                   # la BD ya quedó; el índice se reintenta luego
+        indice = f"no actualizado ({e})"
     session.close()
 
     print(
         f"✅  Servicios procesados sin errores.\n"
         f"   • Nuevos: {insertados}\n"
-        f"   • Actualizados: {actualizados}"
+        f"   • Actualizados: {actualizados}\n"
+        f"   • Índice semántico: {indice}"
     )
 
 
@@ -0,0 +1,43 @@
+"""
+scripts/migrar_historial.py
+───────────────────────────
+Pasa el historial viejo (arreglo ``messages`` en ``chat_history/{user_id}``)
+a la subcolección ``chat_history/{user_id}/messages`` con
+``firebase.history.migrar_usuario``.
+
+Se puede correr con el bot en línea y repetir cuantas veces haga falta:
+los ids son deterministas y el arreglo sólo se borra si nadie lo tocó
+desde que se copió.
+
+Uso:
+    python -m scripts.migrar_historial
+    python -m scripts.migrar_historial --pagina 100
+"""
+
+import argparse
+
+from firebase.almacen import almacen
+from firebase.history import COLLECTION, migrar_usuario
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    ap.add_argument("--pagina", type=int, default=200, help="usuarios por lectura")
+    args = ap.parse_args()
+
+    usuarios = mensajes = errores = 0
+    for user_id in almacen().usuarios(COLLECTION, args.pagina):
+        try:
+            n = migrar_usuario(user_id)
+        except Exception as e:
+            errores += 1
+            print(f"⚠️  {user_id}: {e}")
+            continue
+        usuarios += bool(n)
+        mensajes += n
+
+    print(f"Migrados {mensajes:,} mensajes de {usuarios:,} usuarios · errores: {errores}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+# tests/fake_firestore.py
+"""Firestore en memoria (subconjunto) para pruebas y benchmarks sin proyecto.
+
+Imita lo que usa el historial: ``collection / document / get / set(merge) /
+update / delete / batch``, subcolecciones, consultas ``order_by / where / limit /
+start_after / stream``, ``ArrayUnion``, ``DELETE_FIELD`` y precondiciones
+``write_option(last_update_time=…)``. Latencia configurable por ida y
+vuelta (cada ``get``, ``set``, ``commit`` o consulta la paga una vez) y
+``metricas["lecturas"]`` cuenta documentos leídos, como la facturación.
+
+Uso:
+    db = FirestoreEnMemoria(latencia=0.02)
+    EscrituraDiferida(db).encolar("chat_history", "u1", "0001", {...})
+"""
+from __future__ import annotations
+
+import copy
+import threading
+import time as _time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from google.api_core.exceptions import FailedPrecondition, NotFound
+
+_OPS = {
+    "<": lambda a, b: a < b, "<=": lambda a, b: a <= b, "==": lambda a, b: a == b,
+    ">": lambda a, b: a > b, ">=": lambda a, b: a >= b,
+}
+
+
+def _aplicar(actual: Dict[str, Any], datos: Dict[str, Any]) -> None:
+    for campo, valor in datos.items():
+        if type(valor).__name__ == "Sentinel" and "delete" in repr(valor).lower():
+            actual.pop(campo, None)
+        elif type(valor).__name__ == "ArrayUnion":
+            lista = actual.setdefault(campo, [])
+            lista.extend(v for v in valor.values if v not in lista)
+        else:
+            actual[campo] = copy.deepcopy(valor)
+
+
+class _Snapshot:
+    def __init__(self, ref: "_DocRef", datos: Optional[Dict[str, Any]]) -> None:
+        self.reference = ref
+        self.id = ref.id
+        self.exists = datos is not None
+        self._datos = datos
+        self.update_time = ref._db.versiones.get(ref._ruta)
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        return copy.deepcopy(self._datos)
+
+
+class _DocRef:
+    def __init__(self, db: "FirestoreEnMemoria", ruta: Tuple[str, ...]) -> None:
+        self._db, self._ruta = db, ruta
+        self.id = ruta[-1]
+
+    def collection(self, nombre: str) -> "_Coleccion":
+        return _Coleccion(self._db, self._ruta + (nombre,))
+
+    def get(self) -> _Snapshot:
+        self._db._ida("lecturas")
+        with self._db._lock:
+            return _Snapshot(self, copy.deepcopy(self._db.docs.get(self._ruta)))
+
+    def set(self, datos: Dict[str, Any], merge: bool = False) -> None:
+        self._db._ida("escrituras")
+        self._db._set(self._ruta, datos, merge)
+
+    def update(self, datos: Dict[str, Any], option: Any = None) -> None:
+        self._db._ida("escrituras")
+        with self._db._lock:
+            if self._ruta not in self._db.docs:
+                raise NotFound(f"No existe {'/'.join(self._ruta)}")
+            if option is not None and self._db.versiones.get(self._ruta) != option:
+                raise FailedPrecondition("El documento cambió desde la lectura")
+        self._db._set(self._ruta, datos, True)
+
+    def delete(self) -> None:
+        self._db._ida("escrituras")
+        self._db._borrar(self._ruta)
+
+
+class _Consulta:
+    def __init__(self, col: "_Coleccion") -> None:
+        self._col = col
+        self._orden: List[Tuple[str, bool]] = []
+        self._filtros: List[Tuple[str, str, Any]] = []
+        self._limite: Optional[int] = None
+        self._despues: Optional[_Snapshot] = None
+
+    def _copia(self, **cambios) -> "_Consulta":
+        q = copy.copy(self)
+        q._orden, q._filtros = list(self._orden), list(self._filtros)
+        for k, v in cambios.items():
+            setattr(q, k, v)
+        return q
+
+    def order_by(self, campo: str, direction: str = "ASCENDING") -> "_Consulta":
+        q = self._copia()
+        q._orden.append((campo, direction == "DESCENDING"))
+        return q
+
+    def where(self, *args: Any, filter: Any = None) -> "_Consulta":  # noqa: A002 (API)
+        campo, op, valor = (filter.field_path, filter.op_string, filter.value) if filter else args
+        q = self._copia()
+        q._filtros.append((campo, op, valor))
+        return q
+
+    def limit(self, n: int) -> "_Consulta":
+        return self._copia(_limite=n)
+
+    def start_after(self, snap: _Snapshot) -> "_Consulta":
+        return self._copia(_despues=snap)
+
+    @staticmethod
+    def _valor(ruta: Tuple[str, ...], datos: Dict[str, Any], campo: str) -> Any:
+        return ruta[-1] if campo == "__name__" else datos.get(campo)
+
+    def stream(self):
+        db = self._col._db
+        db._ida("consultas")
+        n = len(self._col._ruta) + 1
+        with db._lock:
+            filas = [
+                (r, copy.deepcopy(d)) for r, d in db.docs.items()
+                if len(r) == n and r[:-1] == self._col._ruta
+            ]
+        for campo, op, valor in self._filtros:
+            if isinstance(valor, _DocRef):
+                valor = valor.id
+            filas = [(r, d) for r, d in filas if _OPS[op](self._valor(r, d, campo), valor)]
+        orden = self._orden or [("__name__", False)]
+        for campo, desc in reversed(orden):
+            filas.sort(key=lambda f: self._valor(f[0], f[1], campo), reverse=desc)
+        if self._despues is not None:
+            ids = [r[-1] for r, _ in filas]
+            filas = filas[ids.index(self._despues.id) + 1:] if self._despues.id in ids else filas
+        if self._limite is not None:
+            filas = filas[: self._limite]
+        with db._lock:
+            db.metricas["lecturas"] += max(len(filas), 1)
+        for r, d in filas:
+            yield _Snapshot(_DocRef(db, r), d)
+
+    def get(self) -> List[_Snapshot]:
+        return list(self.stream())
+
+
+class _Coleccion(_Consulta):
+    def __init__(self, db: "FirestoreEnMemoria", ruta: Tuple[str, ...]) -> None:
+        self._db, self._ruta = db, ruta
+        super().__init__(self)
+
+    def document(self, doc_id: str) -> _DocRef:
+        return _DocRef(self._db, self._ruta + (doc_id,))
+
+
+class _Batch:
+    def __init__(self, db: "FirestoreEnMemoria") -> None:
+        self._db = db
+        self._ops: List[Tuple[Tuple[str, ...], Dict[str, Any], bool]] = []
+
+    def set(self, ref: _DocRef, datos: Dict[str, Any], merge: bool = False) -> None:
+        self._ops.append((ref._ruta, datos, merge))
+
+    def delete(self, ref: _DocRef) -> None:
+        self._ops.append((ref._ruta, None, False))
+
+    def commit(self) -> None:
+        if len(self._ops) > 500:
+            raise ValueError("WriteBatch con más de 500 operaciones")
+        self._db._ida("commits")
+        for ruta, datos, merge in self._ops:
+            if datos is None:
+                self._db._borrar(ruta)
+            else:
+                self._db._set(ruta, datos, merge)
+        self._db.metricas["escrituras"] += len(self._ops)
+
+
+class FirestoreEnMemoria:
+    def __init__(self, latencia: float = 0.0) -> None:
+        self.latencia = latencia
+        self.docs: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+        self.versiones: Dict[Tuple[str, ...], int] = {}    # update_time simulado
+        self.metricas: Counter[str] = Counter()
+        self._lock = threading.Lock()
+
+    def _ida(self, tipo: str) -> None:
+        if self.latencia:
+            _time.sleep(self.latencia)
+        with self._lock:
+            self.metricas[tipo] += 1
+
+    def _set(self, ruta: Tuple[str, ...], datos: Dict[str, Any], merge: bool) -> None:
+        with self._lock:
+            actual = self.docs.setdefault(ruta, {}) if merge else {}
+            _aplicar(actual, datos)
+            self.docs[ruta] = actual
+            self.versiones[ruta] = self.versiones.get(ruta, 0) + 1
+
+    def _borrar(self, ruta: Tuple[str, ...]) -> None:
+        with self._lock:
+            self.docs.pop(ruta, None)
+            self.versiones[ruta] = self.versiones.get(ruta, 0) + 1
+
+    def collection(self, nombre: str) -> _Coleccion:
+        return _Coleccion(self, (nombre,))
+
+    def batch(self) -> _Batch:
+        return _Batch(self)
+
+    def write_option(self, last_update_time: Any = None) -> Any:
+        return last_update_time
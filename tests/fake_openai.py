@@ -0,0 +1,74 @@
+# tests/fake_openai.py
+"""Servidor HTTP local que imita ``POST /v1/chat/completions`` de OpenAI.
+
+Sirve para probar ``core.llm_gateway`` de punta a punta (cliente ``openai``
+real, red real) sin tokens: latencia configurable, respuesta fija y conteo
+de peticiones recibidas.
+
+Uso:
+    with FakeOpenAI(latencia=0.2, contenido="saludo") as srv:
+        cliente = OpenAI(api_key="sk-test", base_url=srv.base_url, max_retries=0)
+"""
+from __future__ import annotations
+
+import json
+import threading
+import time as _time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeOpenAI:
+    def __init__(self, latencia: float = 0.0, contenido: str = "otro") -> None:
+        self.latencia = latencia
+        self.contenido = contenido
+        self.peticiones = 0
+        self._lock = threading.Lock()
+        srv = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_POST(self):           # noqa: N802 (API de http.server)
+                largo = int(self.headers.get("Content-Length", 0))
+                cuerpo = json.loads(self.rfile.read(largo) or b"{}")
+                with srv._lock:
+                    srv.peticiones += 1
+                _time.sleep(srv.latencia)
+                data = json.dumps({
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion",
+                    "created": int(_time.time()),
+                    "model": cuerpo.get("model", "fake"),
+                    "choices": [{
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": srv.contenido},
+                    }],
+                    "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+                }).encode()
+                try:
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass                  # el cliente ya se rindió (timeout)
+
+            def log_message(self, *_):   # silencio en la salida de pytest
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._server.daemon_threads = True
+        self._hilo = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def __enter__(self) -> "FakeOpenAI":
+        self._hilo.start()
+        return self
+
+    def __exit__(self, *_) -> None:
+        self._server.shutdown()
+        self._server.server_close()
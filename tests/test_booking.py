@@ -1,10 +1,11 @@
 # tests/test_booking.py
 import datetime as dt
+import uuid
 import pytest
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
-from db.models import Base, Servicio, Empleado, Cliente
+from db.models import Base, Servicio, Empleado, Cliente, Cita
 
 # ── motor SQLite in‑memory ──────────────────────────────────────────
 engine = create_engine("sqlite:///:memory:")
@@ -18,6 +19,10 @@ db_session.SessionLocal = Session          # patch global
 import core.booking_handler as bh          # importa después del patch
 bh.SessionLocal = Session                  # patch local del módulo
 
+def _proximo_lunes() -> dt.date:
+    hoy = dt.date.today()
+    return hoy + dt.timedelta(days=7 - hoy.weekday())
+
 # ── fixtures ────────────────────────────────────────────────────────
 @pytest.fixture()
 def db():
@@ -39,10 +44,94 @@ def test_booking_fluye_ok(db, entorno):
         "cliente_id":  cli.id,
         "servicio_id": svc.id,
         "empleado_id": emp.id,
-        "fecha": dt.date.today().isoformat(),
+        "fecha": _proximo_lunes().isoformat(),
         "hora":  "10:00",
     }
 
     assert bh.check_availability(data)["ok"] is True
     res = bh.process_booking_request(data)
     assert res["ok"] and "cita_id" in res
+
+
+@pytest.fixture()
+def combo(db):
+    u = uuid.uuid4().hex[:6]
+    dep = Servicio(nombre=f"Depilación_{u}", categoria="Facial", duracion_min=30, activo=True)
+    fac = Servicio(nombre=f"Facial_{u}", categoria="Facial", duracion_min=45, activo=True)
+    emp = Empleado(nombre="Sol", puesto="Estilista",
+                   telefono=f"555{u}", email=f"sol{u}@test.com")
+    cli = Cliente(nombre="Valeria", telefono=f"556{u}", email=f"valeria{u}@test.com")
+    db.add_all([dep, fac, emp, cli]); db.commit()
+    return dep, fac, emp, cli
+
+
+def test_combo_back_to_back(db, combo):
+    dep, fac, emp, cli = combo
+    hoy = dt.date.today()
+    lunes = hoy + dt.timedelta(days=7 - hoy.weekday())
+    items = [
+        {"cliente_id": cli.id, "servicio_id": dep.id, "empleado_id": emp.id,
+         "fecha": lunes.isoformat(), "hora": "11:30"},
+        {"servicio_id": fac.id, "empleado_id": emp.id},
+    ]
+
+    res = bh.process_booking_requests(items)
+    assert res["ok"], res
+    assert [c["inicio"][11:16] for c in res["citas"]] == ["11:30", "12:00"]
+
+    # mismo combo otra vez → ocupado, con combos alternativos completos
+    res = bh.process_booking_requests(items)
+    assert res["ok"] is False and res["reason"] == "slot_occupied"
+    assert res["suggestions"][0][0]["inicio"][11:16] == "13:00"
+    assert len(res["suggestions"][0]) == 2
+
+
+def test_combo_validates_all_items(db, combo):
+    dep, _, _, cli = combo
+    res = bh.process_booking_requests([
+        {"cliente_id": cli.id, "servicio_id": dep.id, "fecha": "2030-01-07", "hora": "10:00"},
+        {"servicio_id": "x"},
+        {"servicio_id": 999999},
+    ])
+    assert res["reason"] == "validation_error"
+    assert "[1]" in res["detail"]
+
+
+
+@pytest.mark.parametrize("hora", ["10:02", "25:00"])
+def test_hora_fuera_de_rejilla_es_error_de_validacion(db, combo, hora):
+    dep, fac, emp, cli = combo
+    data = {"cliente_id": cli.id, "servicio_id": dep.id, "empleado_id": emp.id,
+            "fecha": _proximo_lunes().isoformat(), "hora": hora}
+
+    # antes 10:02 salía como "slot_occupied" aunque la agenda estuviera vacía
+    assert bh.check_availability(data)["reason"] == "validation_error"
+    assert bh.process_booking_request(data)["reason"] == "validation_error"
+    res = bh.process_booking_requests([data, {"servicio_id": fac.id}])
+    assert res["reason"] == "validation_error"
+
+
+def test_carrera_perdida_devuelve_sugerencias(db, combo, monkeypatch):
+    dep, _, emp, cli = combo
+    lunes = _proximo_lunes()
+    # otro proceso ya reservó 10:00‑10:30, pero esta réplica aún lo ve libre
+    db.add(Cita(fecha=lunes, hora=dt.time(10, 0), cliente_id=cli.id,
+                servicio_id=dep.id, empleado_id=emp.id))
+    db.commit()
+    consultas = []
+    real = bh.is_slot_available
+
+    def vista_vieja(*args, **kwargs):
+        consultas.append(args)
+        return len(consultas) == 1 or real(*args, **kwargs)
+
+    monkeypatch.setattr(bh, "is_slot_available", vista_vieja)
+    res = bh.process_booking_request({
+        "cliente_id": cli.id, "servicio_id": dep.id, "empleado_id": emp.id,
+        "fecha": lunes.isoformat(), "hora": "10:00",
+    })
+
+    # book_slot choca en la BD → rollback, reintento con datos frescos
+    assert len(consultas) == 2
+    assert res["ok"] is False and res["reason"] == "slot_occupied"
+    assert [s["inicio"][11:16] for s in res["suggestions"]] == ["10:30", "11:00", "11:30"]
@@ -0,0 +1,104 @@
+# tests/test_embeddings.py
+"""pytest: índice FAISS del catálogo (core/embeddings.py) con el embedder
+local de *hashing* y el catálogo real de ``data/servicios.csv``; caché de
+vectores por contenido (``CacheEmbeddings`` / ``EmbedderEnCache``)."""
+import csv
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("faiss")
+
+import numpy as np  # noqa: E402
+
+from core.embeddings import (  # noqa: E402
+    CacheEmbeddings, EmbedderEnCache, EmbedderHashing, Fila, IndiceCatalogo, _texto, clave_texto,
+)
+
+CSV = Path(__file__).resolve().parent.parent / "data" / "servicios.csv"
+
+
+def _servicios():
+    with open(CSV, encoding="utf-8-sig", newline="") as f:
+        return [
+            Fila("servicio", i, r["Nombre"], _texto(r["Nombre"], r["Categoria"], r["Detalles"]))
+            for i, r in enumerate(csv.DictReader(f), start=1)
+        ]
+
+
+@pytest.fixture
+def indice(tmp_path):
+    return IndiceCatalogo(tmp_path, embedder=EmbedderHashing(), reload_seconds=0)
+
+
+def test_busca_y_persiste_con_mmap(indice, tmp_path):
+    filas = _servicios()
+    cambios = indice.sincronizar(filas + [Fila("producto", 1, "Shampoo Nashi", "Shampoo Nashi. Cuidado. Hidratante")])
+    assert cambios["agregados"] == len(filas) + 1
+
+    assert indice.buscar("luces a mano alzada efecto natural", k=1)[0].nombre == "Balayage"
+    assert indice.buscar("me quiero cubrir las canas", k=1)[0].nombre == "Retoque de Canas"
+    assert {r.tipo for r in indice.buscar("nashi", k=5, tipo="producto")} == {"producto"}
+
+    otro = IndiceCatalogo(tmp_path, embedder=EmbedderHashing())   # otro worker: lee del disco
+    assert otro.cargar() and otro.reporte()["vectores"] == len(filas) + 1
+    assert otro.buscar("luces a mano alzada efecto natural", k=1)[0].nombre == "Balayage"
+
+
+def test_sincronizar_es_incremental(indice, tmp_path):
+    filas = _servicios()
+    indice.sincronizar(filas)
+    embedder = indice.embedder
+    embedder.metricas.clear()
+
+    assert indice.sincronizar(filas)["sin_cambios"] == len(filas)
+    assert embedder.metricas["textos"] == 0                   # nada que recalcular
+
+    filas[0] = Fila("servicio", filas[0].id, filas[0].nombre, filas[0].texto + " Incluye lavado.")
+    cambios = indice.sincronizar(filas[:-1])                  # 1 cambia, la última desaparece
+    assert (cambios["actualizados"], cambios["eliminados"]) == (1, 1)
+    assert embedder.metricas["textos"] == 1
+
+    lector = IndiceCatalogo(tmp_path, embedder=EmbedderHashing(), reload_seconds=0)
+    assert lector.reporte()["vectores"] == 0 and lector.cargar()
+    assert lector.reporte()["vectores"] == len(filas) - 1
+    assert filas[-1].nombre not in {r.nombre for r in lector.buscar(filas[-1].texto, k=3)}
+
+
+# ───────────────────────── caché de vectores ───────────────────────
+
+def test_reimportar_sin_cambios_no_llama_al_proveedor(tmp_path):
+    filas = _servicios()
+    primero = EmbedderEnCache(EmbedderHashing(), CacheEmbeddings(tmp_path / "cache"))
+    IndiceCatalogo(tmp_path / "a", embedder=primero).sincronizar(filas)
+    assert primero.metricas["llamadas"] == 1                  # todos los fallos en una llamada
+
+    # Otro proceso, índice desde cero (borrado, otra máquina): el CSV no cambió
+    base = EmbedderHashing()
+    cache = CacheEmbeddings(tmp_path / "cache")
+    indice = IndiceCatalogo(tmp_path / "b", embedder=EmbedderEnCache(base, cache))
+    assert indice.sincronizar(filas)["agregados"] == len(filas)
+    assert base.metricas["llamadas"] == base.metricas["textos"] == 0
+    assert cache.metricas()["hit_ratio"] == 1.0
+    assert indice.buscar("me quiero cubrir las canas", k=1)[0].nombre == "Retoque de Canas"
+
+
+def test_cache_por_lote_normaliza_y_deduplica(tmp_path):
+    base = EmbedderHashing()
+    embedder = EmbedderEnCache(base, CacheEmbeddings(tmp_path))
+    referencia = EmbedderHashing().embed(["Corte de cabello", "¿tienen citas hoy?"])
+
+    primero = embedder.embed(["Corte de cabello", "Corte   de\ncabello ", "¿tienen citas hoy?"])
+    assert (base.metricas["llamadas"], base.metricas["textos"]) == (1, 2)
+    np.testing.assert_allclose(primero, referencia[[0, 0, 1]], rtol=1e-6)
+
+    segundo = embedder.embed(["¿tienen citas hoy?", "otra pregunta", "Corte de cabello"])
+    assert (base.metricas["llamadas"], base.metricas["textos"]) == (2, 3)   # sólo el fallo
+    np.testing.assert_allclose(segundo[[0, 2]], referencia[[1, 0]], rtol=1e-6)
+
+    lector = CacheEmbeddings(tmp_path)                        # otro worker: mismo disco
+    assert set(lector.buscar(base.modelo, [clave_texto("otra pregunta")])) == {clave_texto("otra pregunta")}
+    embedder.embed(["una más"])                               # el archivo crece tras abrir el mmap
+    vistos = lector.buscar(base.modelo, [clave_texto("una más"), clave_texto("otra pregunta")])
+    np.testing.assert_allclose(vistos[clave_texto("una más")], embedder.embed(["una más"])[0])
+    assert lector.buscar("otro-modelo", [clave_texto("una más")]) == {}
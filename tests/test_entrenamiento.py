@@ -0,0 +1,62 @@
+# tests/test_entrenamiento.py
+"""pytest: reentrenamiento out‑of‑core del modelo de intención
+(core/entrenamiento_intencion.py), con historial en memoria (sin Firestore)."""
+from datetime import datetime, timedelta
+
+from core.entrenamiento_intencion import (
+    ejemplos, entrenar, evaluar, publicar, ultima_version,
+)
+from core.model_registry import ModelRegistry
+
+# frases que no atrapan las reglas: hoy caen al pkl / LLM
+PLANTILLAS = {
+    "pago": ["aceptan efectivo {n}", "puedo pagar en efectivo {n}", "dan recibo fiscal {n}"],
+    "ubicacion": ["en que calle quedan {n}", "como llego al salon {n}", "hay estacionamiento cerca {n}"],
+    "agendar_cita": ["me urge un lugar el sabado {n}", "tienen espacio el viernes {n}", "quiero ir mañana {n}"],
+}
+T0 = datetime(2025, 1, 1)
+
+
+def _historial(n: int, desde: datetime = T0):
+    docs = []
+    for u in range(n):
+        mensajes = []
+        for k, (intent, frases) in enumerate(PLANTILLAS.items()):
+            for j, frase in enumerate(frases):
+                mensajes.append({
+                    "role": "user", "content": frase.format(n=u * 10 + j), "intent": intent,
+                    "timestamp": desde + timedelta(minutes=u * 10 + k * 3 + j),
+                })
+        mensajes.append({"role": "assistant", "content": "claro", "intent": "otro"})
+        docs.append({"messages": mensajes})
+    return docs
+
+
+def test_partial_fit_reduce_caida_al_llm(tmp_path):
+    modelo, rep = entrenar(ejemplos(_historial(60)), vigente=None, lote=50)
+    assert rep.lotes > 1 and rep.ejemplos + rep.evaluados == 60 * 9
+    assert rep.fallback_antes == 1.0                     # sin modelo: todo al LLM
+    assert rep.fallback_despues < 0.2 and rep.acierto_despues > 0.9
+    assert rep.mejora
+
+    respaldo = tmp_path / "modelo_intencion.pkl"              # el pkl versionado en git
+    respaldo.write_bytes(b"no se toca")
+    ruta = publicar(modelo, rep, tmp_path)
+    assert respaldo.read_bytes() == b"no se toca" and ruta.parent.name == "versiones"
+    vigente = ModelRegistry(tmp_path).obtener("modelo_intencion")
+    assert vigente is not None and vigente.ruta == ruta and ruta.with_suffix(".json").exists()
+    assert evaluar(vigente, ["aceptan efectivo 999"], ["pago"]) == (0.0, 1.0)
+
+    ruta.unlink()                                             # puntero roto: vuelve al respaldo
+    assert ModelRegistry(tmp_path)._ruta("modelo_intencion") == respaldo
+
+
+def test_continuar_desde_marca_de_agua(tmp_path):
+    modelo, rep = entrenar(ejemplos(_historial(30)))
+    publicar(modelo, rep, tmp_path)
+
+    previo, desde = ultima_version(tmp_path)
+    assert desde == datetime.fromisoformat(rep.hasta)
+    todo = _historial(30) + _historial(5, desde=desde + timedelta(days=1))
+    _, nuevo = entrenar(ejemplos(todo, desde=desde), previo=previo)
+    assert nuevo.ejemplos + nuevo.evaluados == 5 * 9     # sólo lo posterior
@@ -0,0 +1,85 @@
+# tests/test_fecha_local.py
+"""pytest: gramática local de fechas (utils/fecha_local.py) y su uso en
+utils/datetime_parser.py (el LLM sólo cuando la gramática no resuelve)."""
+import csv
+from datetime import datetime, timezone
+
+import pytest
+
+from utils import datetime_parser as dp
+from utils.fecha_local import resolver_fecha
+
+AHORA = datetime(2025, 7, 16, 10, 0)      # miércoles
+
+
+def _corpus():
+    with open("data/corpus_fechas.csv", newline="", encoding="utf-8") as f:
+        return [(r["texto"], r["esperado"]) for r in csv.DictReader(f)]
+
+
+@pytest.mark.parametrize("texto, esperado", _corpus())
+def test_corpus_sin_errores(texto, esperado):
+    """Lo que la gramática resuelve, lo resuelve bien (si no, cede al LLM)."""
+    r = resolver_fecha(texto, AHORA)
+    assert r is None or r.iso() == esperado
+
+
+@pytest.mark.parametrize(
+    "texto, esperado",
+    [
+        ("el 9 am", "2025-07-16T09:00:00"),          # hora, no día 9
+        ("el sábado 9 am", "2025-07-19T09:00:00"),
+        ("el miércoles", "2025-07-23"),             # hoy es miércoles: el siguiente
+        ("31/02/2026", None),                        # fecha imposible
+        ("lunes 22 a las 2:30pm", None),             # el 22 es martes: se contradice
+        ("martes 22", "2025-07-22"),
+        ("mañana a las 12 de la noche", "2025-07-17T00:00:00"),
+        ("a las 12 de la tarde", "2025-07-16T12:00:00"),
+        ("lunes o martes a las 4", None),
+        ("entre las 3 y las 5", None),
+        ("hola, ¿qué precio tiene el tinte?", None),
+    ],
+)
+def test_casos_limite(texto, esperado):
+    r = resolver_fecha(texto, AHORA)
+    assert (r.iso() if r else None) == esperado
+
+
+def test_ahora_con_zona_se_lleva_a_la_del_negocio():
+    # 03:00 UTC del 17 = 21:00 del 16 en Ciudad de México
+    ahora = datetime(2025, 7, 17, 3, 0, tzinfo=timezone.utc)
+    assert resolver_fecha("mañana a las 11", ahora).iso() == "2025-07-17T11:00:00"
+
+
+def test_datetime_parser_solo_usa_llm_si_falla_la_gramatica(monkeypatch):
+    llamadas = []
+
+    def chat(messages, **_):
+        llamadas.append(messages)
+        return '{"datetimes": ["2025-07-19T11:00:00"]}'
+
+    monkeypatch.setattr(dp.llm, "chat", chat)
+    assert dp.datetime_parser("mañana a las 3 pm", AHORA) == ["2025-07-17T15:00:00"]
+    assert dp.datetime_parser("el jueves", AHORA) == ["2025-07-17"]
+    assert llamadas == []
+    assert dp.datetime_parser("el fin de semana a las 11", AHORA) == ["2025-07-19T11:00:00"]
+    assert len(llamadas) == 1 and "2025-07-16 10:00" in llamadas[0][0]["content"]
+
+
+def test_cache_parseo_una_vez_por_dia(monkeypatch):
+    llamadas = []
+    monkeypatch.setattr(
+        dp.llm, "chat",
+        lambda messages, **_: llamadas.append(1) or '{"datetimes": ["2025-07-19T11:00:00"]}',
+    )
+    cache = dp.CacheParseo(max_entradas=10)
+    texto = "el fin de semana a las 11"            # la gramática no lo resuelve → LLM
+
+    assert cache.parsear(texto, AHORA) == ["2025-07-19T11:00:00"]
+    assert cache.parsear("¿El fin de semana a las 11?", AHORA.replace(hour=18)) == ["2025-07-19T11:00:00"]
+    assert len(llamadas) == 1
+
+    cache.parsear(texto, AHORA.replace(day=17))     # otro día: se vuelve a resolver
+    assert len(llamadas) == 2
+    m = cache.metricas()
+    assert (m["hits"], m["misses"], m["caducadas"], m["entradas"]) == (1, 2, 1, 1)
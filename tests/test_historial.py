@@ -0,0 +1,141 @@
+# tests/test_historial.py
+"""pytest: historial (firebase/almacen.py, firebase/write_behind.py,
+firebase/history.py) contra un Firestore en memoria
+(``tests/fake_firestore.py``) y contra SQLite local: misma semántica."""
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from firebase import almacen as almacenes, history
+from firebase.almacen import AlmacenFirestore, AlmacenSQLite
+from firebase.write_behind import EscrituraDiferida
+from fake_firestore import FirestoreEnMemoria
+
+
+def _msg(i):
+    return {"role": "user", "content": f"mensaje {i}"}
+
+
+def _mensajes(db, coleccion, user_id):
+    """Contenido de la subcolección en orden de id."""
+    return [
+        d for r, d in sorted(db.docs.items())
+        if r[:3] == (coleccion, user_id, "messages") and len(r) == 4
+    ]
+
+
+@pytest.fixture(params=["firestore", "sqlite"])
+def historial(request, monkeypatch, tmp_path):
+    """``firebase.history`` con escritura síncrona sobre cada backend."""
+    db = FirestoreEnMemoria()
+    backend = AlmacenFirestore(db) if request.param == "firestore" else AlmacenSQLite(tmp_path / "h.sqlite3")
+    monkeypatch.setattr(almacenes, "_almacen", backend)
+    monkeypatch.setattr(history, "WRITE_BEHIND", False)
+    yield request.param, db
+    if isinstance(backend, AlmacenSQLite):
+        backend.cerrar()
+
+
+# ───────────────────────── escritura diferida ──────────────────────
+
+def test_agrupa_por_usuario_sin_leer():
+    db = FirestoreEnMemoria()
+    cola = EscrituraDiferida(AlmacenFirestore(db), max_lote=100, intervalo=5)
+    for i in range(30):
+        assert cola.encolar("chat_history", f"u{i % 3}", f"{i:04d}", _msg(i))
+    assert [m["id"] for m in cola.pendientes("chat_history", "u0")][:2] == ["0000", "0003"]
+    assert cola.vaciar()
+
+    assert db.metricas["lecturas"] == 0                     # create-or-merge sin get()
+    assert db.metricas["commits"] == 1 and db.metricas["escrituras"] == 33
+    assert [m["content"] for m in _mensajes(db, "chat_history", "u1")] == [
+        f"mensaje {i}" for i in range(1, 30, 3)
+    ]
+    assert "last_updated" in db.docs[("chat_history", "u1")]
+    assert cola.pendientes("chat_history", "u0") == []
+    cola.cerrar()
+
+
+def test_vacia_por_tamano_y_por_tiempo():
+    db = FirestoreEnMemoria()
+    cola = EscrituraDiferida(AlmacenFirestore(db), max_lote=5, intervalo=0.2)
+    for i in range(5):
+        cola.encolar("c", "u", f"{i:04d}", _msg(i))
+    time.sleep(0.1)
+    assert db.metricas["commits"] == 1                      # lote lleno: sin esperar
+
+    cola.encolar("c", "u", "0005", _msg(5))
+    time.sleep(0.4)
+    assert db.metricas["commits"] == 2                      # el intervalo venció
+    assert len(_mensajes(db, "c", "u")) == 6
+    cola.cerrar()
+
+
+def test_contrapresion_acota_memoria():
+    db = FirestoreEnMemoria(latencia=0.3)                   # Firestore lento
+    cola = EscrituraDiferida(AlmacenFirestore(db), max_lote=2, intervalo=0, max_pendientes=4, espera_max=0.05)
+    aceptados = sum(cola.encolar("c", "u", f"{i:04d}", _msg(i)) for i in range(20))
+    assert aceptados < 20 and cola.metricas["descartados"] == 20 - aceptados
+    cola.cerrar()
+    assert len(_mensajes(db, "c", "u")) == aceptados        # lo aceptado no se pierde
+
+
+def test_reintenta_si_falla_commit():
+    db = FirestoreEnMemoria()
+    fallos = [1]
+    batch_original = db.batch
+
+    def batch():
+        b = batch_original()
+        if fallos:
+            fallos.pop()
+            b.commit = lambda: (_ for _ in ()).throw(RuntimeError("UNAVAILABLE"))
+        return b
+
+    db.batch = batch
+    cola = EscrituraDiferida(AlmacenFirestore(db), max_lote=10, intervalo=0)
+    cola.encolar("c", "u", "0000", _msg(0))
+    assert cola.vaciar(timeout=3)
+    assert cola.metricas["errores"] == 1
+    assert _mensajes(db, "c", "u") == [_msg(0)]
+    cola.cerrar()
+
+# ───────────────────────── páginas y migración ─────────────────────
+
+def test_pagina_cuesta_lo_mismo_con_historial_largo(historial):
+    backend, db = historial
+    for n in (10, 1000):
+        usuario = f"u{n}"
+        for i in range(n):
+            history.save_message(usuario, "user", f"mensaje {i}", intent="saludo")
+        db.metricas.clear()
+        pagina = history.get_history(usuario, limit=10)
+        assert [m["content"] for m in pagina] == [f"mensaje {i}" for i in range(n - 1, n - 11, -1)]
+        assert isinstance(pagina[0]["timestamp"], datetime) and pagina[0]["intent"] == "saludo"
+        if backend == "firestore":
+            assert db.metricas["lecturas"] == 10            # sin leer el resto
+
+    siguiente = history.get_history("u1000", limit=10, before=pagina[-1]["id"])
+    assert siguiente[0]["content"] == "mensaje 989"
+    assert len(list(history.iterar_historial("u1000", tam_pagina=300))) == 1000
+    assert list(almacenes.almacen().usuarios("chat_history", tam_pagina=1)) == ["u10", "u1000"]
+
+
+def test_legado_se_lee_y_migra_sin_duplicar(monkeypatch):
+    db = FirestoreEnMemoria()                               # el arreglo legado sólo existe en Firestore
+    monkeypatch.setattr(almacenes, "_almacen", AlmacenFirestore(db))
+    monkeypatch.setattr(history, "WRITE_BEHIND", False)
+    t0 = datetime(2024, 1, 1)
+    viejos = [{"role": "user", "content": f"viejo {i}", "timestamp": t0 + timedelta(minutes=i)}
+              for i in range(3)]
+    db.collection("chat_history").document("u").set({"messages": viejos})
+    history.save_message("u", "user", "nuevo")
+
+    antes = [m["content"] for m in history.get_history("u")]
+    assert antes == ["nuevo", "viejo 2", "viejo 1", "viejo 0"]
+
+    assert history.migrar_usuario("u") == 3
+    assert "messages" not in db.docs[("chat_history", "u")]
+    assert [m["content"] for m in history.get_history("u")] == antes
+    assert history.migrar_usuario("u") == 0                 # idempotente
@@ -0,0 +1,62 @@
+# tests/test_langchain_memory.py
+"""pytest: FirestoreChatHistory (firebase/langchain_memory.py) contra el
+Firestore en memoria: agregar no depende del largo del historial."""
+import pytest
+from langchain.memory import ConversationBufferMemory
+
+from firebase import almacen as almacenes, langchain_memory as lm
+from firebase.almacen import AlmacenFirestore
+from fake_firestore import FirestoreEnMemoria
+
+
+@pytest.fixture
+def memoria(monkeypatch):
+    db = FirestoreEnMemoria()
+    monkeypatch.setattr(almacenes, "_almacen", AlmacenFirestore(db))
+    return lm, db
+
+
+def test_turno_cuesta_una_lectura_y_un_commit(memoria):
+    lm, db = memoria
+    historial = lm.FirestoreChatHistory("u")
+    for i in range(200):
+        historial.add_user_message(f"pregunta {i}")
+
+    db.metricas.clear()
+    turno = lm.FirestoreChatHistory("u")                     # instancia nueva por turno
+    memory = ConversationBufferMemory(memory_key="chat_history", chat_memory=turno, return_messages=True)
+    for _ in range(3):                                       # LangChain lee varias veces
+        assert len(memory.load_memory_variables({})["chat_history"]) == 200
+    memory.save_context({"input": "hola"}, {"output": "¿en qué te ayudo?"})
+
+    assert db.metricas["consultas"] == 1 and db.metricas["commits"] == 1
+    assert db.metricas["escrituras"] == 3                    # 2 mensajes + last_updated
+    assert [m.content for m in turno.messages[-2:]] == ["hola", "¿en qué te ayudo?"]
+    assert [m.content for m in lm.FirestoreChatHistory("u").messages][-3:] == [
+        "pregunta 199", "hola", "¿en qué te ayudo?",
+    ]
+
+
+def test_carga_acotada_a_los_ultimos(memoria):
+    lm, db = memoria
+    lm.FirestoreChatHistory("u").add_messages(
+        [lm.HumanMessage(content=f"pregunta {i}") for i in range(30)]
+    )
+
+    db.metricas.clear()
+    historial = lm.FirestoreChatHistory("u", limite=10)
+    assert [m.content for m in historial.messages] == [f"pregunta {i}" for i in range(20, 30)]
+    assert db.metricas["lecturas"] == 10                     # una por documento leído
+
+
+def test_lee_arreglo_legado_y_clear(memoria):
+    lm, db = memoria
+    db.collection("langchain_memory").document("u").set(
+        {"messages": [{"type": "HumanMessage", "content": "viejo"}]}
+    )
+    historial = lm.FirestoreChatHistory("u")
+    historial.add_ai_message("nuevo")
+    assert [m.content for m in historial.messages] == ["viejo", "nuevo"]
+
+    historial.clear()
+    assert historial.messages == [] and lm.FirestoreChatHistory("u").messages == []
@@ -0,0 +1,77 @@
+# tests/test_llm_gateway.py
+"""pytest: capa común de llamadas al LLM (core/llm_gateway.py).
+
+Se usa un servidor local que imita la API de OpenAI (``tests/fake_openai.py``)
+con el cliente ``openai`` real: sin tokens, pero con red y latencia reales.
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from openai import AsyncOpenAI, OpenAI
+
+from core.llm_gateway import LLMGateway
+from fake_openai import FakeOpenAI
+
+MSG = [{"role": "user", "content": "hola, ¿hay promo?"}]
+
+
+@pytest.fixture()
+def servidor():
+    with FakeOpenAI(latencia=0.3, contenido="saludo") as srv:
+        yield srv
+
+
+def _gateway(srv, **kw) -> LLMGateway:
+    return LLMGateway(
+        cliente=OpenAI(api_key="sk-test", base_url=srv.base_url, max_retries=0),
+        cliente_async=AsyncOpenAI(api_key="sk-test", base_url=srv.base_url, max_retries=0),
+        **kw,
+    )
+
+
+def test_single_flight_comparte_una_llamada(servidor):
+    gw = _gateway(servidor, timeout=5)
+    with ThreadPoolExecutor(max_workers=20) as pool:
+        res = list(pool.map(lambda _: gw.chat(MSG, max_tokens=5), range(20)))
+    assert res == ["saludo"] * 20
+    assert servidor.peticiones == 1
+    assert gw.metricas["coalescidas"] == 19
+
+
+def test_plazo_vencido_devuelve_none_a_tiempo(servidor):
+    servidor.latencia = 2.0
+    gw = _gateway(servidor, timeout=0.3, max_concurrencia=2)
+
+    def llamada(i):
+        t0 = time.perf_counter()
+        res = gw.chat([{"role": "user", "content": f"msg {i}"}])
+        return res, time.perf_counter() - t0
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        res = list(pool.map(llamada, range(8)))
+    latencias = sorted(t for _, t in res)
+    assert all(r is None for r, _ in res)
+    assert latencias[-1] < 1.0                 # cola acotada por el plazo, no por el LLM
+    assert gw.metricas["timeouts"] + gw.metricas["saturado"] == 8
+
+
+def test_achat_single_flight(servidor):
+    gw = _gateway(servidor, timeout=5)
+
+    async def principal():
+        return await asyncio.gather(*[gw.achat(MSG, max_tokens=5) for _ in range(10)])
+
+    assert asyncio.run(principal()) == ["saludo"] * 10
+    assert servidor.peticiones == 1
+
+
+def test_ask_llm_respaldo_sin_cachear(monkeypatch):
+    import core.message_predictor as mp
+    from core.llm_cache import CacheLLM
+
+    monkeypatch.setattr(mp, "llm_cache", CacheLLM(mp.LLM_MODEL, path=":memory:"))
+    monkeypatch.setattr(mp.llm, "chat", lambda *a, **k: None)       # plazo vencido
+    assert mp._ask_llm("algo raro") == "otro"
+    assert mp.llm_cache.obtener("algo raro") is None
@@ -0,0 +1,183 @@
+# tests/test_memoria.py
+"""pytest: memoria acotada (memory/memory.py) sobre SQLite local: ventana de
+K turnos + resumen persistido, con tope de tokens; y la caché por worker
+(contando lecturas en el Firestore en memoria)."""
+import threading
+import time
+
+import pytest
+from langchain.schema import SystemMessage
+
+from firebase import almacen as almacenes
+from firebase.almacen import AlmacenFirestore, AlmacenSQLite
+from memory import memory as mem
+from fake_firestore import FirestoreEnMemoria
+
+
+def _resumir(resumen, nuevos):
+    llamadas.append(len(nuevos))
+    return (resumen + " | " if resumen else "") + "; ".join(m.content for m in nuevos)
+
+
+llamadas = []
+
+
+@pytest.fixture(autouse=True)
+def backend(monkeypatch, tmp_path):
+    alm = AlmacenSQLite(tmp_path / "m.sqlite3")
+    monkeypatch.setattr(almacenes, "_almacen", alm)
+    mem.metricas.clear()
+    llamadas.clear()
+    yield alm
+    alm.cerrar()
+
+
+def _memoria(**kw):
+    return mem.MemoriaAcotada(
+        chat_memory=mem.FirestoreChatHistory("u", namespace="lc"),
+        **{"k": 2, "resumen_cada": 4, "resumir": _resumir, "diferir": lambda tarea: tarea(), **kw},
+    )
+
+
+def _turno(i, **kw):
+    m = _memoria(**kw)                                # una instancia por turno, como get_memory
+    prompt = m.load_memory_variables({})["chat_history"]
+    m.save_context({"input": f"pregunta {i}"}, {"output": f"respuesta {i}"})
+    return prompt
+
+
+def test_ventana_mas_resumen_persistido():
+    for i in range(12):
+        prompt = _turno(i)
+
+    # turno 11: resumen plegado en bloques de 4 mensajes + lo más nuevo literal
+    assert isinstance(prompt[0], SystemMessage) and "pregunta 0" in prompt[0].content
+    assert [m.content for m in prompt[1:]][-4:] == ["pregunta 9", "respuesta 9", "pregunta 10", "respuesta 10"]
+    assert len(prompt) <= 1 + 2 * 2 + 4
+    assert llamadas == [4] * 5                        # 24 mensajes - ventana de 4, sin re-resumir
+
+    nuevo = _memoria().load_memory_variables({})["chat_history"]
+    assert "respuesta 7" in nuevo[0].content          # el resumen se leyó del backend
+    assert mem.metricas["tokens_sin_acotar"] > mem.metricas["tokens_prompt"]
+
+
+def test_tope_de_tokens_recorta_lo_mas_viejo():
+    for i in range(3):
+        _turno(i)
+    prompt = _memoria(max_tokens=30).load_memory_variables({})["chat_history"]
+    assert mem.estimar_tokens(prompt) <= 30
+    assert prompt[-1].content == "respuesta 2" and mem.metricas["recortes"] > 0
+
+
+def test_resumen_fallido_se_reintenta():
+    m = _memoria(resumir=lambda r, n: None)
+    for i in range(4):                                 # 8 mensajes: 4 salen de la ventana
+        m.save_context({"input": f"p{i}"}, {"output": f"r{i}"})
+    assert mem.metricas["resumenes_fallidos"] == 1 and mem.metricas["resumenes"] == 0
+    assert [x.content for x in m.load_memory_variables({})["chat_history"]][0] == "p0"   # nada se pierde
+
+def test_resumen_fallido_sobrevive_reinicios():
+    for i in range(6):                                 # sin caché: cada turno relee el backend
+        _turno(i, resumir=lambda r, n: None)
+    assert mem.metricas["resumenes_fallidos"] == 3                # turnos 3, 4 y 5
+    assert [x.content for x in _memoria().load_memory_variables({})["chat_history"]][0] == "pregunta 0"
+
+    _turno(6)                                          # el resumidor vuelve: nada se saltó
+    assert llamadas == [10]
+    assert "pregunta 0" in _memoria().load_memory_variables({})["chat_history"][0].content
+
+
+def test_historial_previo_se_resume_una_vez(monkeypatch):
+    monkeypatch.setattr(mem, "SEMILLA_MAX", 30)
+    h = mem.FirestoreChatHistory("u", namespace="lc")
+    for i in range(50):                                # conversación del modo buffer
+        h.add_user_message(f"viejo {i}")
+    prompt = _turno(0)
+    assert [m.content for m in prompt[1:]] == [f"viejo {i}" for i in range(42, 50)]
+    assert "viejo 12" in prompt[0].content and "viejo 41" in prompt[0].content
+    assert "viejo 11" not in prompt[0].content         # más allá de SEMILLA_MAX
+    assert llamadas == [30, 6]                         # semilla + lo que salió de la ventana
+
+    for i in range(1, 4):
+        _turno(i)
+    assert llamadas == [30, 6, 4]                      # la semilla no se repite
+    resumen = _memoria().load_memory_variables({})["chat_history"][0].content
+    assert resumen.index("viejo 41") < resumen.index("viejo 42")
+
+
+def test_semilla_fallida_se_reintenta_al_recargar():
+    h = mem.FirestoreChatHistory("u", namespace="lc")
+    for i in range(20):
+        h.add_user_message(f"viejo {i}")
+    _memoria(resumir=lambda r, n: None).load_memory_variables({})
+    assert mem.metricas["resumenes_fallidos"] == 1
+    prompt = _memoria().load_memory_variables({})["chat_history"]
+    assert "viejo 0" in prompt[0].content and llamadas == [12]
+
+
+def test_resumen_fuera_del_candado_y_del_turno():
+    libre, listo, seguir = [], threading.Event(), threading.Event()
+
+    def resumir(resumen, nuevos):
+        libre.append(m._lock.acquire(blocking=False))   # hilo del pool: nadie retiene el candado
+        if libre[-1]:
+            m._lock.release()
+        seguir.wait(5)
+        listo.set()
+        return "resumen"
+
+    m = _memoria(resumir=resumir, diferir=mem.en_segundo_plano)
+    for i in range(4):                                 # el 4.º turno dispara el plegado
+        m.save_context({"input": f"p{i}"}, {"output": f"r{i}"})
+    m.save_context({"input": "p4"}, {"output": "r4"})  # no espera al LLM ni choca con él
+    seguir.set()
+    assert listo.wait(5)
+    for _ in range(100):
+        if mem.metricas["resumenes"]:
+            break
+        time.sleep(0.01)
+    assert libre == [True] and mem.metricas["resumenes"] == 1
+    assert "resumen" in m.load_memory_variables({})["chat_history"][0].content
+
+
+# ───────────────────────── caché por worker ────────────────────────
+
+@pytest.fixture
+def firestore_contado(monkeypatch):
+    db = FirestoreEnMemoria()
+    monkeypatch.setattr(almacenes, "_almacen", AlmacenFirestore(db))
+    monkeypatch.setattr(mem, "cache_memoria", mem.CacheConversaciones(max_usuarios=2, ttl=60))
+    return db
+
+
+@pytest.mark.parametrize("modo", ["acotada", "buffer"])
+def test_sesion_lee_el_historial_una_vez(firestore_contado, monkeypatch, modo):
+    monkeypatch.setattr(mem, "MEMORIA_MODO", modo)
+    db = firestore_contado
+    for i in range(5):                                 # 5 turnos: get_memory por turno
+        m = mem.get_memory("u")
+        m.load_memory_variables({})
+        m.save_context({"input": f"p{i}"}, {"output": f"r{i}"})
+    assert db.metricas["consultas"] == (2 if modo == "acotada" else 1)   # (+ resumen)
+    # write-through, un commit por turno (+ la marca inicial del resumen)
+    assert db.metricas["commits"] == (6 if modo == "acotada" else 5)
+    ultimo = mem.get_memory("u").load_memory_variables({})["chat_history"]
+    assert ultimo[-1].content == "r4"
+
+    c = mem.cache_memoria.metricas()
+    assert c["hits"] == 5 and c["misses"] == 1 and c["bytes_aprox"] > 0
+
+
+def test_ttl_lru_e_invalidacion(firestore_contado, monkeypatch):
+    cache = mem.cache_memoria
+    a = cache.obtener("a")
+    assert cache.obtener("a") is a
+    assert cache.invalidar("a") and cache.obtener("a") is not a
+
+    cache.obtener("b"), cache.obtener("c")            # max_usuarios=2: sale "a"
+    assert cache.metricas()["desalojadas"] == 1 and cache.metricas()["entradas"] == 2
+
+    monkeypatch.setattr(cache, "ttl", 0)
+    time.sleep(0.01)
+    cache.obtener("c")
+    assert cache.metricas()["expiradas"] == 1
@@ -0,0 +1,67 @@
+# tests/test_model_registry.py
+"""pytest: registro de modelos locales (core/model_registry.py)."""
+import os
+
+import joblib
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import make_pipeline
+
+from core.model_registry import ModelRegistry, ModeloInvalidoError
+
+TEXTOS = ["quiero una cita", "agendar mañana", "me encantó", "pésimo servicio"]
+
+
+def _pipeline(etiquetas):
+    return make_pipeline(TfidfVectorizer(), LogisticRegression()).fit(TEXTOS, etiquetas)
+
+
+def _publicar(ruta, objeto):
+    """Escritura atómica (temporal + rename), como en un despliegue real."""
+    tmp = ruta.with_suffix(".tmp")
+    joblib.dump(objeto, tmp)
+    os.replace(tmp, ruta)
+
+
+def test_carga_valida_y_reporta(tmp_path):
+    _publicar(tmp_path / "modelo_intencion.pkl", _pipeline(["agendar", "agendar", "opinar", "opinar"]))
+    joblib.dump(LogisticRegression().fit([[0.0], [1.0]], ["a", "b"]), tmp_path / "modelo_suelto.pkl")
+
+    reg = ModelRegistry(tmp_path, reload_seconds=0)
+    with pytest.raises(ModeloInvalidoError, match="modelo_suelto"):
+        reg.cargar_todo(estricto=True)
+
+    modelo = reg.obtener("modelo_intencion")
+    assert list(modelo.classes_) == ["agendar", "opinar"]
+    assert modelo.predict_proba(["quiero una cita"]).shape == (1, 2)
+    assert reg.obtener("modelo_suelto") is None
+    (fila,) = reg.reporte()
+    assert fila["modelo"] == "modelo_intencion" and fila["version"] == 1
+    assert fila["segundos_carga"] >= 0 and fila["memoria_bytes"] >= 0
+
+
+def test_vectorizador_companero(tmp_path):
+    vect = TfidfVectorizer().fit(TEXTOS)
+    clf = LogisticRegression().fit(vect.transform(TEXTOS), ["a", "a", "b", "b"])
+    joblib.dump(clf, tmp_path / "modelo_x.pkl")
+    joblib.dump(vect, tmp_path / "modelo_x_vectorizador.pkl")
+
+    modelo = ModelRegistry(tmp_path).obtener("modelo_x")
+    assert modelo.vectorizador is not None
+    assert modelo.predict_proba(["pésimo"]).shape == (1, 2)
+
+
+def test_recarga_en_caliente_y_conserva_previa(tmp_path):
+    ruta = tmp_path / "modelo_intencion.pkl"
+    _publicar(ruta, _pipeline(["agendar", "agendar", "opinar", "opinar"]))
+    reg = ModelRegistry(tmp_path, reload_seconds=0)
+    v1 = reg.obtener("modelo_intencion")
+
+    _publicar(ruta, _pipeline(["agendar", "consultar", "opinar", "opinar"]))
+    v2 = reg.obtener("modelo_intencion")
+    assert v2.version == 2 and list(v2.classes_) == ["agendar", "consultar", "opinar"]
+    assert list(v1.classes_) == ["agendar", "opinar"]        # quien la tenía no se ve afectado
+
+    ruta.write_bytes(b"basura")                                # copia a medias / corrupta
+    assert reg.obtener("modelo_intencion") is v2
@@ -8,15 +8,18 @@
    • Se crea una DB SQLite in‑memory con modelos cargados.
 """
 from datetime import date, time, timedelta
+from pathlib import Path
 from types import SimpleNamespace
 
+import numpy as np
 import pytest
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
 from db.models import Base, Servicio, Cita, Empleado
 from core import scheduler
-from core.message_predictor import predict_intent, Intent
+from core.message_predictor import predict_intent, predict_intent_many, Intent, ReglasCompiladas
+from core.llm_cache import CacheLLM
 
 # ───────────────────────────── fixtures DB ───────────────────────────────────
 @pytest.fixture(scope="session")
@@ -27,22 +30,33 @@ def engine():
 
 @pytest.fixture()
 def db(engine):
-    """Sesión SQLAlchemy renovable por prueba."""
-    Session = sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+    """Sesión SQLAlchemy por prueba dentro de una transacción que se revierte
+    al final: los ``commit`` de la prueba no llegan al engine compartido."""
+    connection = engine.connect()
+    trans = connection.begin()
+    Session = sessionmaker(bind=connection, autoflush=False, expire_on_commit=False)
     sess = Session()
     yield sess
-    sess.rollback()
     sess.close()
+    trans.rollback()
+    connection.close()
 
-@pytest.fixture(autouse=True)
+@pytest.fixture()
 def seed_minimal(db):
     """Carga datos mínimos: 1 servicio (30 min) y 1 empleado."""
     svc = Servicio(id=1, nombre="Corte básico", categoria="Corte", duracion_min=30)
-    emp = Empleado(id=1, nombre="Ana", puesto="Estilista")
+    emp = Empleado(id=1, nombre="Ana", puesto="Estilista",
+                   telefono="5550000001", email="ana@example.com")
     db.add_all([svc, emp])
     db.commit()
+    return svc, emp
 
 # ─────────────────────── fixture: mock OpenAI ────────────────────────────────
+def _cliente_falso(create):
+    """Cliente con la forma de ``OpenAI`` para ``core.llm_gateway.llm``."""
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
 @pytest.fixture(autouse=True)
 def mock_openai(monkeypatch):
     """Evita llamadas reales a OpenAI; siempre responde ‘otro’."""
@@ -52,7 +66,10 @@ def mock_openai(monkeypatch):
         return SimpleNamespace(choices=[choice])
 
     import core.message_predictor as mp
-    monkeypatch.setattr(mp.openai.chat.completions, "create", _fake_completion)
+    # el gateway crea su cliente al primer uso: se le inyecta uno falso
+    monkeypatch.setattr(mp.llm, "_cliente", _cliente_falso(_fake_completion))
+    # caché del LLM aislada: no dejar respuestas falsas en disco
+    monkeypatch.setattr(mp, "llm_cache", CacheLLM(mp.LLM_MODEL, path=":memory:"))
     yield
 
 # ──────────────────────────── Tests predictor ────────────────────────────────
@@ -71,32 +88,172 @@ def test_predictor_regex(texto: str, esperado: Intent):
     assert label == esperado
     assert conf == 1.0
 
+@pytest.mark.parametrize(
+    "texto, esperado",
+    [
+        ("DÓNDE ESTÁN", "ubicacion"),            # sin depender de acentos
+        ("¿Qué onda?", "saludo"),
+        ("Tienen productos para rizos?", "listar_productos"),
+        ("Quiero un corte, hola", "saludo"),     # prioridad, no posición
+    ],
+)
+def test_predictor_regex_plegado_y_prioridad(texto: str, esperado: Intent):
+    assert predict_intent(texto) == (esperado, 1.0)
+
+
+def test_reglas_compiladas_contadores():
+    reglas = ReglasCompiladas({"a": ["apartad[oa]s?"], "b": ["apartado especial", "cita"]})
+    assert reglas.buscar("tengo una cita apartada") == "a"
+    assert reglas.buscar("el apartado especial") == "b"       # gana la más larga
+    assert reglas.buscar("nada que ver") is None
+    assert reglas.hits == {("a", "apartad[oa]s?"): 1, ("b", "apartado especial"): 1}
+
+@pytest.mark.parametrize("texto", ["aceptan efectivo?", "me pasas la dirección del salón"])
+def test_pkl_no_responde_otro_sin_llm(monkeypatch, texto):
+    """"opinar" del pkl de 3 clases no es una intención: decide el LLM."""
+    import core.message_predictor as mp
+
+    monkeypatch.setattr(mp, "_ask_llm", lambda t: "pago")
+    assert predict_intent(texto) == ("pago", mp.LLM_CONFIDENCE)
+
+def test_predict_intent_many_batches_tiers(monkeypatch):
+    """Un solo predict_proba para el lote; lo dudoso o sin mapeo llega al LLM."""
+    import core.message_predictor as mp
+    from core.model_registry import ModeloCargado
+
+    class FakeVect:
+        def transform(self, textos):
+            return textos
+
+    class FakeClf:
+        classes_ = np.array(["pago", "otro", "consultar"])
+        llamadas = []
+
+        def predict_proba(self, textos):
+            self.llamadas.append(list(textos))
+            return np.array([
+                [0.9, 0.1, 0.0] if "cuánto" in t
+                else [0.1, 0.1, 0.8] if "mmm" in t      # etiqueta sin mapeo → LLM
+                else [0.2, 0.1, 0.0]
+                for t in textos
+            ])
+
+    clf = FakeClf()
+    modelo = ModeloCargado("modelo_intencion", Path("x.pkl"), clf, FakeVect())
+    monkeypatch.setattr(mp, "_load_local_model", lambda: modelo)
+    al_llm = []
+    monkeypatch.setattr(mp, "_ask_llm", lambda t: al_llm.append(t) or "soporte_tecnico")
+
+    textos = ["Hola", "cuánto es", "mmm", "Agendar cita", "mmm", "???"]
+    assert predict_intent_many(textos) == [
+        ("saludo", 1.0), ("pago", 0.9), ("soporte_tecnico", mp.LLM_CONFIDENCE),
+        ("agendar_cita", 1.0), ("soporte_tecnico", mp.LLM_CONFIDENCE),
+        ("soporte_tecnico", mp.LLM_CONFIDENCE),
+    ]
+    assert clf.llamadas == [["cuánto es", "mmm", "mmm", "???"]]
+    assert sorted(al_llm) == ["???", "mmm"]
+
+def test_cabezas_compartidas_igual_a_cada_pipeline():
+    """Un tokenizado para las tres cabezas, mismas probabilidades que por separado."""
+    import core.message_predictor as mp
+
+    cabezas = mp._cabezas()
+    assert set(cabezas._fusionadas) == set(mp._CABEZAS)
+    textos = ["quiero balayage el lunes", "me encantó el corte", "cuánto cuesta", ""]
+    probas = cabezas.predict_proba(textos)
+    for nombre, modelo in cabezas.modelos.items():
+        clases, proba = probas[nombre]
+        assert list(clases) == list(modelo.classes_)
+        np.testing.assert_allclose(proba, modelo.predict_proba(textos))
+    assert mp._cabezas() is cabezas                     # sin cambios en disco: no se rearma
+
+def test_predict_message_preselecciona_servicio():
+    from core.message_predictor import predict_message
+
+    catalogo = [{"Nombre": "Balayage", "Id": 7}, {"Nombre": "Nashi", "Id": 8}]
+    pred = predict_message("Quiero agendar balayage", catalogo)
+    assert (pred.intent, pred.intent_conf) == ("agendar_cita", 1.0)
+    assert pred.sentimiento in {"negativo", "neutro", "positivo"}
+    assert (pred.servicio, pred.servicio_id) == ("Balayage", 7)
+
+    vago = predict_message("Quiero agendar", catalogo)
+    assert vago.servicio_conf < 0.35 and vago.servicio_id is None
+
+def test_llm_cache_persistente(tmp_path):
+    ruta = tmp_path / "llm.sqlite3"
+    cache = CacheLLM("gpt-x", path=ruta)
+    cache.guardar("¿Cuánto   CUESTA el tinte?", "pago")
+
+    # otro proceso / reinicio: mismo archivo, clave normalizada
+    otro = CacheLLM("gpt-x", path=ruta)
+    assert otro.obtener("cuanto cuesta el tinte?") == "pago"
+    assert otro.obtener(" Cuánto cuesta el TINTE? ") == "pago"
+    assert otro.metricas()["hits_disco"] == 1 and otro.metricas()["hits_memoria"] == 1
+
+    # cambiar de modelo invalida
+    assert CacheLLM("gpt-y", path=ruta).obtener("cuanto cuesta el tinte?") is None
+
+    # TTL
+    caducado = CacheLLM("gpt-x", path=ruta, ttl=0)
+    assert caducado.obtener("cuanto cuesta el tinte?") is None
+    assert caducado.metricas()["misses"] == 1
+
+
+def test_ask_llm_una_consulta_por_frase(monkeypatch):
+    """La misma frase (normalizada) sólo llega una vez al LLM."""
+    import core.message_predictor as mp
+
+    llamadas = []
+
+    def _fake_completion(*_, **kw):
+        llamadas.append(kw["messages"][-1]["content"])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="pago"))])
+
+    monkeypatch.setattr(mp.llm, "_cliente", _cliente_falso(_fake_completion))
+    assert mp._ask_llm("¿Aceptan   transferencia?") == "pago"
+    assert mp._ask_llm("aceptan transferencia") == "pago"
+    assert llamadas == ["¿Aceptan   transferencia?"]
+    assert mp.llm_cache.metricas()["hits_memoria"] == 1
+
+
+def test_llm_cache_tope_de_tamano(tmp_path, monkeypatch):
+    import core.llm_cache as lc
+    monkeypatch.setattr(lc, "PODA_CADA", 1)
+    cache = CacheLLM("gpt-x", path=tmp_path / "llm.sqlite3", max_entradas=2, front=0)
+    for i in range(4):
+        cache.guardar(f"frase {i}", "otro")
+    assert cache.obtener("frase 0") is None
+    assert cache.obtener("frase 3") == "otro"
+    assert cache.metricas()["desalojos"] == 2
+
 # ─────────────────────────── Tests scheduler ────────────────────────────────
+# próximo lunes: día abierto y futuro (no depende de la hora a la que corre la prueba)
+_LUNES = date.today() + timedelta(days=7 - date.today().weekday())
 
-def test_scheduler_slot_libre(db):
-    disponible = scheduler.is_slot_available(db, date.today(), time(10, 0), 1, 1)
+def test_scheduler_slot_libre(db, seed_minimal):
+    disponible = scheduler.is_slot_available(db, _LUNES, time(10, 0), 1, 1)
     assert disponible is True
 
 
-def test_scheduler_slot_ocupado(db):
+def test_scheduler_slot_ocupado(db, seed_minimal):
     # 1) crea cita que ocupa 10:00‑10:30
-    cita = Cita(fecha=date.today(), hora=time(10, 0), cliente_id=1,
+    cita = Cita(fecha=_LUNES, hora=time(10, 0), cliente_id=1,
                 servicio_id=1, empleado_id=1)
     db.add(cita); db.commit()
 
     # 2) intenta reservar mismo horario
-    disponible = scheduler.is_slot_available(db, date.today(), time(10, 0), 1, 1)
+    disponible = scheduler.is_slot_available(db, _LUNES, time(10, 0), 1, 1)
     assert disponible is False
 
 
 @pytest.mark.parametrize("offset", [0, 15])
-def test_scheduler_solapamiento(db, offset):
+def test_scheduler_solapamiento(db, seed_minimal, offset):
     # cita existente 10:00‑10:30
-    cita = Cita(fecha=date.today(), hora=time(10, 0), cliente_id=1,
+    cita = Cita(fecha=_LUNES, hora=time(10, 0), cliente_id=1,
                 servicio_id=1, empleado_id=1)
     db.add(cita); db.commit()
 
     # nuevo intento 10:00 o 10:15  (se solapan)
     hora_nueva = (datetime := time(10, 0)).replace(minute=offset)
-    disponible = scheduler.is_slot_available(db, date.today(), hora_nueva, 1, 1)
+    disponible = scheduler.is_slot_available(db, _LUNES, hora_nueva, 1, 1)
     assert disponible is False
@@ -5,12 +5,23 @@ Pruebas unitarias del *scheduler* de Oliva (verificación de disponibilidad).
 """
 import uuid
 import datetime as dt
+import numpy as np
 import pytest
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
-from db.models import Base, Servicio, Empleado, Cliente
-from core.scheduler import is_slot_available, book_slot, SlotOccupiedError
+from db.models import (
+    Base, Servicio, Empleado, Cliente, Cita, DisponibilidadPersonal, AgendaBloqueo,
+)
+from core.scheduler import (
+    is_slot_available, book_slot, cancel_slot, next_free_slots, next_free_slots_any,
+    first_free_employee, SlotOccupiedError, EmpleadoAusenteError, InvalidInputError,
+)
+from core.agenda_index import agenda_index, DiaAgenda
+from core.agenda_locks import agenda_exclusiva, purgar_bloqueos
+from core.calendario_ausencias import AusenciasEmpleado, calendario_ausencias
+from core.disponibilidad_resumen import dias_con_capacidad
+from core.slot_engine import minutos_libres
 
 # ---------------------------------------------------------------------------
 # Fixtures
@@ -52,20 +63,46 @@ def seed_basic(db):
     db.add_all([servicio, empleado, cliente]); db.commit()
     return servicio, empleado, cliente
 
+def _proximo_lunes() -> dt.date:
+    hoy = dt.date.today()
+    return hoy + dt.timedelta(days=7 - hoy.weekday())
+
 # ---------------------------------------------------------------------------
 # Tests
 # ---------------------------------------------------------------------------
 
 def test_slot_available_when_empty(db):
     servicio, empleado, _ = seed_basic(db)
-    fecha = dt.date.today()
+    fecha = _proximo_lunes()          # día abierto y futuro
     hora = dt.time(10, 0)
 
     assert is_slot_available(db, fecha, hora, empleado.id, servicio) is True
 
+def test_slot_available_respects_salon_hours(db):
+    servicio, empleado, _ = seed_basic(db)                  # 60 min
+    lunes = _proximo_lunes()
+    domingo = lunes - dt.timedelta(days=1)
+    ayer = dt.date.today() - dt.timedelta(days=1)
+
+    assert is_slot_available(db, domingo, dt.time(10, 0), empleado.id, servicio) is False
+    assert is_slot_available(db, ayer, dt.time(10, 0), empleado.id, servicio) is False
+    assert is_slot_available(db, lunes, dt.time(8, 30), empleado.id, servicio) is False
+    assert is_slot_available(db, lunes, dt.time(19, 30), empleado.id, servicio,
+                             usar_indice=False) is False    # termina después del cierre
+    assert is_slot_available(db, lunes, dt.time(19, 0), empleado.id, servicio) is True
+
+@pytest.mark.parametrize("hora", [dt.time(10, 2), dt.time(10, 0, 30)])
+def test_off_grid_hour_rejected(db, hora):
+    servicio, empleado, _ = seed_basic(db)
+    lunes = _proximo_lunes()
+    with pytest.raises(InvalidInputError):
+        is_slot_available(db, lunes, hora, empleado.id, servicio)
+    with pytest.raises(InvalidInputError):
+        first_free_employee(db, lunes, hora, servicio)
+
 def test_slot_conflict_after_booking(db):
     servicio, empleado, cliente = seed_basic(db)
-    fecha = dt.date.today()
+    fecha = _proximo_lunes()          # día abierto y futuro
     hora = dt.time(11, 0)
 
     book_slot(db, cliente.id, servicio.id, empleado.id, fecha, hora)
@@ -75,7 +112,7 @@ def test_slot_conflict_after_booking(db):
 
 def test_non_overlapping_slots(db):
     servicio, empleado, cliente = seed_basic(db)
-    fecha = dt.date.today()
+    fecha = _proximo_lunes()          # día abierto y futuro
     hora1 = dt.time(9, 0)
     hora2 = dt.time(10, 0)
 
@@ -93,9 +130,243 @@ def test_different_employee_does_not_conflict(db):
     )
     db.add(empleado2); db.commit()
 
-    fecha = dt.date.today()
+    fecha = _proximo_lunes()          # día abierto y futuro
     hora = dt.time(14, 0)
 
     book_slot(db, cliente.id, servicio.id, empleado1.id, fecha, hora)
 
     assert is_slot_available(db, fecha, hora, empleado2.id, servicio) is True
+
+def test_cancel_frees_slot(db):
+    servicio, empleado, cliente = seed_basic(db)
+    fecha = _proximo_lunes()          # día abierto y futuro
+    hora = dt.time(12, 0)
+
+    cita = book_slot(db, cliente.id, servicio.id, empleado.id, fecha, hora)
+    db.commit()
+    assert is_slot_available(db, fecha, hora, empleado.id, servicio) is False
+
+    cancel_slot(db, cita.id)
+    db.commit()
+    assert is_slot_available(db, fecha, hora, empleado.id, servicio) is True
+
+def test_index_invalidated_by_external_write(db):
+    servicio, empleado, cliente = seed_basic(db)
+    fecha = _proximo_lunes()          # día abierto y futuro
+    hora = dt.time(16, 0)
+
+    assert is_slot_available(db, fecha, hora, empleado.id, servicio) is True
+
+    # Otro "proceso" escribe directo en la tabla sin pasar por el ORM
+    db.execute(
+        Cita.__table__.insert().values(
+            fecha=fecha, hora=dt.time(16, 30), hora_fin=dt.time(17, 30), duracion_min=60,
+            cliente_id=cliente.id,
+            servicio_id=servicio.id, empleado_id=empleado.id,
+            created_at=dt.datetime.utcnow(), updated_at=dt.datetime.utcnow(),
+        )
+    )
+    agenda_index.probe_seconds, previo = 0, agenda_index.probe_seconds
+    try:
+        assert is_slot_available(db, fecha, hora, empleado.id, servicio) is False
+    finally:
+        agenda_index.probe_seconds = previo
+
+@pytest.mark.parametrize("usar_indice", [True, False])
+def test_existing_cita_uses_its_own_duration(db, usar_indice):
+    largo, empleado, cliente = seed_basic(db)                 # 60 min
+    corto = Servicio(nombre=f"Flequillo_{uuid.uuid4().hex[:6]}", categoria="Corte",
+                     duracion_min=30)
+    db.add(corto); db.commit()
+    fecha = _proximo_lunes()          # día abierto y futuro
+
+    cita = book_slot(db, cliente.id, corto.id, empleado.id, fecha, dt.time(10, 0))
+    assert cita.hora_fin == dt.time(10, 30) and cita.duracion_min == 30
+
+    # 10:30 con el servicio largo ya no choca con la cita corta de 10:00
+    assert is_slot_available(db, fecha, dt.time(10, 30), empleado.id, largo,
+                             usar_indice=usar_indice) is True
+    assert is_slot_available(db, fecha, dt.time(9, 45), empleado.id, largo,
+                             usar_indice=usar_indice) is False
+
+def test_next_free_slots_skips_booked(db):
+    servicio, empleado, cliente = seed_basic(db)
+    lunes = _proximo_lunes()
+
+    book_slot(db, cliente.id, servicio.id, empleado.id, lunes, dt.time(10, 0))
+
+    slots = next_free_slots(db, lunes, dt.time(10, 0), empleado.id, servicio.id, n=3)
+    assert [s["inicio"][11:16] for s in slots] == ["11:00", "11:30", "12:00"]
+
+def test_next_free_slots_skips_closed_and_absent_days(db):
+    servicio, empleado, _ = seed_basic(db)
+    lunes = _proximo_lunes()
+    sabado = lunes - dt.timedelta(days=2)
+    db.add(DisponibilidadPersonal(empleado_id=empleado.id, fecha_ini=lunes, fecha_fin=lunes))
+    db.commit()
+
+    # sábado 19:30 no alcanza (cierra 20:00), domingo cerrado, lunes ausente
+    slots = next_free_slots(db, sabado, dt.time(19, 30), empleado.id, servicio.id, n=1)
+    assert slots[0]["inicio"] == f"{lunes + dt.timedelta(days=1)}T09:00:00"
+
+def test_absent_employee_rejected_and_calendar_refreshed(db):
+    servicio, empleado, cliente = seed_basic(db)
+    lunes = _proximo_lunes()
+    assert is_slot_available(db, lunes, dt.time(10, 0), empleado.id, servicio) is True
+
+    ausencia = DisponibilidadPersonal(empleado_id=empleado.id, fecha_ini=lunes, fecha_fin=lunes)
+    db.add(ausencia); db.commit()      # se aplica al calendario sin recargarlo
+
+    assert calendario_ausencias.ausente(db, empleado.id, lunes) is True
+    assert is_slot_available(db, lunes, dt.time(10, 0), empleado.id, servicio) is False
+    assert is_slot_available(db, lunes, dt.time(10, 0), empleado.id, servicio,
+                             usar_indice=False) is False
+    with pytest.raises(EmpleadoAusenteError):
+        book_slot(db, cliente.id, servicio.id, empleado.id, lunes, dt.time(10, 0))
+
+    db.delete(ausencia); db.commit()
+    assert is_slot_available(db, lunes, dt.time(10, 0), empleado.id, servicio) is True
+
+def test_ausencias_empleado_bitset_and_fallback():
+    base = dt.date(2025, 1, 1).toordinal()
+    cal = AusenciasEmpleado(base)
+    cal.filas = {1: (base + 2, base + 4), 2: (base + 5, base + 6), 3: (base + 400, base + 401)}
+    cal.reconstruir()
+    assert list(zip(cal.inicios, cal.fines)) == [(base + 2, base + 6), (base + 400, base + 401)]
+    assert cal.mascara(base, 8).tolist() == [False, False, True, True, True, True, True, False]
+    assert cal.ausente(base + 401) is True      # fuera del horizonte → bisect
+    assert cal.ausente(base + 402) is False
+    assert cal.ausente(base - 1) is False
+
+def test_resumen_disponibilidad_incremental(db):
+    servicio, empleado, cliente = seed_basic(db)
+    lunes = _proximo_lunes()
+    dias = lambda dur: dias_con_capacidad(db, dur, lunes, dias=2, empleado_id=empleado.id)
+    assert dias(480) == [lunes, lunes + dt.timedelta(days=1)]    # materializa
+
+    # 13:00‑14:00 parte la jornada 9‑20 en 4 h + 6 h: ya no caben 8 h
+    cita = book_slot(db, cliente.id, servicio.id, empleado.id, lunes, dt.time(13, 0))
+    assert dias(480) == [lunes + dt.timedelta(days=1)]
+    assert lunes in dias(60)
+
+    cancel_slot(db, cita.id)
+    assert lunes in dias(480)
+
+def test_resumen_sin_bucket_y_hoy_desde_ahora(db):
+    servicio, empleado, cliente = seed_basic(db)
+    lunes = _proximo_lunes()
+    martes = lunes + dt.timedelta(days=1)
+    dias = lambda dur, **kw: dias_con_capacidad(db, dur, lunes, dias=2, empleado_id=empleado.id, **kw)
+
+    # 10 h no tiene bucket (el mayor es 8 h): se calcula sobre el bitmap
+    book_slot(db, cliente.id, servicio.id, empleado.id, lunes, dt.time(13, 0))
+    assert dias(600) == [martes]
+    assert dias(700) == []                                        # más que la jornada
+
+    # Hoy a las 19:30 sólo quedan 30 min aunque el resumen cuente la mañana
+    tarde = dt.datetime.combine(lunes, dt.time(19, 30))
+    assert dias(60, ahora=tarde) == [martes]
+    assert dias(30, ahora=tarde) == [lunes, martes]
+
+def test_resumen_invalidado_por_ausencias_y_altas(db):
+    servicio, empleado, cliente = seed_basic(db)
+    lunes = _proximo_lunes()
+    martes = lunes + dt.timedelta(days=1)
+    dias = lambda dur, emp=None: dias_con_capacidad(db, dur, lunes, dias=2, empleado_id=emp)
+    solo_ella = lambda dur: dias(dur, empleado.id)
+    assert solo_ella(60) == [lunes, martes]                      # materializa
+
+    ausencia = DisponibilidadPersonal(empleado_id=empleado.id, fecha_ini=lunes, fecha_fin=lunes)
+    db.add(ausencia); db.commit()
+    assert solo_ella(60) == [martes]
+    ausencia.fecha_ini = ausencia.fecha_fin = martes; db.commit()
+    assert solo_ella(60) == [lunes]
+    db.delete(ausencia); db.commit()
+    assert solo_ella(60) == [lunes, martes]
+
+    # jornada del lunes llena para toda la plantilla; una alta nueva la reabre
+    for e in db.query(Empleado).all():
+        db.add(DisponibilidadPersonal(empleado_id=e.id, fecha_ini=lunes, fecha_fin=lunes))
+    db.commit()
+    assert lunes not in dias(60)
+    seed_basic(db)
+    assert lunes in dias(60)
+
+def test_resumen_materializar_concurrente(db, monkeypatch):
+    import core.disponibilidad_resumen as dr
+    servicio, empleado, _ = seed_basic(db)
+    lunes = _proximo_lunes()
+    calcular = dr._calcular
+    # otro lector insertó las mismas claves entre nuestro DELETE y el INSERT
+    monkeypatch.setattr(dr, "_calcular", lambda *a: (f := calcular(*a)) + f[:1])
+
+    assert dr.materializar(db, lunes, 2, [empleado.id]) == 0
+    assert dias_con_capacidad(db, 60, lunes, dias=2, empleado_id=empleado.id) == [
+        lunes, lunes + dt.timedelta(days=1)]
+    db.commit()                                                   # la sesión sigue usable
+
+def test_minutos_libres_por_umbral():
+    ocupado = np.zeros((2, 12), dtype=bool)      # 2 días × 1 h (celdas de 5 min)
+    ocupado[0, 4:6] = True                       # 20 min libres + 30 min libres
+    ocupado[1, :] = True
+    assert minutos_libres(ocupado, [5, 25, 60]).tolist() == [[50, 30, 0], [0, 0, 0]]
+
+def test_any_employee_earliest_slot(db):
+    servicio, empleado1, cliente = seed_basic(db)
+    u = uuid.uuid4().hex[:4]
+    empleado2 = Empleado(
+        nombre="Mario", puesto="Barbero",
+        telefono=f"555999{u}", email=f"mario{u}@example.com"
+    )
+    db.add(empleado2); db.commit()
+    lunes = _proximo_lunes()
+    ids = [empleado1.id, empleado2.id]
+
+    book_slot(db, cliente.id, servicio.id, empleado1.id, lunes, dt.time(9, 0))
+    assert first_free_employee(db, lunes, dt.time(9, 0), servicio, ids) == empleado2.id
+
+    book_slot(db, cliente.id, servicio.id, empleado2.id, lunes, dt.time(9, 0))
+    assert first_free_employee(db, lunes, dt.time(9, 0), servicio, ids) is None
+
+    slots = next_free_slots_any(db, lunes, dt.time(9, 0), servicio, n=2, empleado_ids=ids)
+    assert [s["inicio"][11:16] for s in slots] == ["10:00", "10:30"]
+
+def test_agenda_exclusiva_takes_lock_row(db):
+    servicio, empleado, cliente = seed_basic(db)
+    fecha = dt.date.today()
+
+    for hora in (dt.time(9, 0), dt.time(10, 0)):
+        with agenda_exclusiva(db, [(empleado.id, fecha)]):
+            book_slot(db, cliente.id, servicio.id, empleado.id, fecha, hora)
+            db.commit()
+
+    bloqueo = db.get(AgendaBloqueo, (empleado.id, fecha))
+    assert bloqueo.version == 2
+
+def test_lock_rows_for_past_days_are_pruned(db):
+    servicio, empleado, cliente = seed_basic(db)
+    _, otro, _ = seed_basic(db)
+    hoy = dt.date.today()
+    viejos = [hoy - dt.timedelta(days=d) for d in (1, 30)]
+    db.add_all([AgendaBloqueo(empleado_id=e.id, fecha=f, version=3)
+                for e in (empleado, otro) for f in viejos])
+    db.commit()
+
+    # primera reserva de un día nuevo → se van los días pasados de ese empleado
+    with agenda_exclusiva(db, [(empleado.id, _proximo_lunes())]):
+        db.commit()
+    assert all(db.get(AgendaBloqueo, (empleado.id, f)) is None for f in viejos)
+    assert all(db.get(AgendaBloqueo, (otro.id, f)) is not None for f in viejos)
+
+    assert purgar_bloqueos(db) == 2                          # job de toda la tabla
+    assert db.get(AgendaBloqueo, (empleado.id, _proximo_lunes())) is not None
+
+def test_dia_agenda_bisect():
+    dia = DiaAgenda()
+    dia.agregar(1, 600, 660)    # 10:00‑11:00
+    dia.agregar(2, 540, 570)    # 09:00‑09:30
+    assert dia.intervalos() == [(540, 570), (600, 660)]
+    assert dia.solapa(570, 600) is False
+    assert dia.solapa(630, 700) is True
+    dia.quitar(1)
+    assert dia.solapa(630, 700) is False
@@ -0,0 +1,69 @@
+# tests/test_telegram_webhook.py
+"""pytest: selector de fechas del webhook de Telegram (app/telegram_webhook.py)
+contra una sesión SQLite real que expira los objetos al hacer commit, como
+``db.session.SessionLocal``."""
+import importlib
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from db.models import Base, Empleado, Servicio
+
+pytest.importorskip("flask")
+pytest.importorskip("telegram.ext")
+
+
+@pytest.fixture
+def webhook(monkeypatch):
+    monkeypatch.setenv("TELEGRAM_TOKEN", "123456:PRUEBA")
+    monkeypatch.setattr("core.functions.cargar_servicios", lambda: [])   # sin BD al importar
+    try:
+        tw = importlib.import_module("app.telegram_webhook")
+    except ImportError as e:              # p. ej. python-telegram-bot ≥ 20 (sin Dispatcher)
+        pytest.skip(f"app.telegram_webhook no importa: {e}")
+
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine, autoflush=False)      # expire_on_commit=True
+
+    @contextmanager
+    def get_session():
+        db = Session()
+        try:
+            yield db
+            db.commit()
+        finally:
+            db.close()
+
+    monkeypatch.setattr(tw, "get_session", get_session)
+    with get_session() as db:
+        servicio = Servicio(nombre="Balayage", categoria="Color", duracion_min=60, duracion_max=90)
+        db.add_all([servicio, Empleado(nombre="Lupita", puesto="Estilista",
+                                       telefono="5550001", email="lupita@example.com")])
+        db.flush()
+        servicio_id = servicio.id
+    return tw, servicio_id
+
+
+def _contexto():
+    enviados = []
+    bot = SimpleNamespace(send_message=lambda **kw: enviados.append(kw))
+    return SimpleNamespace(bot=bot), enviados
+
+
+def test_ofrecer_fechas_con_sesion_cerrada(webhook):
+    tw, servicio_id = webhook
+    context, enviados = _contexto()
+    tw._ofrecer_fechas(context, 42, servicio_id)
+    assert enviados[0]["text"] == "Elige una fecha para *Balayage*:"
+    assert enviados[0]["reply_markup"] is not None
+
+
+def test_ofrecer_fechas_servicio_inexistente(webhook):
+    tw, servicio_id = webhook
+    context, enviados = _contexto()
+    tw._ofrecer_fechas(context, 42, servicio_id + 1000)
+    assert [m["text"] for m in enviados] == ["Servicio no encontrado."]
@@ -2,19 +2,22 @@
 # utils/datetime_parser.py
 #=================================================================
 
-import re
-from datetime import datetime
-from typing import List, Optional
 import os
+import re
+import threading
+from collections import Counter, OrderedDict
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
 import json
 #=================================================================
-from openai import OpenAI
 from dotenv import load_dotenv
 
+from core.llm_gateway import llm   # single-flight + plazo + semáforo
+from core.texto import normalizar
+from utils.fecha_local import TZ_NEGOCIO, resolver_fecha   # gramática local (sin red)
+
 #cargar variable de env
 load_dotenv()
-
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 #=================================================================
 
 # Creamos los patrones de formato de fecha y hora
@@ -45,13 +48,13 @@ def validar_fecha(fecha_str: str) -> datetime | None:
         return None
     
 
-def parse_datetime_with_ai(text: str, patterns: List[str]) -> List[str]:
+def parse_datetime_with_ai(text: str, patterns: List[str], ahora: Optional[datetime] = None) -> List[str]:
     """
     Llama a la API openAI, interpreta el texto y extrae las fechas y horas ambiguas o en formato libre.
-    Devuelve la fecha y hora en formato ISO 8601.
+    Devuelve la fecha y hora en formato ISO 8601 (lista vacía si la IA no responde a tiempo).
     """
-    #======  Fecha actual ===========
-    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    #======  Fecha actual (al minuto: mensajes iguales comparten la llamada) ===========
+    now = (ahora or datetime.now()).strftime("%Y-%m-%d %H:%M")
 
     if not patterns:
         prompt =(
@@ -68,29 +71,105 @@ def parse_datetime_with_ai(text: str, patterns: List[str]) -> List[str]:
 
 
         )
-    response = client.chat.completions.create(
+    result = llm.chat(
+        [{"role": "user", "content": prompt}],
         model="gpt-3.5-turbo",
-        messages=[{"role": "user", "content": prompt}],
         max_tokens=150,
     )
+    if result is None:
+        return []
 
     try:
-        result = response.choices[0].message.content.strip()
+        result = result.strip()
         data = json.loads(result)
         return data.get("datetimes", [])
     except Exception as e:
         print("❌ Error al interpretar respuesta IA:", e)
         return []
 
-def datetime_parser(text: str) -> List[str]:
-    """Pipeline principal para detección de fechas y horas."""
+def datetime_parser(text: str, ahora: Optional[datetime] = None) -> List[str]:
+    """Pipeline principal para detección de fechas y horas.
+
+    Primero la gramática local (``utils.fecha_local``); el LLM sólo si no
+    resuelve el texto de forma inequívoca. Sin hora explícita se devuelve
+    sólo la fecha (``YYYY-MM-DD``).
+    """
+    local = resolver_fecha(text, ahora)
+    if local is not None:
+        return [local.iso()]
     patterns = detect_datetime_patterns(text)
-    iso_datetimes = parse_datetime_with_ai(text, patterns)
+    iso_datetimes = parse_datetime_with_ai(text, patterns, ahora)
     return [
         dt for dt in iso_datetimes
         if validar_fecha(dt) is not None
     ]
 
+#=================================================================
+# Caché de parseo (compartida por todos los handlers del proceso)
+#=================================================================
+FECHAS_CACHE_MAX = int(os.getenv("FECHAS_CACHE_MAX", "4096"))
+
+
+class CacheParseo:
+    """``(texto normalizado, día de referencia, zona) → ISO`` en memoria.
+
+    Una conversación de reserva repite el mismo ``fecha_texto`` en
+    ``check_availability`` y ``process_booking_request`` (fecha y hora):
+    se resuelve una sola vez. Las entradas caducan al cambiar el día
+    ("mañana" ya significa otra cosa). No se guardan resultados vacíos
+    (el LLM pudo no responder a tiempo).
+    """
+
+    def __init__(self, max_entradas: int = FECHAS_CACHE_MAX) -> None:
+        self.max_entradas = max_entradas
+        self._lock = threading.Lock()
+        self._dia: Optional[date] = None
+        self._datos: "OrderedDict[Tuple[str, date, str], List[str]]" = OrderedDict()
+        self.metricas_: Counter[str] = Counter()
+
+    def parsear(self, text: str, ahora: Optional[datetime] = None) -> List[str]:
+        """``datetime_parser(text, ahora)`` memoizado."""
+        if ahora is None:
+            ahora = datetime.now(TZ_NEGOCIO)
+        hoy = (ahora.astimezone(TZ_NEGOCIO) if ahora.tzinfo else ahora).date()
+        clave = (normalizar(text), hoy, str(TZ_NEGOCIO))
+        with self._lock:
+            if hoy != self._dia:            # cambio de día: todo lo relativo caduca
+                if self._datos:
+                    self.metricas_["caducadas"] += len(self._datos)
+                self._datos.clear()
+                self._dia = hoy
+            iso = self._datos.get(clave)
+            if iso is not None:
+                self._datos.move_to_end(clave)
+                self.metricas_["hits"] += 1
+                return list(iso)
+            self.metricas_["misses"] += 1
+
+        iso = datetime_parser(text, ahora)
+        if iso:
+            with self._lock:
+                if self._dia == hoy:
+                    self._datos[clave] = list(iso)
+                    while len(self._datos) > self.max_entradas:
+                        self._datos.popitem(last=False)
+        return iso
+
+    def limpiar(self) -> None:
+        with self._lock:
+            self._datos.clear()
+
+    def metricas(self) -> Dict[str, float]:
+        with self._lock:
+            m: Dict[str, float] = dict(self.metricas_)
+            m["entradas"] = len(self._datos)
+        total = m.get("hits", 0) + m.get("misses", 0)
+        m["hit_ratio"] = m.get("hits", 0) / total if total else 0.0
+        return m
+
+
+cache_parseo = CacheParseo()
+
 # Prueba manual (CLI)
 if __name__ == "__main__":
     test_inputs = [
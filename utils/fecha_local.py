@@ -0,0 +1,278 @@
+#=================================================================
+# utils/fecha_local.py
+#=================================================================
+"""Resolución local (sin red) de fechas y horas en español de México.
+
+Cubre lo que más se escribe al agendar, relativo a un ``ahora`` inyectable
+(zona ``TZ_NEGOCIO``, por defecto ``America/Mexico_City``):
+
+    17/07/2025 20:14 · 2025-07-17 · 17 de julio · el 22 · martes 22
+    hoy · mañana · pasado mañana · el jueves · el próximo viernes
+    el martes de la próxima semana · en 3 días · dentro de una semana
+    a las 3 · 3 pm · 15:30 hrs · 4 y media · cuarto para las 5
+    a medio día · 7 de la noche
+
+Si el texto es ambiguo (dos fechas, "en la tarde" sin hora, "fin de
+semana"…) o no se reconoce nada, devuelve ``None`` y quien llama decide
+(``utils.datetime_parser`` recurre entonces al LLM).
+
+Horas sin am/pm: de 1 a 7 se toman como de la tarde (horario del salón).
+"""
+from __future__ import annotations
+
+import os
+import re
+from calendar import monthrange
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from typing import List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from core.texto import plegar_acentos
+
+TZ_NEGOCIO = ZoneInfo(os.getenv("TZ_NEGOCIO", "America/Mexico_City"))
+
+__all__ = ["Resolucion", "resolver_fecha", "TZ_NEGOCIO"]
+
+#=================================================================
+# Vocabulario
+#=================================================================
+_MESES = {
+    "enero": 1, "febrero": 2, "marzo": 3, "abril": 4, "mayo": 5, "junio": 6,
+    "julio": 7, "agosto": 8, "septiembre": 9, "setiembre": 9, "octubre": 10,
+    "noviembre": 11, "diciembre": 12,
+    "ene": 1, "feb": 2, "mar": 3, "abr": 4, "may": 5, "jun": 6, "jul": 7,
+    "ago": 8, "sep": 9, "sept": 9, "oct": 10, "nov": 11, "dic": 12,
+}
+_DIAS = {
+    "lunes": 0, "martes": 1, "miercoles": 2, "jueves": 3,
+    "viernes": 4, "sabado": 5, "domingo": 6,
+}
+_NUMEROS = {"un": 1, "una": 1, "dos": 2, "tres": 3, "cuatro": 4, "cinco": 5}
+_MANANA = r"ma(?:ñ|n)ana"
+_MES_RE = "|".join(sorted(_MESES, key=len, reverse=True))
+_DIA_RE = "|".join(_DIAS)
+
+#=================================================================
+# Patrones (sobre texto en minúsculas y sin acentos)
+#=================================================================
+_HORA = re.compile(
+    r"(?<![\d/\-:])(?:\b(?P<pre>a\s+las?|las?|a\s+eso\s+de\s+las?)\s+)?"
+    r"(?P<h>\d{1,2})(?::(?P<m>\d{2}))?(?![\d/\-])"
+    r"(?:\s*(?P<ampm>a\.?\s?m\.?|p\.?\s?m\.?|hrs?\.?|horas)(?!\w))?"
+    r"(?:\s+(?P<frac>y\s+media|y\s+cuarto|menos\s+cuarto))?"
+    rf"(?:\s+(?P<periodo>de\s+la\s+{_MANANA}|de\s+la\s+tarde|de\s+la\s+noche|del\s+medio\s*dia))?"
+)
+_CUARTO_PARA = re.compile(r"\bcuarto\s+para\s+(?:las?\s+)?(?P<h>\d{1,2})\b")
+_MEDIODIA = re.compile(r"\b(?:a\s+)?(?:(?P<md>medio\s*dia)|(?P<mn>media\s*noche))\b")
+
+_ISO = re.compile(
+    r"\b(?P<y>\d{4})[-/](?P<mo>\d{1,2})[-/](?P<d>\d{1,2})"
+    r"(?:[t ](?P<h>\d{1,2}):(?P<mi>\d{2})(?::\d{2})?)?\b"
+)
+_DMY = re.compile(r"\b(?P<d>\d{1,2})[/-](?P<mo>\d{1,2})(?:[/-](?P<y>\d{4}|\d{2}))?\b")
+_DIA_MES = re.compile(
+    rf"\b(?P<d>\d{{1,2}})\s+(?:de\s+)?(?P<mes>{_MES_RE})\b\.?"
+    r"(?:\s+(?:de\s+|del\s+)?(?P<y>\d{4}))?"
+)
+_RELATIVO = re.compile(
+    rf"\b(?:(?P<pasado>pasado\s+{_MANANA})|(?P<hoy>hoy)|(?P<ayer>ayer)"
+    rf"|(?<!la\s)(?P<manana>{_MANANA}))\b"
+)
+_DENTRO_DE = re.compile(
+    r"\b(?:en|dentro\s+de)\s+(?P<n>\d{1,2}|un|una|dos|tres|cuatro|cinco)\s+(?P<u>dias?|semanas?)\b"
+)
+# Un número seguido de esto es una hora, no un día del mes
+_NO_HORA = r"(?![\d:])(?!\s*(?:a\.?\s?m|p\.?\s?m|hrs?|horas|y\s+media|y\s+cuarto|menos\s+cuarto|de\s+la|del)\b)"
+_SEMANA_SIG = r"de\s+la\s+(?:proxima|siguiente|otra)\s+semana|de\s+la\s+semana\s+que\s+viene"
+_DIA_SEMANA = re.compile(
+    rf"\b(?:el\s+)?(?:(?P<prox>proximo|siguiente)\s+)?(?P<dia>{_DIA_RE})"
+    rf"(?:\s+(?P<num>\d{{1,2}}){_NO_HORA})?"
+    rf"(?:\s+(?P<sig>{_SEMANA_SIG}|que\s+viene))?\b"
+)
+_EL_DIA = re.compile(
+    rf"\bel\s+(?:dia\s+)?(?P<d>\d{{1,2}}){_NO_HORA}\b(?!\s*(?:de\s+|del\s+)?(?:{_MES_RE})\b)"
+)
+
+# Restos que vuelven ambiguo el mensaje (sin hora / fecha concreta)
+_VAGOS = re.compile(
+    rf"\b(?:fin\s+de\s+semana|semana|quincena|mes|tarde|noche|temprano|madrugada"
+    rf"|en\s+la\s+{_MANANA}|por\s+la\s+{_MANANA}|antes|despues|entre|o|u)\b"
+)
+
+#=================================================================
+# Resultado
+#=================================================================
+
+@dataclass(frozen=True)
+class Resolucion:
+    fecha: date
+    hora: Optional[time] = None
+
+    def iso(self) -> str:
+        """``YYYY-MM-DDTHH:MM:SS``, o sólo la fecha si no se dio hora."""
+        if self.hora is None:
+            return self.fecha.isoformat()
+        return datetime.combine(self.fecha, self.hora).isoformat()
+
+#=================================================================
+# Helpers
+#=================================================================
+
+def _fecha(y: int, mo: int, d: int) -> Optional[date]:
+    try:
+        return date(y, mo, d)
+    except ValueError:
+        return None
+
+
+def _sin_anio(hoy: date, mo: int, d: int) -> Optional[date]:
+    """Día/mes sin año: este año, o el siguiente si ya pasó."""
+    f = _fecha(hoy.year, mo, d)
+    if f is not None and f < hoy:
+        f = _fecha(hoy.year + 1, mo, d)
+    return f
+
+
+def _dia_del_mes(hoy: date, d: int, dia_semana: Optional[int] = None) -> Optional[date]:
+    """Próximo día *d* (desde hoy) que exista.
+
+    Con *dia_semana* ("martes 22") ese próximo *d* debe caer en este mes o el
+    siguiente y en ese día de la semana; si no ("lunes 22" cuando el 22 es
+    martes) el texto se contradice y se devuelve ``None``, en lugar de saltar
+    meses hasta que coincidan.
+    """
+    y, mo = hoy.year, hoy.month
+    for salto in range(13):
+        if d <= monthrange(y, mo)[1] and (f := date(y, mo, d)) >= hoy:
+            if dia_semana is None:
+                return f
+            return f if salto <= 1 and f.weekday() == dia_semana else None
+        y, mo = (y + 1, 1) if mo == 12 else (y, mo + 1)
+    return None
+
+
+def _hora(h: int, m: int, ampm: str, periodo: str) -> Optional[time]:
+    ampm = ampm.replace(".", "").replace(" ", "")
+    if h == 12 and periodo.endswith("noche"):
+        h = 0                            # "las 12 de la noche" es medianoche
+    elif ampm == "pm" or periodo.endswith(("tarde", "noche")):
+        if h < 12:
+            h += 12
+    elif ampm == "am" or "mañana" in periodo or "manana" in periodo:
+        if h == 12:
+            h = 0
+    elif not ampm.startswith(("h", "hr")) and 1 <= h <= 7:
+        h += 12                          # "a las 3" → 15:00 (horario del salón)
+    if h > 23 or m > 59:
+        return None
+    return time(h, m)
+
+
+def _quitar(texto: str, ini: int, fin: int) -> str:
+    return texto[:ini] + " " * (fin - ini) + texto[fin:]
+
+#=================================================================
+# Extracción
+#=================================================================
+
+def _horas(t: str) -> Tuple[List[Optional[time]], str]:
+    """Horas encontradas (``None`` = inválida) y el texto sin ellas."""
+    horas: List[Optional[time]] = []
+    for mt in _CUARTO_PARA.finditer(t):
+        horas.append(_hora(int(mt["h"]) - 1 or 12, 45, "", ""))
+        t = _quitar(t, *mt.span())
+    for mt in _HORA.finditer(t):
+        # sólo con alguna marca de hora: "a las", ":mm", am/pm, "y media"…
+        if not (mt["pre"] or mt["m"] or mt["ampm"] or mt["frac"] or mt["periodo"]):
+            continue
+        if mt["pre"] and mt["pre"].startswith("la") and not (mt["m"] or mt["ampm"] or mt["periodo"] or mt["frac"]):
+            continue                      # "la 2" / "las 3" sueltos: puede ser otra cosa
+        h, m = int(mt["h"]), int(mt["m"] or 0)
+        frac = (mt["frac"] or "").split()
+        if frac:
+            if frac[0] == "menos":
+                h, m = h - 1, 45
+            else:
+                m = 30 if frac[-1] == "media" else 15
+        horas.append(_hora(h, m, mt["ampm"] or "", mt["periodo"] or ""))
+        t = _quitar(t, *mt.span())
+    for mt in _MEDIODIA.finditer(t):
+        horas.append(time(12, 0) if mt["md"] else time(0, 0))
+        t = _quitar(t, *mt.span())
+    return horas, t
+
+
+def _fechas(t: str, hoy: date) -> Tuple[List[Optional[date]], List[time], str]:
+    """Fechas (``None`` = inválida), horas pegadas a una ISO y el texto restante."""
+    fechas: List[Optional[date]] = []
+    horas_iso: List[time] = []
+
+    for mt in _ISO.finditer(t):
+        fechas.append(_fecha(int(mt["y"]), int(mt["mo"]), int(mt["d"])))
+        if mt["h"]:
+            horas_iso.append(time(int(mt["h"]), int(mt["mi"])))
+        t = _quitar(t, *mt.span())
+    for mt in _DMY.finditer(t):
+        d, mo = int(mt["d"]), int(mt["mo"])
+        if mt["y"]:
+            y = int(mt["y"])
+            fechas.append(_fecha(y + 2000 if y < 100 else y, mo, d))
+        else:
+            fechas.append(_sin_anio(hoy, mo, d))
+        t = _quitar(t, *mt.span())
+    for mt in _DIA_MES.finditer(t):
+        d, mo = int(mt["d"]), _MESES[mt["mes"]]
+        fechas.append(_fecha(int(mt["y"]), mo, d) if mt["y"] else _sin_anio(hoy, mo, d))
+        t = _quitar(t, *mt.span())
+    for mt in _RELATIVO.finditer(t):
+        delta = 2 if mt["pasado"] else 0 if mt["hoy"] else -1 if mt["ayer"] else 1
+        fechas.append(hoy + timedelta(days=delta))
+        t = _quitar(t, *mt.span())
+    for mt in _DENTRO_DE.finditer(t):
+        n = int(mt["n"]) if mt["n"].isdigit() else _NUMEROS[mt["n"]]
+        fechas.append(hoy + timedelta(days=n * (7 if mt["u"].startswith("semana") else 1)))
+        t = _quitar(t, *mt.span())
+    for mt in _DIA_SEMANA.finditer(t):
+        dia = _DIAS[mt["dia"]]
+        if mt["num"]:
+            fechas.append(_dia_del_mes(hoy, int(mt["num"]), dia))
+        elif mt["sig"] and "semana" in mt["sig"]:
+            lunes_sig = hoy + timedelta(days=7 - hoy.weekday())
+            fechas.append(lunes_sig + timedelta(days=dia))
+        else:                             # "el jueves": el próximo, nunca hoy
+            fechas.append(hoy + timedelta(days=(dia - hoy.weekday() - 1) % 7 + 1))
+        t = _quitar(t, *mt.span())
+    for mt in _EL_DIA.finditer(t):
+        fechas.append(_dia_del_mes(hoy, int(mt["d"])))
+        t = _quitar(t, *mt.span())
+    return fechas, horas_iso, t
+
+#=================================================================
+# API
+#=================================================================
+
+def resolver_fecha(texto: str, ahora: Optional[datetime] = None) -> Optional[Resolucion]:
+    """Fecha (y hora si la hay) de *texto*, o ``None`` si no es inequívoco.
+
+    *ahora* es la referencia para "mañana", "el jueves"…; si trae zona se
+    convierte a ``TZ_NEGOCIO``. Sin fecha explícita, la hora es de hoy.
+    """
+    if ahora is None:
+        ahora = datetime.now(TZ_NEGOCIO)
+    elif ahora.tzinfo is not None:
+        ahora = ahora.astimezone(TZ_NEGOCIO)
+    hoy = ahora.date()
+
+    t = plegar_acentos(texto)
+    fechas, horas_iso, t = _fechas(t, hoy)
+    horas, t = _horas(t)
+    horas += horas_iso
+
+    if not fechas and not horas:
+        return None
+    if len(fechas) > 1 or len(horas) > 1 or None in fechas or None in horas:
+        return None
+    if _VAGOS.search(t):
+        return None
+    return Resolucion(fechas[0] if fechas else hoy, horas[0] if horas else None)